@@ -1,226 +1,201 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from config import Config
-from models import db
-from db_utils import initialize_db, create_user, get_user_by_email, validate_user
-import random
-from quiz_data import quiz
-from sqlalchemy import inspect
+"""Application factory.
+
+Importing this module only pulls in Flask and the configuration; the ORM,
+rate limiter, question bank and views are imported by `create_app()`. Under
+gunicorn with `preload_app` (see gunicorn.conf.py) the factory and
+`initialize_shared_state()` run once in the master, so forked workers start
+with everything already loaded.
+"""
+import json
 import logging
+import multiprocessing
+import signal
+import threading
+
+import click
+from flask import Flask
+
+from config import Config
 
-# Initialize Flask App
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
-app.logger.setLevel(logging.INFO)
-
-# Initialize Extensions
-db.init_app(app)
-limiter = Limiter(get_remote_address, app=app)
-
-
-@app.before_request
-def make_session_permanent():
-    """Ensure sessions are permanent and set a suitable duration."""
-    session.permanent = True
-    app.permanent_session_lifetime = Config.SESSION_LIFETIME
-    app.logger.debug("Session set to permanent.")
-
-
-# Utility Functions
-def is_logged_in():
-    """Check if the user is logged in."""
-    logged_in = "user" in session
-    app.logger.debug(f"User logged in: {logged_in}")
-    return logged_in
-
-
-def redirect_to_login():
-    """Redirect to the login page if the user is not logged in."""
-    if not is_logged_in():
-        app.logger.warning("Unauthorized access attempt. Redirecting to login.")
-        return redirect(url_for("login"))
-
-
-@app.route("/")
-def home():
-    """Redirect to the first question after initializing quiz state."""
-    if not is_logged_in():
-        return redirect_to_login()
-    app.logger.info("Accessed home route.")
-    session["correct_answers"] = session.get("correct_answers", 0)
-    session["answered_questions"] = session.get("answered_questions", 0)
-    if "quiz_indices" not in session:
-        session["quiz_indices"] = random.sample(range(len(quiz)), len(quiz))
-        app.logger.debug("Initialized quiz state for session.")
-    return redirect(url_for("question", qid=0))
-
-
-@app.route("/login", methods=["GET", "POST"])
-@limiter.limit("10 per minute")
-def login():
-    """Handle user login."""
-    if request.method == "POST":
-        email = request.form.get("email")
-        password = request.form.get("password")
-        app.logger.info(f"Login attempt for email: {email}")
+
+def create_app(config_object=Config):
+    """Create and configure the Flask application."""
+    from models import db
+    from assets import init_assets
+    from views import bp, limiter
+    from sqlite_tuning import sqlite_engine_options, sqlite_pragmas, tune_sqlite
+    from user_repository import init_user_repository
+
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    app.permanent_session_lifetime = config_object.SESSION_LIFETIME
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **sqlite_engine_options(app.config["SQLALCHEMY_DATABASE_URI"], config_object),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    app.logger.setLevel(logging.INFO)
+
+    # Initialize Extensions
+    db.init_app(app)
+    with app.app_context():
+        if tune_sqlite(db.engine, config_object):
+            app.logger.info(f"SQLite tuned: {dict(sqlite_pragmas(config_object))}")
+    init_user_repository(app, config_object)
+    limiter.init_app(app)
+    init_assets(app)
+    app.register_blueprint(bp)
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create any missing database tables."""
+        initialize_shared_state(app)
+        click.echo("Database initialized.")
+
+    @app.cli.command("jobs")
+    @click.option("--job", default=None, help="Only show runs of this job.")
+    @click.option("--limit", default=20, show_default=True)
+    def jobs_command(job, limit):
+        """List scheduled jobs and their most recent runs."""
+        from jobs import scheduler
+        from scheduler import recent_runs
+
+        for scheduled in scheduler.jobs.values():
+            scope = "leader" if scheduled.leader_only else "every worker"
+            click.echo(f"{scheduled.name}: every {scheduled.interval}s on {scope}")
+        for run in recent_runs(limit, job):
+            click.echo(
+                f"{run.started_at:%Y-%m-%d %H:%M:%S} {run.job} {run.status} "
+                f"{run.result or run.error or ''} ({run.worker})"
+            )
+
+    @app.cli.command("run-job")
+    @click.argument("name")
+    def run_job_command(name):
+        """Run a scheduled job once, now."""
+        from jobs import scheduler
+
+        if name not in scheduler.jobs:
+            raise click.BadParameter(f"Choose from: {', '.join(scheduler.jobs)}", param_hint="NAME")
+        click.echo(scheduler.run_job(app, scheduler.jobs[name]))
+
+    @app.cli.command("enqueue")
+    @click.argument("name")
+    @click.option("--param", "params", multiple=True, metavar="KEY=VALUE", help="Task argument; JSON values are parsed.")
+    def enqueue_command(name, params):
+        """Add a deferred task to the queue."""
+        from job_queue import task_queue
+
+        if name not in task_queue.types:
+            raise click.BadParameter(f"Choose from: {', '.join(task_queue.types)}", param_hint="NAME")
+        payload = {}
+        for param in params:
+            key, _, value = param.partition("=")
+            try:
+                payload[key] = json.loads(value)
+            except ValueError:
+                payload[key] = value
         try:
-            if validate_user(email, password):
-                session["user"] = email
-                app.logger.info(f"User logged in successfully: {email}")
-                return redirect(url_for("home"))
-            app.logger.warning(f"Invalid login attempt for email: {email}")
-            flash("Invalid email or password. Please try again.", "danger")
-        except Exception as e:
-            app.logger.error(f"Login error for email {email}: {e}")
-            flash("An error occurred during login. Please try again.", "danger")
-    return render_template("login.html")
-
-
-@app.route("/register", methods=["GET", "POST"])
-def register():
-    """Handle user registration."""
-    if request.method == "POST":
-        email = request.form.get("email")
-        password = request.form.get("password")
-        confirm_password = request.form.get("confirm_password")
-        app.logger.info(f"Registration attempt for email: {email}")
+            click.echo(f"Queued task {task_queue.enqueue(name, payload)}.")
+        except TypeError as e:
+            raise click.BadParameter(str(e), param_hint="--param")
+
+    @app.cli.command("queue-status")
+    def queue_status_command():
+        """Show the number of tasks per type and status, and the oldest queued task's age."""
+        from job_queue import task_queue
+
+        for name, counts in sorted(task_queue.depth().items()):
+            click.echo(f"{name}: " + ", ".join(f"{key} {value}" for key, value in counts.items()))
+
+    @app.cli.command("queue-worker")
+    @click.option("--processes", default=1, show_default=True, help="Worker processes to run and restart.")
+    @click.option("--type", "names", multiple=True, help="Only run tasks of this type; repeat for several.")
+    def queue_worker_command(processes, names):
+        """Run deferred tasks from the queue until interrupted."""
+        from job_queue import run_worker, task_queue, worker_process
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        if processes == 1:
+            try:
+                run_worker(app, task_queue, list(names) or None, stop)
+            except KeyboardInterrupt:
+                pass
+            return
+        # Spawned, not forked: each worker builds its own app, connections and threads.
+        context = multiprocessing.get_context("spawn")
+        children = []
         try:
-            if not email or not password or not confirm_password:
-                app.logger.warning("Registration failed: Missing fields.")
-                flash("All fields are required. Please try again.", "danger")
-                return redirect(url_for("register"))
-            if password != confirm_password:
-                app.logger.warning("Registration failed: Passwords do not match.")
-                flash("Passwords do not match. Please try again.", "danger")
-                return redirect(url_for("register"))
-            if get_user_by_email(email):
-                app.logger.warning(
-                    f"Registration failed: Email already registered ({email})."
-                )
-                flash("Email already registered. Please log in.", "danger")
-                return redirect(url_for("login"))
-
-            create_user(email, password)
-            app.logger.info(f"User registered successfully: {email}")
-            flash("Registration successful! You can now log in.", "success")
-            return redirect(url_for("login"))
-        except Exception as e:
-            app.logger.error(f"Registration error for email {email}: {e}")
-            flash("An error occurred during registration. Please try again.", "danger")
-    return render_template("register.html")
-
-
-@app.route("/question/<int:qid>")
-def question(qid):
-    """Display the quiz question."""
-    if not is_logged_in():
-        return redirect_to_login()
-
-    # Retrieve the quiz indices from the session
-    quiz_indices = session.get("quiz_indices", [])
-    if not (0 <= qid < len(quiz_indices)):
-        # Redirect to the finish page if the question ID is invalid
-        return redirect(url_for("finish"))
-
-    question_index = quiz_indices[qid]
-    current_question = quiz[question_index]
-
-    # Log debugging information
-    app.logger.debug(f"Rendering question {qid}: {current_question}")
-
-    # Render the quiz question
-    return render_template(
-        "quiz.html",
-        quiz=current_question,
-        qid=qid,  # Ensure qid is passed to the template
-        total=len(quiz_indices),
-        correct=session.get("correct_answers", 0),
-        question_number=qid + 1,
-        question_id=question_index,
-    )
+            while not stop.is_set():
+                for child in children:
+                    if not child.is_alive() and child.exitcode:
+                        app.logger.warning(f"Queue worker {child.pid} exited with {child.exitcode}; restarting.")
+                children = [child for child in children if child.is_alive()]
+                while len(children) < processes:
+                    child = context.Process(target=worker_process, args=(list(names) or None,), daemon=False)
+                    child.start()
+                    children.append(child)
+                stop.wait(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for child in children:
+                child.terminate()
+            for child in children:
+                child.join(Config.QUEUE_TASK_TIMEOUT)
+
+    return app
+
+
+def initialize_shared_state(app):
+    """Prepare state shared by all workers: tables, the password work factor and default banks."""
+    from db_utils import initialize_db
+    from banks import TENANTS, get_bank
+    from passwords import calibrate
 
-@app.route("/submit/<int:qid>", methods=["POST"])
-def submit(qid):
-    """Handle the answer submission."""
-    if not is_logged_in():
-        return redirect_to_login()
-
-    # Retrieve the quiz indices from the session
-    quiz_indices = session.get("quiz_indices", [])
-    if not (0 <= qid < len(quiz_indices)):
-        # Redirect to the finish page if the question ID is invalid
-        return redirect(url_for("finish"))
-
-    question_index = quiz_indices[qid]
-    current_question = quiz[question_index]
-
-    # Retrieve the user's answer
-    user_answer = request.form.get("answer")
-    if not user_answer:
-        flash("No answer selected. Please try again.", "warning")
-        return redirect(url_for("question", qid=qid))
-
-    # Update session data
-    session["answered_questions"] += 1
-    if user_answer == current_question["answer"]:
-        session["correct_answers"] += 1
-
-    # Render the result
-    user_answer_text = current_question["options"].get(user_answer, "No answer selected")
-    correct_answer_text = current_question["options"][current_question["answer"]]
-    return render_template(
-        "result.html",
-        correct=(user_answer == current_question["answer"]),
-        quiz=current_question,
-        user_answer=user_answer,
-        user_answer_text=user_answer_text,
-        correct_answer_text=correct_answer_text,
-        next_qid=qid + 1,
-        is_last=(qid + 1 >= len(quiz_indices)),
-        correct_count=session["correct_answers"],
-        total=len(quiz_indices),
+    initialize_db(app)
+    factor = calibrate()
+    app.logger.info(
+        f"Password hashing: {app.config['PASSWORD_SCHEME']} work factor {factor} "
+        f"for a {app.config['PASSWORD_HASH_TARGET_MS']} ms target."
     )
+    for tenant in TENANTS:
+        bank = get_bank(tenant=tenant)
+        app.logger.info(f"Loaded {len(bank)} questions from bank {bank.key} ({bank.version}) for {tenant}.")
 
 
-@app.route("/logout")
-def logout():
-    """Handle user logout."""
-    user = session.pop("user", None)
-    app.logger.info(f"User logged out: {user}")
-    flash("You have been logged out successfully.", "success")
-    return redirect(url_for("login"))
-
-
-@app.route("/finish")
-def finish():
-    """Display the quiz completion summary."""
-    if not is_logged_in():
-        return redirect_to_login()
-    correct_answers = session.get("correct_answers", 0)
-    answered_questions = session.get("answered_questions", 0)
-    score_percentage = (
-        round((correct_answers / answered_questions) * 100, 0)
-        if answered_questions
-        else 0
-    )
-    app.logger.info(
-        f"Quiz finished. Score: {score_percentage}% ({correct_answers}/{answered_questions})"
-    )
-    return render_template(
-        "finish.html",
-        answered=answered_questions,
-        correct=correct_answers,
-        percentage=score_percentage,
-    )
+def start_background_tasks(app):
+    """Start the per-process threads: the job scheduler, bank reloads and the pub/sub relay."""
+    from banks import start_bank_watcher
+    from exams import pinned_bank_versions
+    from jobs import scheduler
+    from pubsub import start_relay
+
+    if app.config["PROCTOR_RELAY"]:
+        start_relay(app)
+    if app.config["SCHEDULER_ENABLED"]:
+        scheduler.start(app)
+    if app.config["BANK_RELOAD_INTERVAL"] > 0:
+        start_bank_watcher(app, pinned_bank_versions)
+
+
+def __getattr__(name):
+    # Keep `app:app` and `from app import app` working without building the
+    # application as a side effect of importing this module.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Run Application
 if __name__ == "__main__":
-    # Initialize the database
-    initialize_db(app)
+    app = create_app()
+    initialize_shared_state(app)
+    start_background_tasks(app)
     app.logger.info("Starting the Flask application.")
     app.run(debug=True)
@@ -0,0 +1,49 @@
+"""ASGI entry point.
+
+Serve with an ASGI server, for example:
+
+    uvicorn asgi:asgi_app --workers 2
+
+asgiref's WsgiToAsgi runs every request of a worker on one shared thread,
+so a slow request holds up all the others. Here each request runs on a pool
+of SERVING_THREADS threads instead, like gunicorn's gthread workers. The
+async login and register views still occupy their thread while they await
+bcrypt; the pool size, not the event loop, bounds concurrent requests.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import create_app, initialize_shared_state, start_background_tasks
+from config import Config
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """A WsgiToAsgi request run on the worker's request thread pool."""
+
+    executor = None
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.run_wsgi_app.__wrapped__
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """Serve a WSGI app over ASGI with up to `threads` requests running at once."""
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-request")
+
+    async def __call__(self, scope, receive, send):
+        instance = ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)
+        instance.executor = self.executor
+        await instance(scope, receive, send)
+
+
+# uvicorn has no preload hook, so each worker prepares its own state.
+app = create_app()
+initialize_shared_state(app)
+start_background_tasks(app)
+asgi_app = ThreadPoolWsgiToAsgi(app, Config.SERVING_THREADS)
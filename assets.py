@@ -0,0 +1,109 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from flask import request, send_from_directory, url_for
+from flask.sessions import SecureCookieSessionInterface
+
+from build_static import DIST_DIR, MANIFEST_NAME
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRECOMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+_WHITESPACE_RUN = re.compile(rb"\s*\n\s*")
+
+_manifest = {}
+
+
+class AssetSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions that are left untouched on static file responses.
+
+    Saving the permanent session adds Set-Cookie and Vary: Cookie, which
+    would stop browsers and proxies from caching the files.
+    """
+
+    def save_session(self, app, session, response):
+        if request.endpoint in ("static", "asset"):
+            return
+        super().save_session(app, session, response)
+
+
+def load_manifest(dist_dir=DIST_DIR):
+    """Load the fingerprint manifest written by build_static.py, if present."""
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(filename):
+    """Return the fingerprinted URL of a static file, or its plain URL if unbuilt."""
+    hashed = _manifest.get(filename)
+    if hashed is None:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=hashed)
+
+
+def accepts_encoding(encoding):
+    """Check whether the client accepts a content encoding."""
+    return request.accept_encodings.quality(encoding) > 0
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, preferring a precompressed variant."""
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        if accepts_encoding(encoding) and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+    # The name changes whenever the content does, so the file never needs revalidating.
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def compress_response(response):
+    """Strip indentation from rendered HTML and compress it when the client allows."""
+    if (
+        response.mimetype != "text/html"
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    body = _WHITESPACE_RUN.sub(b"\n", response.get_data())
+    response.vary.add("Accept-Encoding")
+    if len(body) >= Config.COMPRESS_MIN_SIZE:
+        if brotli is not None and accepts_encoding("br"):
+            # Low quality keeps on-the-fly brotli cheaper than gzip -9 with a better ratio.
+            body = brotli.compress(body, quality=5)
+            response.headers["Content-Encoding"] = "br"
+        elif accepts_encoding("gzip"):
+            body = gzip.compress(body, compresslevel=Config.COMPRESS_LEVEL)
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_data(body)
+    return response
+
+
+def init_assets(app):
+    """Register the fingerprinted asset route, template helper and HTML compression."""
+    _manifest.clear()
+    _manifest.update(load_manifest())
+    if not _manifest:
+        app.logger.info("No static manifest found; run build_static.py to fingerprint assets.")
+    app.session_interface = AssetSessionInterface()
+    app.add_template_global(asset_url)
+    app.add_url_rule("/assets/<path:filename>", "asset", serve_asset)
+    app.after_request(compress_response)
@@ -0,0 +1,351 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import runpy
+import sys
+import threading
+from collections import OrderedDict
+
+from blueprints import area_pools, domain_pools, question_areas
+from config import Config
+from tenants import current_tenant, parse_tenants
+
+
+def question_id(question):
+    """Return a question's stable ID: its explicit "id", or a hash of its stem, options and key.
+
+    Whitespace is normalized and the explanation and tags are left out, so
+    reformatting or rewording an explanation keeps the ID. Give a question an
+    explicit "id" to keep its history across a deliberate rewording.
+    """
+    if question.get("id"):
+        return str(question["id"])
+    content = {
+        "question": " ".join(question["question"].split()),
+        "options": {letter: " ".join(text.split()) for letter, text in question["options"].items()},
+        "answer": question["answer"],
+    }
+    return hashlib.blake2b(json.dumps(content, sort_keys=True).encode("utf-8"), digest_size=6).hexdigest()
+
+
+def unique_ids(key, ids):
+    """Suffix repeated IDs of identical questions with "-2", "-3"... in bank order."""
+    seen = {}
+    unique = []
+    for qid in ids:
+        seen[qid] = seen.get(qid, 0) + 1
+        unique.append(qid if seen[qid] == 1 else f"{qid}-{seen[qid]}")
+    repeated = sorted(qid for qid, count in seen.items() if count > 1)
+    if repeated:
+        logging.getLogger(__name__).warning(
+            f"Bank {key} repeats the questions {', '.join(repeated)}; remove the copies or give them an \"id\"."
+        )
+    return tuple(unique)
+
+
+class Bank:
+    """An immutable, loaded question bank for one credential level and locale.
+
+    Questions are stored by position, which only holds within one version;
+    `ids` and `positions` translate to and from IDs that survive bank edits.
+    """
+
+    def __init__(self, key, version, questions):
+        self.key = key
+        self.version = version
+        self.questions = tuple(questions)
+        self.ids = unique_ids(key, [question_id(question) for question in self.questions])
+        self.positions = {qid: index for index, qid in enumerate(self.ids)}
+        self.pools = domain_pools(self.questions)
+        self.areas = tuple(question_areas(question) for question in self.questions)
+        self.area_pools = area_pools(self.areas)
+        self.approx_bytes = estimate_size(self.questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index):
+        return self.questions[index]
+
+    def by_id(self, qid):
+        """Return the question with a stable ID; raises KeyError if this version lacks it."""
+        return self.questions[self.positions[qid]]
+
+
+def estimate_size(questions):
+    """Roughly estimate the memory held by a list of question dicts."""
+    total = sys.getsizeof(questions)
+    for question in questions:
+        total += sys.getsizeof(question)
+        for value in question.values():
+            if isinstance(value, dict):
+                total += sys.getsizeof(value) + sum(sys.getsizeof(text) for text in value.values())
+            else:
+                total += sys.getsizeof(value)
+    return total
+
+
+def parse_bank_sources(spec):
+    """Parse "ACC/en=quiz_data,PCC/en=banks_pcc_en" into {key: module name}."""
+    sources = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            key, module_name = entry.split("=", 1)
+            sources[key.strip()] = module_name.strip()
+    return sources
+
+
+def source_path(module_name):
+    """Locate a bank module's file without importing it."""
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or not spec.origin:
+        raise LookupError(f"Question bank module not found: {module_name}")
+    return spec.origin
+
+
+def load_bank(key, module_name):
+    """Read a bank module's `quiz` list, versioned by the hash of its source."""
+    path = source_path(module_name)
+    with open(path, "rb") as file:
+        version = hashlib.sha256(file.read()).hexdigest()[:12]
+    # run_path keeps the module out of sys.modules, so evicting the bank frees it.
+    questions = runpy.run_path(path)["quiz"]
+    return Bank(key, version, questions)
+
+
+def snapshot_path(snapshot_dir, key, version):
+    return os.path.join(snapshot_dir, key.replace("/", "_"), f"{version}.json")
+
+
+def write_snapshot(snapshot_dir, bank):
+    """Save a bank version so sessions pinned to it survive later edits."""
+    path = snapshot_path(snapshot_dir, bank.key, bank.version)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(list(bank.questions), file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def metadata_path(snapshot_dir, key, version, name):
+    return os.path.join(snapshot_dir, key.replace("/", "_"), f"{version}.{name}.json")
+
+
+def write_metadata(snapshot_dir, key, version, name, data):
+    """Save data computed for one bank version, such as item parameters, beside its snapshot."""
+    path = metadata_path(snapshot_dir, key, version, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(temporary, path)
+    return path
+
+
+def read_metadata(snapshot_dir, key, version, name):
+    """Load metadata saved for a bank version, or return None if there is none."""
+    try:
+        with open(metadata_path(snapshot_dir, key, version, name), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def read_snapshot(snapshot_dir, key, version):
+    """Load a saved bank version, or return None if it was never snapshotted."""
+    try:
+        with open(snapshot_path(snapshot_dir, key, version), encoding="utf-8") as file:
+            return Bank(key, version, json.load(file))
+    except FileNotFoundError:
+        return None
+
+
+class BankRegistry:
+    """Loads banks on first use, shares them process-wide and evicts the least
+    recently used ones once their estimated size exceeds the memory budget.
+
+    Every bank key has a current version that new sessions start on. When the
+    source changes, `check_for_updates()` builds the new version and swaps it
+    in; sessions that pass the version they started on keep getting it.
+    """
+
+    def __init__(self, sources, memory_budget, snapshot_dir):
+        self.memory_budget = memory_budget
+        self.snapshot_dir = snapshot_dir
+        self._sources = dict(sources)
+        self._current = {}
+        self._source_stats = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {key: threading.Lock() for key in self._sources}
+
+    def keys(self):
+        return list(self._sources)
+
+    def __contains__(self, key):
+        return key in self._sources
+
+    def get(self, key, version=None):
+        """Return a bank version, the current one if none is given.
+
+        Raises KeyError for unknown banks. A version that can no longer be
+        found falls back to the current one.
+        """
+        if key not in self._sources:
+            raise KeyError(f"Unknown question bank: {key}")
+        bank = self._lookup(key, version)
+        if bank is not None:
+            return bank
+
+        # One loader per bank; concurrent requests for it wait for that load.
+        with self._load_locks[key]:
+            bank = self._lookup(key, version)
+            if bank is not None:
+                return bank
+            if version is not None:
+                bank = read_snapshot(self.snapshot_dir, key, version)
+                if bank is not None:
+                    self._register(bank)
+                    return bank
+            current = self._lookup(key, None) or self._load_source(key)
+        if version is not None and version != current.version:
+            logging.getLogger(__name__).warning(
+                f"Bank {key} version {version} is gone; using {current.version}."
+            )
+        return current
+
+    def check_for_updates(self):
+        """Reload banks whose source changed and make the new versions current."""
+        swapped = []
+        for key in self.keys():
+            if key not in self._current:
+                continue  # Never used here; it will load fresh on first use.
+            try:
+                stat = os.stat(source_path(self._sources[key]))
+            except (LookupError, OSError):
+                continue
+            if self._source_stats.get(key) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            with self._load_locks[key]:
+                previous = self._current.get(key)
+                bank = self._load_source(key)
+            if bank.version != previous:
+                swapped.append(bank)
+        return swapped
+
+    def release_unused(self, pinned_versions):
+        """Drop old versions from memory that no running session is pinned to.
+
+        `pinned_versions` is a set of (key, version) pairs still in use; the
+        current version of each bank is always kept. Snapshots stay on disk,
+        so a version released too eagerly can still be reloaded.
+        """
+        with self._lock:
+            current = set(self._current.items())
+            stale = [
+                bank_id for bank_id in self._loaded
+                if bank_id not in current and bank_id not in pinned_versions
+            ]
+            for bank_id in stale:
+                del self._loaded[bank_id]
+        return len(stale)
+
+    def loaded(self):
+        """Return the currently loaded bank versions, least recently used first."""
+        with self._lock:
+            return list(self._loaded.values())
+
+    def _lookup(self, key, version):
+        with self._lock:
+            version = version or self._current.get(key)
+            bank = self._loaded.get((key, version))
+            if bank is not None:
+                self._loaded.move_to_end((key, version))
+            return bank
+
+    def _load_source(self, key):
+        # Stat before reading so a write during the load is picked up next check.
+        stat = os.stat(source_path(self._sources[key]))
+        bank = load_bank(key, self._sources[key])
+        write_snapshot(self.snapshot_dir, bank)
+        with self._lock:
+            self._loaded[(key, bank.version)] = bank
+            self._current[key] = bank.version
+            self._source_stats[key] = (stat.st_mtime_ns, stat.st_size)
+            self._evict(keep=(key, bank.version))
+        return bank
+
+    def _register(self, bank):
+        with self._lock:
+            self._loaded[(bank.key, bank.version)] = bank
+            self._evict(keep=(bank.key, bank.version))
+
+    def _evict(self, keep):
+        total = sum(bank.approx_bytes for bank in self._loaded.values())
+        current = set(self._current.items())
+        # Old versions go first: they can be reloaded from their snapshot.
+        candidates = [bank_id for bank_id in self._loaded if bank_id not in current]
+        candidates += [bank_id for bank_id in self._loaded if bank_id in current]
+        for bank_id in candidates:
+            if total <= self.memory_budget:
+                break
+            if bank_id != keep:
+                total -= self._loaded.pop(bank_id).approx_bytes
+
+
+SOURCES = parse_bank_sources(Config.QUESTION_BANKS)
+TENANTS = parse_tenants(Config.TENANTS, list(SOURCES), Config.BANK_MEMORY_BUDGET_MB)
+
+# One registry per tenant, each with its own quota, LRU order and load locks, so
+# a large bank loading or evicting in one organization never touches another's.
+registries = {
+    name: BankRegistry(
+        {key: SOURCES[key] for key in tenant.bank_keys},
+        tenant.memory_budget_mb * 1024 * 1024,
+        Config.BANK_SNAPSHOT_DIR,
+    )
+    for name, tenant in TENANTS.items()
+}
+
+
+def get_registry(tenant=None):
+    """Return a tenant's bank registry, the current request's tenant if none is given."""
+    return registries[tenant or current_tenant()]
+
+
+def get_bank(key=None, version=None, tenant=None):
+    """Return a loaded bank from a tenant's registry, the tenant's default if no key."""
+    tenant = tenant or current_tenant()
+    return registries[tenant].get(key or TENANTS[tenant].default_bank, version)
+
+
+def start_bank_watcher(app, pinned_versions, interval=None):
+    """Poll bank sources in a daemon thread and hot-swap changed banks.
+
+    `pinned_versions` is called in an app context and returns the (key,
+    version) pairs running sessions still use; other old versions are freed.
+    """
+    interval = interval or Config.BANK_RELOAD_INTERVAL
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                for tenant, registry in registries.items():
+                    for bank in registry.check_for_updates():
+                        app.logger.info(f"Question bank {bank.key} of {tenant} reloaded as version {bank.version}.")
+                with app.app_context():
+                    pinned = pinned_versions()
+                released = sum(registry.release_unused(pinned) for registry in registries.values())
+                if released:
+                    app.logger.info(f"Released {released} unused question bank versions.")
+            except Exception as e:
+                app.logger.error(f"Question bank reload error: {e}")
+
+    thread = threading.Thread(target=run, name="bank-watcher", daemon=True)
+    thread.start()
+    return stop
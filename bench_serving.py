@@ -0,0 +1,146 @@
+"""Compare the threaded gunicorn setup with the ASGI serving mode.
+
+Both servers run the same number of worker processes, each with
+SERVING_THREADS request threads, so their memory is comparable, and the
+resident memory of each server is reported alongside throughput. Half of the clients post wrong passwords to /login, which costs
+a full bcrypt check, while the other half load the login page, so the
+report shows how well cheap pages are served during a login storm.
+
+    python bench_serving.py --workers 2 --clients 32 --duration 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+MODES = {
+    "gthread": "gunicorn -c gunicorn.conf.py --workers {workers} --bind 127.0.0.1:{port} app:create_app()",
+    "asgi": "uvicorn asgi:asgi_app --workers {workers} --host 127.0.0.1 --port {port}",
+}
+LOGIN_FORM = urllib.parse.urlencode({"email": "user@user.com", "password": "wrong-password"}).encode()
+
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/login", timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s.")
+
+
+def resident_memory_kb(pid):
+    """Sum VmRSS of a process and its direct children, read from /proc."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            pids += [int(child) for child in file.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for process_id in pids:
+        try:
+            with open(f"/proc/{process_id}/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def run_clients(base_url, clients, duration):
+    latencies = {"login": [], "page": []}
+    errors = {"login": 0, "page": 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(kind):
+        while time.monotonic() < stop_at:
+            if kind == "login":
+                request = urllib.request.Request(f"{base_url}/login", data=LOGIN_FORM)
+            else:
+                request = urllib.request.Request(f"{base_url}/login")
+            started = time.monotonic()
+            try:
+                urllib.request.urlopen(request, timeout=30).read()
+                failed = False
+            except (urllib.error.URLError, ConnectionError):
+                failed = True
+            elapsed = time.monotonic() - started
+            with lock:
+                if failed:
+                    errors[kind] += 1
+                else:
+                    latencies[kind].append(elapsed)
+
+    threads = [
+        threading.Thread(target=client, args=("login" if i % 2 == 0 else "page",))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100)[int(fraction * 100) - 1] if len(values) > 1 else values[0]
+
+
+def bench_mode(mode, args):
+    port = args.port
+    command = MODES[mode].format(workers=args.workers, port=port).split()
+    env = dict(
+        os.environ,
+        RATELIMIT_ENABLED="false",
+        LOGIN_SHIELD_ENABLED="false",
+        SCHEDULER_ENABLED="false",
+        SECRET_KEY="bench",
+        FLASK_ENV="development",
+    )
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url)
+        latencies, errors = run_clients(base_url, args.clients, args.duration)
+        memory_mb = resident_memory_kb(server.pid) / 1024
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(f"{mode}: {args.workers} workers, {memory_mb:.0f} MB resident")
+    for kind in ("login", "page"):
+        values = latencies[kind]
+        print(
+            f"  {kind:5} {len(values) / args.duration:8.1f} req/s"
+            f"  p50 {percentile(values, 0.5) * 1000:7.1f} ms"
+            f"  p99 {percentile(values, 0.99) * 1000:7.1f} ms"
+            f"  errors {errors[kind]}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["gthread", "asgi"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=int, default=20, help="Seconds of load per mode")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    for mode in args.modes:
+        bench_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Compare concurrent login and submit throughput on SQLite, tuned and untuned.
+
+Each mode serves a fresh database file from gunicorn's threaded workers.
+Every client registers its own account first. Then half of the clients log
+in over and over, which reads the user row, while the other half answer
+practice questions, which write attempts and mastery. Passwords are hashed
+at the lowest bcrypt cost so the database, not the hash, sets the pace.
+Errors are mostly requests that failed with "database is locked".
+
+    python bench_sqlite.py --workers 2 --threads 8 --clients 32 --duration 20
+"""
+import argparse
+import http.cookiejar
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from bench_serving import percentile, wait_until_ready
+
+MODES = {"default": "false", "tuned": "true"}
+COMMAND = "gunicorn -c gunicorn.conf.py --workers {workers} --threads {threads} --bind 127.0.0.1:{port} app:create_app()"
+PASSWORD = "bench-password"
+
+
+class InsecureCookiePolicy(http.cookiejar.DefaultCookiePolicy):
+    """Send the app's Secure session cookie over the benchmark's plain HTTP."""
+
+    def return_ok_secure(self, cookie, request):
+        return True
+
+
+def open_session():
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(
+        http.cookiejar.CookieJar(policy=InsecureCookiePolicy())
+    ))
+
+
+def post(opener, url, fields):
+    return opener.open(url, data=urllib.parse.urlencode(fields).encode(), timeout=30)
+
+
+def sign_in(opener, base_url, email):
+    post(opener, f"{base_url}/register", {"email": email, "password": PASSWORD, "confirm_password": PASSWORD}).read()
+    response = post(opener, f"{base_url}/login", {"email": email, "password": PASSWORD})
+    response.read()
+    if "/login" in response.geturl():
+        raise RuntimeError(f"Could not log in as {email}.")
+
+
+def run_clients(base_url, clients, duration):
+    latencies = {"login": [], "submit": []}
+    errors = {"login": 0, "submit": 0}
+    lock = threading.Lock()
+    stop_at = []
+    # The clock starts once every client has signed in.
+    ready = threading.Barrier(clients + 1, action=lambda: stop_at.append(time.monotonic() + duration))
+
+    def client(number, kind):
+        opener = open_session()
+        email = f"bench{number}@example.com"
+        try:
+            sign_in(opener, base_url, email)
+            if kind == "submit":
+                opener.open(f"{base_url}/", timeout=30).read()
+        finally:
+            ready.wait()
+        position = 0
+        while time.monotonic() < stop_at[0]:
+            started = time.monotonic()
+            try:
+                if kind == "login":
+                    post(opener, f"{base_url}/login", {"email": email, "password": PASSWORD}).read()
+                else:
+                    response = post(opener, f"{base_url}/submit/{position}", {"answer": "A"})
+                    response.read()
+                    position += 1
+                    if "/finish" in response.geturl():
+                        # End of the session: start the next one.
+                        opener.open(f"{base_url}/", timeout=30).read()
+                        position = 0
+                failed = False
+            except (urllib.error.URLError, ConnectionError):
+                failed = True
+            elapsed = time.monotonic() - started
+            with lock:
+                if failed:
+                    errors[kind] += 1
+                else:
+                    latencies[kind].append(elapsed)
+
+    threads = [
+        threading.Thread(target=client, args=(i, "login" if i % 2 == 0 else "submit"))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def bench_mode(mode, args, directory):
+    command = COMMAND.format(workers=args.workers, threads=args.threads, port=args.port).split()
+    env = dict(
+        os.environ,
+        FLASK_ENV="production",
+        DATABASE_URL=f"sqlite:///{os.path.join(directory, f'{mode}.db')}",
+        SQLITE_TUNED=MODES[mode],
+        PASSWORD_WORK_FACTOR="4",
+        RATELIMIT_ENABLED="false",
+        LOGIN_SHIELD_ENABLED="false",
+        SCHEDULER_ENABLED="false",
+        SECRET_KEY="bench",
+    )
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(base_url)
+        latencies, errors = run_clients(base_url, args.clients, args.duration)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(f"{mode}: {args.workers} workers x {args.threads} threads")
+    for kind in ("login", "submit"):
+        values = latencies[kind]
+        print(
+            f"  {kind:6} {len(values) / args.duration:8.1f} req/s"
+            f"  p50 {percentile(values, 0.5) * 1000:7.1f} ms"
+            f"  p99 {percentile(values, 0.99) * 1000:7.1f} ms"
+            f"  errors {errors[kind]}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["default", "tuned"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=int, default=20, help="Seconds of load per mode")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            bench_mode(mode, args, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measure application startup cost.
+
+Each phase runs in a fresh interpreter so nothing is cached between runs:
+
+* import: `import app`, which should only load Flask and the configuration
+* create_app: building the application, including the deferred imports
+* first request: rendering the login page once
+
+It then times how long gunicorn takes to answer its first request with and
+without preloading the application in the master.
+
+    python bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+PHASES_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+application.test_client().get("/login")
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first request": served - created,
+}))
+"""
+
+GUNICORN_MODES = {
+    "no preload": "gunicorn --workers {workers} --bind 127.0.0.1:{port} app:create_app()",
+    "preload": "gunicorn -c gunicorn.conf.py --workers {workers} --bind 127.0.0.1:{port} app:create_app()",
+}
+
+
+def measure_phases(runs):
+    samples = {}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PHASES_SCRIPT],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        for phase, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            samples.setdefault(phase, []).append(seconds)
+    return samples
+
+
+def measure_gunicorn(command, port, timeout=60):
+    started = time.perf_counter()
+    server = subprocess.Popen(command.split(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1).read()
+                return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise RuntimeError(f"gunicorn did not answer within {timeout}s.")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--skip-gunicorn", action="store_true")
+    args = parser.parse_args()
+    os.environ.setdefault("SECRET_KEY", "bench")
+
+    for phase, values in measure_phases(args.runs).items():
+        print(
+            f"{phase:14} median {statistics.median(values) * 1000:7.1f} ms"
+            f"  min {min(values) * 1000:7.1f} ms"
+        )
+    if args.skip_gunicorn:
+        return
+    for mode, template in GUNICORN_MODES.items():
+        command = template.format(workers=args.workers, port=args.port)
+        values = [measure_gunicorn(command, args.port) for _ in range(max(args.runs // 2, 1))]
+        print(f"gunicorn {mode:10} first response median {statistics.median(values) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
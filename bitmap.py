@@ -0,0 +1,15 @@
+def new_bitmap(size):
+    """Return an all-clear bitmap with room for `size` positions, one bit each."""
+    return bytes((size + 7) // 8)
+
+
+def has_bit(bitmap, position):
+    """Check a position in O(1)."""
+    return bool(bitmap[position >> 3] & (1 << (position & 7)))
+
+
+def set_bit(bitmap, position):
+    """Return a copy of the bitmap with a position set."""
+    updated = bytearray(bitmap)
+    updated[position >> 3] |= 1 << (position & 7)
+    return bytes(updated)
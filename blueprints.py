@@ -0,0 +1,164 @@
+import random
+import re
+
+from config import Config
+
+# The four domains of the ICF Core Competencies and the competencies in each.
+DOMAIN_COMPETENCIES = {
+    "foundation": (1, 2),
+    "relationship": (3, 4, 5),
+    "communication": (6, 7),
+    "growth": (8,),
+}
+COMPETENCY_DOMAINS = {
+    competency: domain
+    for domain, competencies in DOMAIN_COMPETENCIES.items()
+    for competency in competencies
+}
+# Ethics and scope-of-practice questions belong to Demonstrates Ethical Practice.
+DEFAULT_DOMAIN = "foundation"
+
+COMPETENCY_PATTERN = re.compile(r"Competency (\d)")
+
+# Finer-grained study areas: each competency plus the ethics references.
+AREAS = {
+    "competency-1": "Demonstrates Ethical Practice",
+    "competency-2": "Embodies a Coaching Mindset",
+    "competency-3": "Establishes and Maintains Agreements",
+    "competency-4": "Cultivates Trust and Safety",
+    "competency-5": "Maintains Presence",
+    "competency-6": "Listens Actively",
+    "competency-7": "Evokes Awareness",
+    "competency-8": "Facilitates Client Growth",
+    "code-of-ethics": "ICF Code of Ethics",
+    "referral": "Referring a Client to Therapy",
+}
+AREA_REFERENCES = {
+    "code-of-ethics": "Code of Ethics",
+    "referral": "Referring a Client to Therapy",
+}
+
+
+class Blueprint:
+    """The number of questions in a session and the weight of each domain."""
+
+    def __init__(self, name, question_count, weights):
+        self.name = name
+        self.question_count = question_count
+        self.weights = dict(weights)
+
+
+def parse_blueprints(spec):
+    """Parse "exam=81/foundation:27,growth:22;practice=60/..." into {name: Blueprint}."""
+    blueprints = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        name, rest = entry.split("=", 1)
+        count, weights = rest.split("/", 1)
+        parsed = {}
+        for weight in weights.split(","):
+            domain, value = weight.split(":", 1)
+            if domain.strip() not in DOMAIN_COMPETENCIES:
+                raise ValueError(f"Unknown domain in blueprint {name.strip()}: {domain.strip()}")
+            parsed[domain.strip()] = float(value)
+        blueprints[name.strip()] = Blueprint(name.strip(), int(count), parsed)
+    return blueprints
+
+
+BLUEPRINTS = parse_blueprints(Config.BLUEPRINTS)
+
+
+def question_domain(question):
+    """Return a question's domain, from its `domain` key or the competency it cites."""
+    if question.get("domain") in DOMAIN_COMPETENCIES:
+        return question["domain"]
+    match = COMPETENCY_PATTERN.search(question.get("explanation", ""))
+    if match:
+        return COMPETENCY_DOMAINS.get(int(match.group(1)), DEFAULT_DOMAIN)
+    return DEFAULT_DOMAIN
+
+
+def question_areas(question):
+    """Return the study areas a question's explanation references, most specific first."""
+    explanation = question.get("explanation", "")
+    areas = [f"competency-{number}" for number in dict.fromkeys(COMPETENCY_PATTERN.findall(explanation))]
+    areas += [area for area, reference in AREA_REFERENCES.items() if reference in explanation]
+    return tuple(area for area in areas if area in AREAS)
+
+
+def area_pools(question_areas_by_index):
+    """Group question indices by their first study area."""
+    pools = {area: [] for area in AREAS}
+    for index, areas in enumerate(question_areas_by_index):
+        if areas:
+            pools[areas[0]].append(index)
+    return {area: tuple(indices) for area, indices in pools.items()}
+
+
+def domain_pools(questions):
+    """Group question indices by domain; computed once when a bank is loaded."""
+    pools = {domain: [] for domain in DOMAIN_COMPETENCIES}
+    for index, question in enumerate(questions):
+        pools[question_domain(question)].append(index)
+    return {domain: tuple(indices) for domain, indices in pools.items()}
+
+
+def allocate(question_count, weights, pool_sizes):
+    """Split a question count across domains in proportion to their weights.
+
+    Uses largest remainders, and hands the share of a domain whose pool is
+    too small to the remaining domains.
+    """
+    quotas = {domain: 0 for domain in weights}
+    open_domains = {domain for domain, weight in weights.items() if weight > 0 and pool_sizes.get(domain)}
+    remaining = question_count
+    while remaining > 0 and open_domains:
+        total = sum(weights[domain] for domain in open_domains)
+        shares = {domain: remaining * weights[domain] / total for domain in open_domains}
+        granted = {domain: int(share) for domain, share in shares.items()}
+        leftover = remaining - sum(granted.values())
+        for domain in sorted(open_domains, key=lambda d: shares[d] - granted[d], reverse=True)[:leftover]:
+            granted[domain] += 1
+        remaining = 0
+        for domain in list(open_domains):
+            room = pool_sizes[domain] - quotas[domain]
+            take = min(granted[domain], room)
+            quotas[domain] += take
+            remaining += granted[domain] - take
+            if take == room:
+                open_domains.discard(domain)
+    return quotas
+
+
+def sample(pool, k, rng=random):
+    """Pick k distinct items from a sequence in O(k), using a sparse Fisher-Yates shuffle."""
+    swapped = {}
+    picked = []
+    for i in range(k):
+        j = rng.randrange(i, len(pool))
+        picked.append(pool[swapped.get(j, j)])
+        swapped[j] = swapped.get(i, i)
+    return picked
+
+
+def draw_questions(bank, blueprint_name=None, question_count=None, rng=random):
+    """Choose question indices for a new session.
+
+    With a blueprint, each domain contributes its weighted share, drawn from
+    the bank's precomputed pools, so the cost grows with the session length
+    rather than the bank size. Without one, questions are drawn uniformly.
+    """
+    blueprint = BLUEPRINTS.get(blueprint_name) if blueprint_name else None
+    if blueprint is None:
+        question_count = min(question_count or len(bank), len(bank))
+        return sample(range(len(bank)), question_count, rng)
+
+    pool_sizes = {domain: len(pool) for domain, pool in bank.pools.items()}
+    quotas = allocate(min(blueprint.question_count, len(bank)), blueprint.weights, pool_sizes)
+    indices = []
+    for domain, quota in quotas.items():
+        indices.extend(sample(bank.pools[domain], quota, rng))
+    # Interleave the domains; this shuffles the session, not the bank.
+    rng.shuffle(indices)
+    return indices
@@ -0,0 +1,66 @@
+"""Fingerprint and precompress static assets.
+
+Copies every file under static/ to static/dist/ with a content hash in its
+name, writes gzip (and brotli, when the `brotli` package is installed)
+variants next to it and records the mapping in static/dist/manifest.json.
+Run it as part of each deploy:
+
+    python build_static.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+
+
+def fingerprint(path):
+    """Return the first 12 hex digits of the file's SHA-256."""
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:12]
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Rebuild the dist directory and return the manifest it wrote."""
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [name for name in dirs if os.path.join(root, name) != dist_dir]
+        for name in files:
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            stem, extension = os.path.splitext(logical)
+            hashed = f"{stem}.{fingerprint(source)}{extension}"
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                with open(source, "rb") as file:
+                    content = file.read()
+                with open(f"{target}.gz", "wb") as file:
+                    file.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(f"{target}.br", "wb") as file:
+                        file.write(brotli.compress(content))
+            manifest[logical] = hashed
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+if __name__ == "__main__":
+    for logical, hashed in sorted(build().items()):
+        print(f"{logical} -> dist/{hashed}")
@@ -0,0 +1,207 @@
+"""Item response theory calibration of a question bank.
+
+Fits 2PL or 3PL item parameters to every stored answer by marginal maximum
+likelihood, using the Bock-Aitkin EM algorithm over a fixed quadrature of
+abilities:
+
+* E-step: each session's posterior over the quadrature points, given its
+  answers, is added to the expected number of answers (n) and correct
+  answers (r) per question and ability point. Sessions are processed in
+  chunks so memory stays bounded however many answers there are.
+* M-step: every question's parameters are refit to its expected counts with
+  a few Newton steps, for all questions at once. For 3PL, correct answers
+  are split into known and guessed ones, and the guessing parameter c is
+  estimated with a Beta prior.
+
+The fitted parameters are saved as metadata of the bank version they were
+calibrated on (see banks.write_metadata).
+"""
+import math
+from datetime import datetime
+
+from banks import read_metadata, write_metadata
+from config import Config
+from item_analysis import require_numpy
+
+MODELS = ("2pl", "3pl")
+METADATA_NAME = "irt"
+
+
+def quadrature(points):
+    """Return equally spaced abilities on [-4, 4] with standard normal weights."""
+    np = require_numpy()
+    theta = np.linspace(-4, 4, points)
+    weights = np.exp(-theta ** 2 / 2)
+    return theta, weights / weights.sum()
+
+
+def _session_order(responses):
+    """Sort the answers by session and return the offsets where sessions start."""
+    np = require_numpy()
+    order = np.argsort(responses.session, kind="stable")
+    session = responses.session[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(session)) + 1))
+    return order, session, starts
+
+
+def _chunks(starts, total, chunk_size):
+    """Group whole sessions into (first answer, end answer, first session, end session) chunks."""
+    np = require_numpy()
+    bounds = np.unique(np.searchsorted(starts, np.arange(0, total, chunk_size)))
+    bounds = np.append(bounds[bounds < len(starts)], len(starts))
+    for first, end in zip(bounds[:-1], bounds[1:]):
+        yield starts[first], (starts[end] if end < len(starts) else total), first, end
+
+
+def _probabilities(a, d, c, theta):
+    """P(correct) per question and ability point for P = c + (1 - c) / (1 + exp(-(a*theta + d)))."""
+    np = require_numpy()
+    known = 1 / (1 + np.exp(-(np.outer(a, theta) + d[:, None])))
+    return np.clip(c[:, None] + (1 - c[:, None]) * known, 1e-9, 1 - 1e-9), known
+
+
+def calibrate(
+    responses, model="2pl", points=21, max_iterations=500, tolerance=1e-3,
+    chunk_size=None, guessing_prior=(5, 17),
+):
+    """Fit item parameters; returns a dict of per-question arrays and fit details.
+
+    `guessing_prior` is the Beta(alpha, beta) prior on c for 3PL, by default
+    centred near 1/(number of options) for four-option questions.
+    """
+    np = require_numpy()
+    if model not in MODELS:
+        raise ValueError(f"Unknown IRT model: {model}")
+    chunk_size = chunk_size or Config.CALIBRATION_CHUNK_SIZE
+    theta, prior = quadrature(points)
+    log_prior = np.log(prior)
+    items = responses.question_count
+
+    order, session, starts = _session_order(responses)
+    question = responses.question[order].astype(np.int64)
+    correct = responses.correct[order]
+    chunks = list(_chunks(starts, len(question), chunk_size))
+
+    answered = np.bincount(question, minlength=items)
+    p_values = np.bincount(question, weights=correct, minlength=items) / np.maximum(answered, 1)
+    a = np.ones(items)
+    d = np.log(np.clip(p_values, 0.02, 0.98) / (1 - np.clip(p_values, 0.02, 0.98)))
+    c = np.full(items, 0.2 if model == "3pl" else 0.0)
+
+    log_likelihood = -np.inf
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        # E-step: expected answers (n) and correct answers (r) at each ability point.
+        probability, known = _probabilities(a, d, c, theta)
+        log_right, log_wrong = np.log(probability), np.log(1 - probability)
+        n = np.zeros(items * points)
+        r = np.zeros(items * points)
+        log_likelihood = 0.0
+        for first, stop, first_session, end_session in chunks:
+            chunk_question = question[first:stop]
+            chunk_correct = correct[first:stop]
+            contributions = np.where(chunk_correct[:, None], log_right[chunk_question], log_wrong[chunk_question])
+            session_log = np.add.reduceat(contributions, starts[first_session:end_session] - first, axis=0)
+            session_log += log_prior
+            peak = session_log.max(axis=1, keepdims=True)
+            posterior = np.exp(session_log - peak)
+            total = posterior.sum(axis=1, keepdims=True)
+            log_likelihood += float((np.log(total) + peak).sum())
+            posterior /= total
+
+            weights = posterior[session[first:stop] - first_session]
+            cells = (chunk_question[:, None] * points + np.arange(points)).ravel()
+            n += np.bincount(cells, weights=weights.ravel(), minlength=items * points)
+            r += np.bincount(cells, weights=(weights * chunk_correct[:, None]).ravel(), minlength=items * points)
+        n = n.reshape(items, points)
+        r = r.reshape(items, points)
+
+        # M-step. For 3PL, s is the expected number of correct answers that were known, not guessed.
+        previous_c = c
+        if model == "3pl":
+            s = r * known / probability
+            alpha, beta = guessing_prior
+            guessed, not_known = (r - s).sum(axis=1), (n - s).sum(axis=1)
+            c = np.clip((guessed + alpha - 1) / (not_known + alpha + beta - 2), 0.0, 0.5)
+        else:
+            s = r
+        fitted = _fit_logistic(a, d, theta, s, n)
+        change = max(np.abs(fitted[0] - a).max(), np.abs(fitted[1] - d).max(), np.abs(c - previous_c).max())
+        a, d = fitted
+        if change < tolerance:
+            break
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = np.where(a > 0, -d / a, np.nan)
+    no_data = answered == 0
+    for parameter in (a, b, c):
+        parameter[no_data] = np.nan
+    return {
+        "model": model,
+        "a": a,
+        "b": b,
+        "c": c,
+        "answers": answered,
+        "log_likelihood": log_likelihood,
+        "iterations": iteration,
+        "sessions": len(starts),
+    }
+
+
+def _fit_logistic(a, d, theta, successes, trials, steps=5):
+    """Newton steps on weighted logistic regressions of successes on theta, one per question."""
+    np = require_numpy()
+    for _ in range(steps):
+        p = 1 / (1 + np.exp(-(np.outer(a, theta) + d[:, None])))
+        residual = successes - trials * p
+        weight = trials * p * (1 - p) + 1e-9
+        grad_a = (residual * theta).sum(axis=1) - 0.1 * (a - 1)  # Weak ridge keeps sparse items sane
+        grad_d = residual.sum(axis=1)
+        h_aa = (weight * theta ** 2).sum(axis=1) + 0.1
+        h_ad = (weight * theta).sum(axis=1)
+        h_dd = weight.sum(axis=1)
+        determinant = h_aa * h_dd - h_ad ** 2
+        a = a + (h_dd * grad_a - h_ad * grad_d) / determinant
+        d = d + (h_aa * grad_d - h_ad * grad_a) / determinant
+        a = np.clip(a, 0.05, 4.0)
+        d = np.clip(d, -12.0, 12.0)
+    return a, d
+
+
+def save_parameters(bank, result):
+    """Write fitted parameters as metadata of the bank version; returns the file path."""
+    parameters = []
+    for index in range(len(bank)):
+        if not result["answers"][index]:
+            parameters.append(None)
+            continue
+        parameters.append({
+            "id": bank.ids[index],
+            "a": round(float(result["a"][index]), 4),
+            "b": round(float(result["b"][index]), 4),
+            "c": round(float(result["c"][index]), 4),
+            "answers": int(result["answers"][index]),
+        })
+    return write_metadata(
+        Config.BANK_SNAPSHOT_DIR, bank.key, bank.version, METADATA_NAME,
+        {
+            "model": result["model"],
+            "calibrated_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "sessions": result["sessions"],
+            "answers": int(result["answers"].sum()),
+            "iterations": result["iterations"],
+            "log_likelihood": round(result["log_likelihood"], 2),
+            "items": parameters,
+        },
+    )
+
+
+def item_parameters(bank):
+    """Return the calibration saved for a bank version, or None if it has none."""
+    return read_metadata(Config.BANK_SNAPSHOT_DIR, bank.key, bank.version, METADATA_NAME)
+
+
+def probability_correct(parameters, theta):
+    """P(correct) for one question's saved parameters at ability theta."""
+    known = 1 / (1 + math.exp(-parameters["a"] * (theta - parameters["b"])))
+    return parameters["c"] + (1 - parameters["c"]) * known
@@ -16,3 +16,134 @@ class Config:
     
     # Define session lifetime
     SESSION_LIFETIME = timedelta(days=7)  # Sessions will last 7 days
+
+    # User accounts: memory, file, sqlite or postgres (see user_repository.py)
+    USER_STORE = os.environ.get("USER_STORE", "")  # Empty: users.py in development, else the database
+    USERS_FILE = os.environ.get("USERS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "users.py"))
+
+    # Timed exam mode
+    EXAM_QUESTION_COUNT = int(os.environ.get("EXAM_QUESTION_COUNT", 81))
+    EXAM_DURATION = timedelta(minutes=int(os.environ.get("EXAM_DURATION_MINUTES", 135)))
+    EXAM_SWEEP_INTERVAL = int(os.environ.get("EXAM_SWEEP_INTERVAL", 30))  # Seconds between expiry sweeps
+    EXAM_SWEEP_BATCH_SIZE = int(os.environ.get("EXAM_SWEEP_BATCH_SIZE", 500))
+
+    # Background job scheduler
+    SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() != "false"
+    SCHEDULER_TICK = int(os.environ.get("SCHEDULER_TICK", 5))  # Seconds between schedule checks
+    SCHEDULER_LEASE = int(os.environ.get("SCHEDULER_LEASE", 60))  # Seconds a silent leader keeps the lead
+    SCHEDULER_JITTER = float(os.environ.get("SCHEDULER_JITTER", 0.1))  # Fraction of each job's interval
+    JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 300))
+    JOB_HISTORY_DAYS = int(os.environ.get("JOB_HISTORY_DAYS", 14))
+    PROGRESS_SNAPSHOT_INTERVAL = int(os.environ.get("PROGRESS_SNAPSHOT_INTERVAL", 600))
+
+    # Durable queue of deferred tasks, run by `flask queue-worker` (see job_queue.py)
+    QUEUE_PATH = os.environ.get(
+        "QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "task_queue.db")
+    )
+    QUEUE_OUTPUT_DIR = os.environ.get(
+        "QUEUE_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "task_output")
+    )
+    QUEUE_POLL_INTERVAL = float(os.environ.get("QUEUE_POLL_INTERVAL", 1.0))  # Seconds an idle worker waits
+    QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", 60))  # Seconds before a dead worker's task is retried
+    QUEUE_TASK_TIMEOUT = int(os.environ.get("QUEUE_TASK_TIMEOUT", 900))  # Unless the task type sets its own
+    QUEUE_MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", 5))
+    QUEUE_RETRY_DELAY = int(os.environ.get("QUEUE_RETRY_DELAY", 10))  # Seconds before the first retry; doubles each time
+    QUEUE_RETRY_MAX_DELAY = int(os.environ.get("QUEUE_RETRY_MAX_DELAY", 3600))
+    QUEUE_CONCURRENCY = os.environ.get("QUEUE_CONCURRENCY", "")  # e.g. "export=4,calibrate=1"; overrides the task defaults
+
+    # Per-user mastery of each study area, and weak-area practice
+    MASTERY_DECAY = float(os.environ.get("MASTERY_DECAY", 0.9))  # Weight kept by older answers per new one
+    WEAK_AREA_COUNT = int(os.environ.get("WEAK_AREA_COUNT", 3))
+    WEAK_AREA_QUESTIONS = int(os.environ.get("WEAK_AREA_QUESTIONS", 20))
+
+    # Time-on-question sketches
+    RESPONSE_TIME_ACCURACY = float(os.environ.get("RESPONSE_TIME_ACCURACY", 0.02))  # Relative error of quantiles
+    RESPONSE_TIME_MAX = int(os.environ.get("RESPONSE_TIME_MAX", 1800))  # Longer timings are discarded
+    RESPONSE_TIME_FLUSH_INTERVAL = int(os.environ.get("RESPONSE_TIME_FLUSH_INTERVAL", 60))
+
+    # IRT calibration; answers per E-step chunk bound its memory use
+    CALIBRATION_CHUNK_SIZE = int(os.environ.get("CALIBRATION_CHUNK_SIZE", 100000))
+
+    # Exam blueprints, as "<name>=<questions>/<domain>:<weight>,..." entries separated by ";"
+    BLUEPRINTS = os.environ.get(
+        "BLUEPRINTS",
+        f"exam={EXAM_QUESTION_COUNT}/foundation:27,relationship:25,communication:26,growth:22;"
+        "practice=60/foundation:27,relationship:25,communication:26,growth:22",
+    )
+    EXAM_BLUEPRINT = os.environ.get("EXAM_BLUEPRINT", "exam")  # Empty draws uniformly
+    PRACTICE_BLUEPRINT = os.environ.get("PRACTICE_BLUEPRINT", "practice")  # Empty uses the whole bank
+
+    # Live proctor dashboards
+    PROCTOR_FLUSH_INTERVAL = float(os.environ.get("PROCTOR_FLUSH_INTERVAL", 1.0))  # Seconds of updates coalesced per message
+    PROCTOR_BUFFER_SIZE = int(os.environ.get("PROCTOR_BUFFER_SIZE", 1000))  # Learners pending per dashboard before it resyncs
+    PROCTOR_HEARTBEAT = int(os.environ.get("PROCTOR_HEARTBEAT", 15))  # Seconds between keep-alive comments
+    PROCTOR_STREAM_SECONDS = int(os.environ.get("PROCTOR_STREAM_SECONDS", 300))  # Streams end after this; browsers reconnect
+    PROCTOR_TOPIC_TTL = int(os.environ.get("PROCTOR_TOPIC_TTL", 6 * 3600))  # Seconds an idle cohort's progress is kept
+    PROCTOR_RELAY = os.environ.get("PROCTOR_RELAY", "true").lower() != "false"  # Share updates between local workers
+    PROCTOR_RELAY_DIR = os.environ.get(
+        "PROCTOR_RELAY_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "proctor"),
+    )
+
+    # Leaderboards
+    LEADERBOARD_SIZE = int(os.environ.get("LEADERBOARD_SIZE", 10))
+    LEADERBOARD_CACHE_TTL = int(os.environ.get("LEADERBOARD_CACHE_TTL", 60))  # Seconds before reloading from the rollup table
+
+    # Exports and administration
+    ADMIN_EMAILS = {email.strip() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+    # Proctors of live cohorts, besides admins; "<organization>/<email>" outside the default organization
+    INSTRUCTOR_EMAILS = {email.strip() for email in os.environ.get("INSTRUCTOR_EMAILS", "").split(",") if email.strip()}
+    EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 5000))  # Rows fetched and written per chunk
+    EXPORT_STREAM_MAX_ROWS = int(os.environ.get("EXPORT_STREAM_MAX_ROWS", 100000))  # Larger web exports go to the task queue
+
+    # Password hashing
+    PASSWORD_SCHEME = os.environ.get("PASSWORD_SCHEME", "bcrypt")  # Or "argon2id" (needs argon2-cffi)
+    PASSWORD_HASH_TARGET_MS = int(os.environ.get("PASSWORD_HASH_TARGET_MS", 250))  # Time per hash the work factor is calibrated to
+    PASSWORD_WORK_FACTOR = int(os.environ.get("PASSWORD_WORK_FACTOR", 0))  # bcrypt rounds or Argon2 passes; 0 calibrates at startup
+    ARGON2_MEMORY_KIB = int(os.environ.get("ARGON2_MEMORY_KIB", 65536))
+    ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 1))
+
+    # Login shield: failed logins per account and per subnet, in a sketch shared by the host's workers
+    LOGIN_SHIELD_ENABLED = os.environ.get("LOGIN_SHIELD_ENABLED", "true").lower() != "false"
+    LOGIN_SHIELD_WINDOW = int(os.environ.get("LOGIN_SHIELD_WINDOW", 900))  # Seconds failures count for
+    LOGIN_SHIELD_ACCOUNT_LIMIT = int(os.environ.get("LOGIN_SHIELD_ACCOUNT_LIMIT", 10))
+    LOGIN_SHIELD_SUBNET_LIMIT = int(os.environ.get("LOGIN_SHIELD_SUBNET_LIMIT", 50))
+    LOGIN_SHIELD_MAX_DELAY = float(os.environ.get("LOGIN_SHIELD_MAX_DELAY", 2.0))  # Seconds between throttled attempts, just below a limit
+    LOGIN_SHIELD_WIDTH = int(os.environ.get("LOGIN_SHIELD_WIDTH", 65536))  # Counters per row; 3 MB in total at depth 4
+    LOGIN_SHIELD_DEPTH = int(os.environ.get("LOGIN_SHIELD_DEPTH", 4))
+    LOGIN_SHIELD_PATH = os.environ.get(
+        "LOGIN_SHIELD_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "login_shield.bin"),
+    )
+
+    # Serving
+    SERVING_THREADS = int(os.environ.get("SERVING_THREADS", 8))  # Request threads per worker, in gunicorn and asgi.py
+    HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))  # Threads available for password hashing
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() != "false"
+
+    # Single-node SQLite: WAL, relaxed fsyncs, mmap reads and a busy timeout (see sqlite_tuning.py)
+    SQLITE_TUNED = os.environ.get("SQLITE_TUNED", "true").lower() != "false"
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # FULL also fsyncs every commit
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # Bytes; 0 disables
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))  # Milliseconds a writer waits for the lock
+    SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 16))  # Connections per process; one per serving thread
+
+    # Static assets and compression
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))  # Bytes; smaller HTML is sent uncompressed
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+
+    # Question banks, as "<level>/<locale>=<module>" pairs
+    QUESTION_BANKS = os.environ.get("QUESTION_BANKS", "ACC/en=quiz_data")
+    DEFAULT_BANK = os.environ.get("DEFAULT_BANK", "ACC/en")
+    BANK_MEMORY_BUDGET_MB = int(os.environ.get("BANK_MEMORY_BUDGET_MB", 64))  # Per tenant, unless TENANTS sets one
+    BANK_RELOAD_INTERVAL = int(os.environ.get("BANK_RELOAD_INTERVAL", 10))  # Seconds between source checks
+    # Organizations, as "<name>=<bank>,<bank>@<memory MB>" entries separated by ";"
+    TENANTS = os.environ.get("TENANTS", "")  # Empty serves every bank to DEFAULT_TENANT
+    DEFAULT_TENANT = os.environ.get("DEFAULT_TENANT", "default")  # Also serves hosts naming no tenant
+    BANK_SNAPSHOT_DIR = os.environ.get(
+        "BANK_SNAPSHOT_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "bank_snapshots"),
+    )
+
+    # Shuffle answer options per exam session
+    SHUFFLE_OPTIONS = os.environ.get("SHUFFLE_OPTIONS", "true").lower() != "false"
@@ -1,76 +1,252 @@
-from models import db, User
-import bcrypt
+from models import db
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from sqlalchemy import MetaData, UniqueConstraint, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+from sqlalchemy.exc import IntegrityError
 from config import Config
-from users import users  # Import the user dictionary
+from passwords import check_password, hash_password, needs_rehash
+from user_repository import get_user_repository
 
-USERS_FILE = "users.py"
+# bcrypt and Argon2 release the GIL, so a small pool bounds hashing CPU without blocking other requests.
+_hash_executor = ThreadPoolExecutor(max_workers=Config.HASH_WORKERS, thread_name_prefix="password-hash")
 
 
 def initialize_db(app):
-    """Initialize the database or configure development environment."""
+    """Create any missing tables."""
     with app.app_context():
-        if Config.ENV == "development":
-            # Log for development environment
-            app.logger.info(
-                "Development mode: No database initialization required. Using users.py."
-            )
+        existing_tables = set(inspect(db.engine).get_table_names())
+        # create_all only creates missing tables, so this is safe on every start.
+        db.create_all()
+        created = sorted(set(inspect(db.engine).get_table_names()) - existing_tables)
+        if created:
+            app.logger.info(f"Database initialized: Created tables {', '.join(created)}.")
         else:
-            # Check and create tables if necessary for production
-            inspector = inspect(db.engine)
-            tables = inspector.get_table_names()
-
-            if not tables:
-                db.create_all()
-                app.logger.info("Database initialized: Tables created.")
-            else:
-                app.logger.info("Database already initialized: Tables exist.")
-
-
-def create_user(email, password):
-    """Create a new user and add to the appropriate storage."""
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-
-    if Config.ENV == "development":
-        # Check if the email already exists in the in-memory users dictionary
-        if email in users:
-            raise ValueError("User already exists in development environment.")
-
-        # Add user to the in-memory dictionary
-        users[email] = hashed_password
-
-        # Persist changes to the users.py file
-        with open(USERS_FILE, "w") as file:
-            file.write("users = {\n")
-            for user_email, user_password in users.items():
-                file.write(f'    "{user_email}": {user_password!r},\n')
-            file.write("}\n")
-    else:
-        # Add to production database
+            app.logger.info("Database already initialized: Tables exist.")
+        added = add_missing_columns()
+        if added:
+            app.logger.info(f"Database upgraded: Added columns {', '.join(added)}.")
+        replaced = replace_stale_constraints()
+        if replaced:
+            app.logger.info(f"Database upgraded: Replaced constraints or indexes of {', '.join(replaced)}.")
+        added = add_missing_unique_constraints()
+        if added:
+            app.logger.info(f"Database upgraded: Added unique constraints {', '.join(added)}.")
+
+
+def add_missing_columns():
+    """Add the columns that models gained since their tables were created.
+
+    create_all never alters an existing table. Only nullable columns and
+    those with a server default can be added to a table that has rows;
+    renamed columns still need a manual migration.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not (column.nullable or column.server_default is not None):
+                continue
+            definition = CreateColumn(column).compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def replace_stale_constraints():
+    """Drop the unique constraints models no longer declare and rebuild changed indexes.
+
+    Organizations, for example, replaced the unique email of users with a
+    unique (organization, email). SQLite cannot drop a constraint, so there
+    the table is copied into a new one created from its model; other
+    databases drop the constraint. Returns the names of the tables changed.
+    """
+    inspector = inspect(db.engine)
+    replaced = []
+    for table in db.metadata.sorted_tables:
+        declared = {
+            tuple(column.name for column in constraint.columns)
+            for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)
+        }
+        declared |= {tuple(column.name for column in index.columns) for index in table.indexes if index.unique}
+        stale = [
+            constraint for constraint in inspector.get_unique_constraints(table.name)
+            if tuple(constraint["column_names"]) not in declared
+        ]
+        indexes = {index["name"]: index for index in inspector.get_indexes(table.name)}
+        stale_indexes = [
+            index for index in indexes.values()
+            if index["unique"] and "duplicates_constraint" not in index
+            and tuple(index["column_names"]) not in declared
+        ]
+        changed_indexes = [
+            index for index in table.indexes
+            # Indexes on expressions, such as `score DESC`, are not compared.
+            if index.name in indexes and len(index.columns) == len(index.expressions)
+            and tuple(indexes[index.name]["column_names"]) != tuple(column.name for column in index.columns)
+        ]
+        if not (stale or stale_indexes or changed_indexes):
+            continue
+        try:
+            with db.engine.begin() as connection:
+                if stale and db.engine.dialect.name == "sqlite":
+                    _rebuild_sqlite_table(connection, table)
+                else:
+                    for constraint in stale:
+                        connection.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {constraint['name']}"))
+                    for index in stale_indexes:
+                        connection.execute(text(f"DROP INDEX {index['name']}"))
+                    for index in changed_indexes:
+                        connection.execute(text(f"DROP INDEX {index.name}"))
+                        index.create(connection)
+        except IntegrityError as e:
+            logging.getLogger(__name__).error(f"Could not replace the constraints of {table.name}: {e}")
+            continue
+        replaced.append(table.name)
+    return replaced
+
+
+def _rebuild_sqlite_table(connection, table):
+    """Copy a SQLite table's rows into a new table created from its model, under the same name."""
+    scratch = MetaData()
+    for other in db.metadata.sorted_tables:
+        other.to_metadata(scratch)
+    rebuilt = table.to_metadata(scratch, name=f"_rebuild_{table.name}")
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(CreateTable(rebuilt))
+    connection.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}"))
+    # Dropping the old table drops its indexes too, so they are created again afterwards.
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def add_missing_unique_constraints():
+    """Add the unique constraints that models gained since their tables were created.
+
+    They are created as unique indexes, which both SQLite and PostgreSQL can
+    add to an existing table. A table that already holds duplicates is
+    skipped with an error until they are cleaned up.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        existing = {tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table.name)}
+        existing |= {tuple(index["column_names"]) for index in inspector.get_indexes(table.name) if index["unique"]}
+        for constraint in table.constraints:
+            if not isinstance(constraint, UniqueConstraint):
+                continue
+            columns = tuple(column.name for column in constraint.columns)
+            if columns in existing:
+                continue
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        text(f"CREATE UNIQUE INDEX {constraint.name} ON {table.name} ({', '.join(columns)})")
+                    )
+            except IntegrityError as e:
+                logging.getLogger(__name__).error(f"Could not add {constraint.name} to {table.name}: {e}")
+                continue
+            added.append(constraint.name)
+    return added
+
+
+def create_user(email, password, hashed_password=None, organization=None):
+    """Create a new user in the configured user store.
+
+    Pass `hashed_password` when the password was already hashed elsewhere,
+    e.g. on the hashing executor.
+    """
+    hashed_password = hashed_password or hash_password(password)
+    get_user_repository().create(email, hashed_password, organization or Config.DEFAULT_TENANT)
+
+
+def create_users(accounts, organization=None):
+    """Create several users from (email, password) pairs, hashing on the executor and storing them at once."""
+    emails = [email for email, _ in accounts]
+    hashes = _hash_executor.map(hash_password, [password for _, password in accounts])
+    get_user_repository().create_many(list(zip(emails, hashes)), organization or Config.DEFAULT_TENANT)
+
+
+def update_password_hash(email, hashed_password, organization=None):
+    """Replace a user's stored hash, e.g. after rehashing it at the current work factor."""
+    get_user_repository().update_hash(email, hashed_password, organization or Config.DEFAULT_TENANT)
+
+
+def rehash_if_needed(email, password, stored_hash, organization=None):
+    """After a successful login, store the password again if its hash is outdated.
+
+    A failure is logged rather than raised; the login itself succeeded.
+    """
+    if not needs_rehash(stored_hash):
+        return False
+    try:
+        update_password_hash(email, hash_password(password), organization)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Rehashing the password of {email} failed: {e}")
+        return False
+    return True
+
+
+def get_user_by_email(email, organization=None):
+    """Retrieve a user of an organization by their email, as a UserRecord."""
+    return get_user_repository().get(email, organization or Config.DEFAULT_TENANT)
+
+
+def get_users_by_email(emails, organization=None):
+    """Retrieve several users of an organization at once, as {email: UserRecord}."""
+    return get_user_repository().get_many(emails, organization or Config.DEFAULT_TENANT)
+
+
+def get_password_hash(email, organization=None):
+    """Return the stored password hash of a user as bytes, or None if unknown."""
+    user = get_user_by_email(email, organization)
+    return None if user is None else user.password_hash
+
+
+def validate_user(email, password, organization=None):
+    """Validate a user's email and password within an organization.
+
+    On success, a hash made with another scheme or work factor is replaced.
+    """
+    stored_hash = get_password_hash(email, organization)
+    if stored_hash is None or not check_password(password, stored_hash):
+        return False
+    rehash_if_needed(email, password, stored_hash, organization)
+    return True
+
+
+async def validate_user_async(email, password, organization=None):
+    """Validate credentials, awaiting the user lookup, the hash check and any rehash."""
+    stored_hash = await sync_to_async(get_password_hash)(email, organization)
+    if stored_hash is None:
+        return False
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(_hash_executor, check_password, password, stored_hash):
+        return False
+    if needs_rehash(stored_hash):
+        hashed_password = await loop.run_in_executor(_hash_executor, hash_password, password)
         try:
-            if User.query.filter_by(email=email).first():
-                raise ValueError("User already exists.")
-            new_user = User(email=email, password=hashed_password.decode("utf-8"))
-            db.session.add(new_user)
-            db.session.commit()
+            await sync_to_async(update_password_hash)(email, hashed_password, organization)
         except Exception as e:
-            db.session.rollback()
-            raise e
-
-
-def get_user_by_email(email):
-    """Retrieve a user by their email."""
-    if Config.ENV == "development":
-        if email in users:
-            return {"email": email, "password": users[email]}
-        return None
-    return User.query.filter_by(email=email).first()
-
-
-def validate_user(email, password):
-    """Validate a user's email and password."""
-    user = get_user_by_email(email)
-    if Config.ENV == "development" and user:
-        return bcrypt.checkpw(password.encode("utf-8"), user["password"])
-    if user and bcrypt.checkpw(password.encode("utf-8"), user.password.encode("utf-8")):
-        return True
-    return False
+            logging.getLogger(__name__).error(f"Rehashing the password of {email} failed: {e}")
+    return True
+
+
+async def get_user_by_email_async(email, organization=None):
+    """Retrieve a user by their email without blocking the event loop."""
+    return await sync_to_async(get_user_by_email)(email, organization)
+
+
+async def create_user_async(email, password, organization=None):
+    """Create a user, hashing the password on the hashing executor."""
+    loop = asyncio.get_running_loop()
+    hashed_password = await loop.run_in_executor(_hash_executor, hash_password, password)
+    await sync_to_async(create_user)(email, password, hashed_password, organization)
+
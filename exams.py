@@ -0,0 +1,341 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from leaderboard import record_result
+from models import db, Exam, Attempt
+from blueprints import draw_questions
+from options import new_seed
+
+STATUS_ACTIVE = "active"
+STATUS_FINISHED = "finished"
+STATUS_EXPIRED = "expired"
+
+MODE_EXAM = "exam"
+MODE_PRACTICE = "practice"
+
+
+def start_exam(user_email, bank, cohort=None, organization=None):
+    """Create a new timed exam on a bank with a server-side deadline."""
+    now = datetime.utcnow()
+    quiz_indices = draw_questions(bank, Config.EXAM_BLUEPRINT, Config.EXAM_QUESTION_COUNT)
+    exam = Exam(
+        organization=organization or Config.DEFAULT_TENANT,
+        user_email=user_email,
+        mode=MODE_EXAM,
+        bank=bank.key,
+        bank_version=bank.version,
+        cohort=cohort,
+        quiz_indices=quiz_indices,
+        option_seed=new_seed(),
+        question_count=len(quiz_indices),
+        answers={},
+        started_at=now,
+        deadline=now + Config.EXAM_DURATION,
+    )
+    db.session.add(exam)
+    db.session.commit()
+    return exam
+
+
+def get_active_exam(user_email, organization=None):
+    """Return the user's running exam, finalizing it first if its deadline has passed."""
+    exam = (
+        Exam.query.filter_by(
+            organization=organization or Config.DEFAULT_TENANT,
+            user_email=user_email,
+            mode=MODE_EXAM,
+            status=STATUS_ACTIVE,
+        )
+        .order_by(Exam.started_at.desc())
+        .first()
+    )
+    if exam and is_expired(exam):
+        finalize_exam(exam, STATUS_EXPIRED)
+        return None
+    return exam
+
+
+def get_latest_exam(user_email, organization=None):
+    """Return the user's most recently started exam, whatever its status."""
+    return (
+        Exam.query.filter_by(
+            organization=organization or Config.DEFAULT_TENANT, user_email=user_email, mode=MODE_EXAM
+        )
+        .order_by(Exam.started_at.desc())
+        .first()
+    )
+
+
+def is_expired(exam, now=None):
+    """Check whether the exam's deadline has passed."""
+    return (now or datetime.utcnow()) >= exam.deadline
+
+
+def seconds_remaining(exam, now=None):
+    """Return the whole seconds left before the exam's deadline."""
+    remaining = exam.deadline - (now or datetime.utcnow())
+    return max(int(remaining.total_seconds()), 0)
+
+
+def exam_score(correct_answers, question_count):
+    """Return the percentage score; unanswered questions count as wrong."""
+    return round((correct_answers / question_count) * 100, 0) if question_count else 0
+
+
+def next_unanswered(exam):
+    """Return the first position the user has not answered yet."""
+    for position in range(len(exam.quiz_indices)):
+        if str(position) not in exam.answers:
+            return position
+    return len(exam.quiz_indices)
+
+
+def record_answer(exam, position, question_id, answer, correct):
+    """Store an answer for a position; repeated submissions are ignored.
+
+    The attempt's unique constraint lets only one of several concurrent
+    submissions of a position through. The exam row is then updated only if
+    its answer count is still the one read, so an answer to another position
+    committed meanwhile is merged in rather than overwritten.
+    """
+    key = str(position)
+    if key in exam.answers:
+        return False
+    if not _add_attempt(exam.id, exam.user_email, exam.quiz_indices[position], question_id, answer, correct):
+        return False
+    while True:
+        answered = exam.answered_questions
+        result = db.session.execute(
+            update(Exam)
+            .where(Exam.id == exam.id, Exam.answered_questions == answered)
+            .values(
+                answers={**exam.answers, key: answer},
+                answered_questions=answered + 1,
+                correct_answers=Exam.correct_answers + (1 if correct else 0),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            break
+        db.session.refresh(exam)
+    db.session.commit()
+    return True
+
+
+def record_attempt(exam_id, user_email, question_index, question_id, answer, correct):
+    """Persist a single graded answer under its position and stable question ID, and commit the session.
+
+    Returns False, storing nothing, if the session already has an answer for
+    that question, e.g. from a double click whose first request won.
+    """
+    if not _add_attempt(exam_id, user_email, question_index, question_id, answer, correct):
+        return False
+    db.session.commit()
+    return True
+
+
+def _add_attempt(exam_id, user_email, question_index, question_id, answer, correct):
+    """Add a graded answer to the current transaction; returns False if the question already has one."""
+    db.session.add(
+        Attempt(
+            exam_id=exam_id,
+            user_email=user_email,
+            question_index=question_index,
+            question_id=question_id,
+            answer=answer,
+            correct=correct,
+        )
+    )
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # uq_attempts_question: another request recorded this question first.
+        db.session.rollback()
+        return False
+    return True
+
+
+def get_recorded_answer(exam_id, question_index):
+    """Return the answer first recorded for a question in a session, if any."""
+    attempt = (
+        Attempt.query.filter_by(exam_id=exam_id, question_index=question_index)
+        .order_by(Attempt.id)
+        .first()
+    )
+    return attempt.answer if attempt else None
+
+
+def start_practice(user_email, bank, quiz_indices, organization=None, cohort=None):
+    """Create the record a practice session's attempts are stored against."""
+    practice = Exam(
+        organization=organization or Config.DEFAULT_TENANT,
+        user_email=user_email,
+        mode=MODE_PRACTICE,
+        bank=bank.key,
+        bank_version=bank.version,
+        cohort=cohort,
+        quiz_indices=quiz_indices,
+        option_seed=new_seed(),
+        question_count=len(quiz_indices),
+        answers={},
+    )
+    db.session.add(practice)
+    db.session.commit()
+    return practice
+
+
+def finish_practice(practice_id, user_email, answered_questions, correct_answers, organization=None):
+    """Close a practice session with the totals kept in the user's session."""
+    practice = Exam.query.filter_by(
+        id=practice_id,
+        organization=organization or Config.DEFAULT_TENANT,
+        user_email=user_email,
+        mode=MODE_PRACTICE,
+        status=STATUS_ACTIVE,
+    ).first()
+    if practice is None:
+        return None
+    practice.answered_questions = answered_questions
+    practice.correct_answers = correct_answers
+    practice.status = STATUS_FINISHED
+    practice.finished_at = datetime.utcnow()
+    db.session.commit()
+    return practice
+
+
+def finalize_exam(exam, status=STATUS_FINISHED):
+    """Close an active exam; expired exams are stamped with their deadline.
+
+    The status change is conditional, so when a request and the expiry sweep
+    close the same exam at once only the one that changed it records the
+    result. Returns True if this call closed the exam.
+    """
+    if exam.status != STATUS_ACTIVE:
+        return False
+    finished_at = exam.deadline if status == STATUS_EXPIRED else datetime.utcnow()
+    result = db.session.execute(
+        update(Exam)
+        .where(Exam.id == exam.id, Exam.status == STATUS_ACTIVE)
+        .values(status=status, finished_at=finished_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()  # Expires `exam`, so it reloads whichever status won.
+    if result.rowcount != 1:
+        return False
+    record_result(
+        exam.user_email,
+        exam_score(exam.correct_answers, exam.question_count),
+        finished_at,
+        exam.cohort,
+        exam.organization,
+    )
+    return True
+
+
+def sweep_expired_exams(batch_size=None, now=None):
+    """Expire every active exam past its deadline, one indexed batch at a time."""
+    batch_size = batch_size or Config.EXAM_SWEEP_BATCH_SIZE
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        ids = db.session.execute(
+            select(Exam.id)
+            .where(Exam.status == STATUS_ACTIVE, Exam.deadline <= now)
+            .order_by(Exam.deadline)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        # RETURNING lists only the exams this statement closed, not those another worker closed first.
+        rows = db.session.execute(
+            update(Exam)
+            .where(Exam.id.in_(ids), Exam.status == STATUS_ACTIVE)
+            .values(status=STATUS_EXPIRED, finished_at=Exam.deadline)
+            .returning(
+                Exam.organization, Exam.user_email, Exam.cohort, Exam.correct_answers,
+                Exam.question_count, Exam.deadline,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        for row in rows:
+            record_result(
+                row.user_email,
+                exam_score(row.correct_answers, row.question_count),
+                row.deadline,
+                row.cohort,
+                row.organization,
+            )
+        expired += len(rows)
+        if len(ids) < batch_size:
+            break
+    return expired
+
+
+def expire_idle_practice(idle_for=None, batch_size=None, now=None):
+    """Close practice sessions nobody has answered in for `idle_for`.
+
+    By then the browser session holding their totals has expired too, so the
+    totals are recounted from the stored attempts.
+    """
+    idle_for = idle_for or Config.SESSION_LIFETIME
+    batch_size = batch_size or Config.EXAM_SWEEP_BATCH_SIZE
+    cutoff = (now or datetime.utcnow()) - idle_for
+    last_answer = (
+        select(Attempt.exam_id, func.max(Attempt.answered_at).label("answered_at"))
+        .group_by(Attempt.exam_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(Exam.id, Exam.started_at, last_answer.c.answered_at)
+        .outerjoin(last_answer, last_answer.c.exam_id == Exam.id)
+        .where(
+            Exam.mode == MODE_PRACTICE,
+            Exam.status == STATUS_ACTIVE,
+            Exam.started_at < cutoff,
+            func.coalesce(last_answer.c.answered_at, Exam.started_at) < cutoff,
+        )
+        .limit(batch_size)
+    ).all()
+    for row in rows:
+        answered, correct = db.session.execute(
+            select(func.count(Attempt.id), func.coalesce(func.sum(case((Attempt.correct, 1), else_=0)), 0))
+            .where(Attempt.exam_id == row.id)
+        ).one()
+        db.session.execute(
+            update(Exam)
+            .where(Exam.id == row.id, Exam.status == STATUS_ACTIVE)
+            .values(
+                status=STATUS_EXPIRED,
+                answered_questions=answered,
+                correct_answers=correct,
+                finished_at=row.answered_at or row.started_at,
+            )
+        )
+    db.session.commit()
+    return len(rows)
+
+
+def cohort_exam_progress(cohort, organization=None):
+    """Return the running timed exams of a cohort, for a proctor's first view of it."""
+    return db.session.execute(
+        select(
+            Exam.user_email, Exam.question_count, Exam.answered_questions, Exam.correct_answers, Exam.started_at,
+        ).where(
+            Exam.status == STATUS_ACTIVE,
+            Exam.mode == MODE_EXAM,
+            Exam.organization == (organization or Config.DEFAULT_TENANT),
+            Exam.cohort == cohort,
+        )
+    ).all()
+
+
+def pinned_bank_versions():
+    """Return the (bank, version) pairs that unfinished sessions are using."""
+    rows = db.session.execute(
+        select(Exam.bank, Exam.bank_version).where(Exam.status == STATUS_ACTIVE).distinct()
+    ).all()
+    return {(row.bank, row.bank_version) for row in rows}
@@ -0,0 +1,155 @@
+import csv
+import io
+
+from sqlalchemy import case, func, select
+
+from config import Config
+from models import db, Exam, Attempt, ResponseTimeSketch
+from timings import TIMING_COLUMNS, iter_timing_rows
+
+ATTEMPT_COLUMNS = (
+    "attempt_id", "exam_id", "organization", "user_email", "mode", "bank",
+    "question_id", "answer", "correct", "answered_at",
+)
+ITEM_COLUMNS = (
+    "bank", "question_id", "attempts", "correct_answers", "p_value",
+    "chose_a", "chose_b", "chose_c", "chose_d",
+)
+DATASETS = {"attempts": ATTEMPT_COLUMNS, "items": ITEM_COLUMNS, "timings": TIMING_COLUMNS}
+PARQUET_TYPES = {
+    "attempt_id": "int64", "exam_id": "int64", "organization": "string", "user_email": "string",
+    "mode": "string", "bank": "string",
+    "question_id": "string", "answer": "string", "correct": "bool", "answered_at": "timestamp[us]",
+    "attempts": "int64", "correct_answers": "int64", "p_value": "float64",
+    "chose_a": "int64", "chose_b": "int64", "chose_c": "int64", "chose_d": "int64",
+    "timed_answers": "int64", "time_p50": "float64", "time_p90": "float64", "relative_p50": "float64",
+}
+
+
+def iter_attempt_rows(chunk_size=None):
+    """Yield every attempt as a tuple, fetched through a server-side cursor."""
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    query = (
+        select(
+            Attempt.id, Attempt.exam_id, Exam.organization, Attempt.user_email, Exam.mode, Exam.bank,
+            Attempt.question_id, Attempt.answer, Attempt.correct, Attempt.answered_at,
+        )
+        .join(Exam, Exam.id == Attempt.exam_id)
+        .order_by(Attempt.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    for row in db.session.execute(query):
+        yield tuple(row)
+
+
+def iter_item_rows():
+    """Yield per-question answer statistics across bank versions, aggregated by the database.
+
+    Attempts recorded before stable question IDs are left out until the
+    `backfill-question-ids` task has labelled them.
+    """
+    query = (
+        select(
+            Exam.bank,
+            Attempt.question_id,
+            Attempt.answer,
+            func.count(),
+            func.sum(case((Attempt.correct, 1), else_=0)),
+        )
+        .join(Exam, Exam.id == Attempt.exam_id)
+        .where(Attempt.question_id.is_not(None))
+        .group_by(Exam.bank, Attempt.question_id, Attempt.answer)
+        .order_by(Exam.bank, Attempt.question_id)
+        .execution_options(stream_results=True)
+    )
+    current, attempts, correct, chosen = None, 0, 0, {}
+    for bank, question_id, answer, count, correct_count in db.session.execute(query):
+        if (bank, question_id) != current:
+            if current is not None:
+                yield _item_row(current, attempts, correct, chosen)
+            current, attempts, correct, chosen = (bank, question_id), 0, 0, {}
+        attempts += count
+        correct += correct_count or 0
+        chosen[answer] = count
+    if current is not None:
+        yield _item_row(current, attempts, correct, chosen)
+
+
+def _item_row(item, attempts, correct, chosen):
+    return (
+        *item,
+        attempts,
+        correct,
+        round(correct / attempts, 4) if attempts else None,
+        *(chosen.get(option, 0) for option in "ABCD"),
+    )
+
+
+def iter_rows(dataset, chunk_size=None):
+    """Yield the rows of an export dataset by name."""
+    if dataset == "attempts":
+        return iter_attempt_rows(chunk_size)
+    if dataset == "items":
+        return iter_item_rows()
+    if dataset == "timings":
+        return iter_timing_rows()
+    raise ValueError(f"Unknown export dataset: {dataset}")
+
+
+def reads_more_rows_than(dataset, limit):
+    """Check whether an export dataset reads more than `limit` stored rows; items aggregate every attempt.
+
+    Probes for a row past the limit instead of counting them all.
+    """
+    model = ResponseTimeSketch if dataset == "timings" else Attempt
+    return db.session.execute(select(model.id).limit(1).offset(limit)).first() is not None
+
+
+def iter_csv(columns, rows, chunk_size=None):
+    """Encode rows as CSV, yielding one string per chunk of rows."""
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def write_parquet(path, columns, rows, chunk_size=None):
+    """Write rows to a Parquet file, one row group per chunk; requires pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    schema = pa.schema([(name, pa.type_for_alias(PARQUET_TYPES[name])) for name in columns])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.write_table(_to_table(pa, schema, chunk))
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(_to_table(pa, schema, chunk))
+            written += len(chunk)
+    return written
+
+
+def _to_table(pa, schema, chunk):
+    return pa.Table.from_pydict(
+        {name: [row[i] for row in chunk] for i, name in enumerate(schema.names)},
+        schema=schema,
+    )
@@ -0,0 +1,52 @@
+"""Gunicorn configuration.
+
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+The application is loaded once in the master (`preload_app`), where the
+database is initialized and the question bank imported before any worker
+is forked. Workers share those pages copy-on-write and boot without
+re-importing anything.
+
+Each worker serves SERVING_THREADS requests at once (`gthread`), so a
+login waiting on bcrypt or a streamed response does not hold up the
+worker's other requests. Proctor dashboards keep an event stream open for
+PROCTOR_STREAM_SECONDS, and each open one holds a thread. gthread workers
+report to the master from their main thread, so a long stream never trips
+the worker timeout, which keeps gunicorn's default.
+"""
+import os
+
+from config import Config
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = Config.SERVING_THREADS
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before workers fork.
+    from app import initialize_shared_state
+    from models import db
+
+    app = server.app.wsgi()
+    initialize_shared_state(app)
+    with app.app_context():
+        # Connections opened above must not be inherited by the workers.
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, so each worker starts its own.
+    from app import start_background_tasks
+
+    start_background_tasks(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    # Save the timings this worker has not flushed yet.
+    from timings import flush_response_times
+
+    with server.app.wsgi().app_context():
+        flush_response_times()
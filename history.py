@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, tuple_
+
+from config import Config
+from models import db, Exam, Attempt, ProgressSnapshot
+
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+
+def encode_cursor(finished_at, exam_id):
+    """Encode the position after a history row as an opaque URL parameter."""
+    return f"{finished_at.isoformat()}_{exam_id}"
+
+
+def decode_cursor(cursor):
+    """Decode a history cursor, returning None for missing or malformed values."""
+    try:
+        finished_at, exam_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(finished_at), int(exam_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_history_page(user_email, cursor=None, limit=HISTORY_PAGE_SIZE, organization=None):
+    """Return one page of finished sessions, newest first, and the next cursor.
+
+    Pages are addressed by the last (finished_at, id) seen rather than an
+    offset, so every page is a bounded range scan of ix_exams_history.
+    """
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    query = (
+        select(
+            Exam.id, Exam.mode, Exam.status, Exam.finished_at,
+            Exam.question_count, Exam.answered_questions, Exam.correct_answers,
+        )
+        .where(
+            Exam.organization == (organization or Config.DEFAULT_TENANT),
+            Exam.user_email == user_email,
+            Exam.finished_at.is_not(None),
+        )
+        .order_by(Exam.finished_at.desc(), Exam.id.desc())
+        .limit(limit + 1)
+    )
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.where(tuple_(Exam.finished_at, Exam.id) < position)
+
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].finished_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def get_session_attempts(user_email, exam_id, organization=None):
+    """Return the graded answers of one of the user's sessions, in answer order."""
+    return (
+        Attempt.query.join(Exam, Exam.id == Attempt.exam_id)
+        .filter(
+            Attempt.exam_id == exam_id,
+            Attempt.user_email == user_email,
+            Exam.organization == (organization or Config.DEFAULT_TENANT),
+        )
+        .order_by(Attempt.id)
+        .all()
+    )
+
+
+def snapshot_progress(days=2, now=None):
+    """Rebuild the daily progress rollup for the last `days` days from the attempts."""
+    now = now or datetime.utcnow()
+    first_day = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    totals = {}
+    rows = db.session.execute(
+        select(Exam.organization, Attempt.user_email, Attempt.exam_id, Attempt.correct, Attempt.answered_at)
+        .join(Exam, Exam.id == Attempt.exam_id)
+        .where(Attempt.answered_at >= first_day)
+        .execution_options(yield_per=Config.EXPORT_CHUNK_SIZE)
+    )
+    for row in rows:
+        key = (row.organization, row.user_email, row.answered_at.strftime("%Y-%m-%d"))
+        total = totals.setdefault(key, {"sessions": set(), "answered": 0, "correct": 0})
+        total["sessions"].add(row.exam_id)
+        total["answered"] += 1
+        total["correct"] += row.correct
+
+    db.session.execute(
+        delete(ProgressSnapshot).where(ProgressSnapshot.day >= first_day.strftime("%Y-%m-%d"))
+    )
+    db.session.add_all(
+        ProgressSnapshot(
+            organization=organization, user_email=user_email, day=day, sessions=len(total["sessions"]),
+            answered_questions=total["answered"], correct_answers=total["correct"], updated_at=now,
+        )
+        for (organization, user_email, day), total in totals.items()
+    )
+    db.session.commit()
+    return len(totals)
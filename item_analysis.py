@@ -0,0 +1,226 @@
+"""Whole-bank item analysis over the stored attempts, vectorized with NumPy.
+
+NumPy is optional and only imported by these reports (`pip install numpy`).
+"""
+import csv
+
+from flask import render_template
+from sqlalchemy import select
+
+from config import Config
+from models import db, Exam, Attempt
+
+OPTIONS = "ABCD"
+DISTRACTOR_COLUMNS = (
+    "bank", "question_id", "option", "is_key", "chosen", "attractiveness",
+    "upper_rate", "lower_rate", "discrimination", "flag",
+)
+
+
+def require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Item analysis requires numpy: pip install numpy")
+    return numpy
+
+
+class Responses:
+    """Every attempt on a bank as parallel arrays, one entry per attempt.
+
+    `session` numbers the practice sessions and exams densely from 0, and
+    `option` is the index of the chosen letter in OPTIONS.
+    """
+
+    def __init__(self, bank, session, question, option, correct, question_count):
+        self.bank = bank
+        self.session = session
+        self.question = question
+        self.option = option
+        self.correct = correct
+        self.question_count = question_count
+        self.session_count = int(session.max()) + 1 if len(session) else 0
+
+    def __len__(self):
+        return len(self.question)
+
+
+def load_responses(bank, chunk_size=None, version=None):
+    """Read a bank's attempts into NumPy arrays, one chunk of rows at a time.
+
+    Answers are placed at their question's position in `bank` by stable
+    question ID, so answers given on earlier versions land on the right
+    question. With a version, only sessions that ran on that version count.
+    """
+    np = require_numpy()
+    chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+    letter_index = {letter: index for index, letter in enumerate(OPTIONS)}
+    query = (
+        select(
+            Attempt.exam_id, Attempt.question_id, Attempt.question_index, Exam.bank_version,
+            Attempt.answer, Attempt.correct,
+        )
+        .join(Exam, Exam.id == Attempt.exam_id)
+        .where(Exam.bank == bank.key)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    if version is not None:
+        query = query.where(Exam.bank_version == version)
+
+    def position(question_id, question_index, bank_version):
+        if question_id is None:
+            # Recorded before stable IDs: its position only holds on the same version.
+            return question_index if bank_version == bank.version else -1
+        return bank.positions.get(question_id, -1)
+
+    sessions, questions, options, correct = [], [], [], []
+    for rows in db.session.execute(query).partitions():
+        exam_ids, question_ids, indices, versions, answers, flags = zip(*rows)
+        sessions.append(np.fromiter(exam_ids, np.int64, len(rows)))
+        questions.append(np.fromiter(map(position, question_ids, indices, versions), np.int32, len(rows)))
+        options.append(np.fromiter((letter_index.get(answer, -1) for answer in answers), np.int8, len(rows)))
+        correct.append(np.fromiter(flags, np.bool_, len(rows)))
+
+    question_count = len(bank)
+    if not questions:
+        empty = np.zeros(0, np.int32)
+        return Responses(bank.key, empty, empty, empty.astype(np.int8), empty.astype(np.bool_), question_count)
+    session, question, option, correct = (
+        np.concatenate(sessions), np.concatenate(questions), np.concatenate(options), np.concatenate(correct),
+    )
+    # Drop answers to questions or options the bank no longer has.
+    keep = (question >= 0) & (question < question_count) & (option >= 0)
+    _, session = np.unique(session[keep], return_inverse=True)
+    return Responses(bank.key, session.astype(np.int32), question[keep], option[keep], correct[keep], question_count)
+
+
+def session_scores(responses):
+    """Return each session's proportion correct and its number of answers."""
+    np = require_numpy()
+    answered = np.bincount(responses.session, minlength=responses.session_count)
+    right = np.bincount(responses.session, weights=responses.correct, minlength=responses.session_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return right / answered, answered
+
+
+def option_counts(responses, mask=None):
+    """Count answers into a (questions x options) matrix, optionally for a subset."""
+    np = require_numpy()
+    cells = responses.question.astype(np.int64) * len(OPTIONS) + responses.option
+    if mask is not None:
+        cells = cells[mask]
+    counts = np.bincount(cells, minlength=responses.question_count * len(OPTIONS))
+    return counts.reshape(responses.question_count, len(OPTIONS))
+
+
+def distractor_analysis(responses, keys, group_fraction=0.27, min_answers=5, weak_share=0.05):
+    """Compute option attractiveness and upper/lower-group discrimination.
+
+    Sessions with at least `min_answers` answers are ranked by proportion
+    correct; the top and bottom `group_fraction` form the upper and lower
+    groups. An option's discrimination is the share of the upper group that
+    chose it minus the share of the lower group. Returns a dict of
+    (questions x options) arrays, plus `flag` strings per cell.
+    """
+    np = require_numpy()
+    counts = option_counts(responses)
+    totals = counts.sum(axis=1, keepdims=True)
+
+    scores, answered = session_scores(responses)
+    eligible = answered >= min_answers
+    upper = lower = np.zeros(responses.session_count, np.bool_)
+    if eligible.any():
+        low_cut, high_cut = np.quantile(scores[eligible], [group_fraction, 1 - group_fraction])
+        upper = eligible & (scores >= high_cut)
+        lower = eligible & (scores <= low_cut)
+    upper_counts = option_counts(responses, upper[responses.session])
+    lower_counts = option_counts(responses, lower[responses.session])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        attractiveness = counts / totals
+        upper_rate = upper_counts / upper_counts.sum(axis=1, keepdims=True)
+        lower_rate = lower_counts / lower_counts.sum(axis=1, keepdims=True)
+    discrimination = upper_rate - lower_rate
+
+    is_key = np.zeros_like(counts, np.bool_)
+    known = keys >= 0
+    is_key[np.flatnonzero(known), keys[known]] = True
+    answered_question = totals > 0
+    flags = np.full(counts.shape, "", dtype=object)
+    flags[~is_key & answered_question & (attractiveness < weak_share)] = "non_functioning"
+    flags[~is_key & (discrimination > 0)] = "attracts_upper_group"
+    flags[is_key & (discrimination < 0)] = "key_favours_lower_group"
+    return {
+        "chosen": counts,
+        "attractiveness": attractiveness,
+        "upper_rate": upper_rate,
+        "lower_rate": lower_rate,
+        "discrimination": discrimination,
+        "is_key": is_key,
+        "flag": flags,
+    }
+
+
+def answer_keys(bank):
+    """Return the key of every question as an index into OPTIONS (-1 if unknown)."""
+    np = require_numpy()
+    return np.array([OPTIONS.find(question["answer"]) for question in bank.questions], np.int8)
+
+
+def iter_distractor_rows(bank, analysis):
+    """Yield one report row per question and option the bank offers."""
+    for index, question in enumerate(bank.questions):
+        for column, option in enumerate(OPTIONS):
+            if option not in question["options"]:
+                continue
+            yield (
+                bank.key, bank.ids[index], option,
+                bool(analysis["is_key"][index, column]),
+                int(analysis["chosen"][index, column]),
+                _rounded(analysis["attractiveness"][index, column]),
+                _rounded(analysis["upper_rate"][index, column]),
+                _rounded(analysis["lower_rate"][index, column]),
+                _rounded(analysis["discrimination"][index, column]),
+                analysis["flag"][index, column],
+            )
+
+
+def _rounded(value):
+    return None if value != value else round(float(value), 4)  # NaN: nobody in the group answered
+
+
+def write_distractor_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(DISTRACTOR_COLUMNS)
+        written = 0
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def write_distractor_html(path, bank, rows, responses):
+    """Render the report as a standalone HTML page; returns the number of questions."""
+    questions = {}
+    for row in rows:
+        record = dict(zip(DISTRACTOR_COLUMNS, row))
+        question = bank.by_id(record["question_id"])
+        record["text"] = question["options"][record["option"]]
+        entry = questions.setdefault(
+            record["question_id"],
+            {"id": record["question_id"], "text": question["question"], "rows": [], "flagged": False},
+        )
+        entry["rows"].append(record)
+        entry["flagged"] = entry["flagged"] or bool(record["flag"])
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(
+            render_template(
+                "distractor_report.html",
+                bank=bank,
+                questions=questions.values(),
+                response_count=len(responses),
+                session_count=responses.session_count,
+            )
+        )
+    return len(questions)
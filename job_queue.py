@@ -0,0 +1,334 @@
+"""Durable queue of deferred tasks in a local SQLite file, with no broker.
+
+Requests enqueue expensive work (exports, reports, recalibration) and
+return at once; `flask --app app queue-worker` runs it in separate worker
+processes. A claimed task stays invisible to other workers until its lease
+runs out. The worker renews the lease while the task runs, so a worker that
+dies gives its task back after QUEUE_VISIBILITY_TIMEOUT seconds. Failed
+tasks are retried with exponential backoff up to their attempt limit. Each
+task type has a concurrency limit across all workers on the host.
+
+The queue file uses the WAL settings from sqlite_tuning.py, so enqueueing
+never waits on a running worker.
+"""
+import inspect
+import json
+import os
+import random
+import signal
+import sqlite3
+import threading
+import time
+
+from config import Config
+from scheduler import RUN_FAILED, RUN_RUNNING, RUN_SUCCEEDED, worker_id
+from sqlite_tuning import sqlite_pragmas
+
+TASK_QUEUED = "queued"
+TASK_RUNNING = RUN_RUNNING
+TASK_SUCCEEDED = RUN_SUCCEEDED
+TASK_FAILED = RUN_FAILED
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,  -- Queued: when it may run; running: when its lease ends
+    worker TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_tasks_ready ON tasks (status, type, available_at);
+"""
+
+
+BOOLEAN_STRINGS = {"1": True, "true": True, "yes": True, "on": True, "0": False, "false": False, "no": False, "off": False}
+
+
+def parse_concurrency(spec):
+    """Parse "export=2,calibrate=1" into {task type: limit}."""
+    limits = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            name, limit = entry.split("=", 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class TaskType:
+    """A function run by queue workers, with its retry and concurrency settings."""
+
+    def __init__(self, name, func, concurrency=1, max_attempts=None, timeout=None):
+        self.name = name
+        self.func = func
+        self.concurrency = parse_concurrency(Config.QUEUE_CONCURRENCY).get(name, concurrency)
+        self.max_attempts = max_attempts or Config.QUEUE_MAX_ATTEMPTS
+        self.timeout = timeout or Config.QUEUE_TASK_TIMEOUT
+
+    def coerce_payload(self, payload):
+        """Return the payload with form strings converted to the types of the parameters' defaults.
+
+        Raises TypeError if an argument is unknown, missing or of the wrong type.
+        """
+        signature = inspect.signature(self.func)
+        signature.bind(**payload)
+        return {
+            name: coerce_argument(name, value, signature.parameters[name].default) for name, value in payload.items()
+        }
+
+
+def coerce_argument(name, value, default):
+    """Convert an argument to the type of its parameter's default; str and None defaults take anything."""
+    if isinstance(default, bool):
+        if isinstance(value, str) and value.strip().lower() in BOOLEAN_STRINGS:
+            return BOOLEAN_STRINGS[value.strip().lower()]
+        if not isinstance(value, bool):
+            raise TypeError(f"{name} must be true or false, not {value!r}")
+    elif isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise TypeError(f"{name} must be a number, not {value!r}")
+        try:
+            return type(default)(value)
+        except ValueError:
+            raise TypeError(f"{name} must be a number, not {value!r}")
+    return value
+
+
+class Task:
+    """A claimed task; `attempts` identifies the claim, so a stale worker cannot settle it."""
+
+    def __init__(self, id, type, payload, attempts, worker):
+        self.id = id
+        self.type = type
+        self.payload = payload
+        self.attempts = attempts
+        self.worker = worker
+
+
+def retry_delay(attempts):
+    """Seconds before retrying after the given number of attempts: doubling, capped, half jittered."""
+    delay = min(Config.QUEUE_RETRY_MAX_DELAY, Config.QUEUE_RETRY_DELAY * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobQueue:
+    """The task table and the registered task types."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.types = {}
+        self._local = threading.local()
+
+    def task(self, name, concurrency=1, max_attempts=None, timeout=None):
+        """Register the decorated function as a task type."""
+        def register(func):
+            self.types[name] = TaskType(name, func, concurrency, max_attempts, timeout)
+            return func
+        return register
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            path = self.path or Config.QUEUE_PATH
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            connection = sqlite3.connect(path, timeout=Config.SQLITE_BUSY_TIMEOUT / 1000, isolation_level=None)
+            for name, value in sqlite_pragmas():
+                connection.execute(f"PRAGMA {name}={value}")
+            connection.executescript(SCHEMA)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def enqueue(self, name, payload=None, delay=0):
+        """Add a task of a registered type; returns its id."""
+        task_type = self.types[name]
+        payload = task_type.coerce_payload(payload or {})
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO tasks (type, payload, status, max_attempts, available_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, json.dumps(payload), TASK_QUEUED, task_type.max_attempts, now + delay, now),
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker, names=None):
+        """Lease the oldest ready task of a type below its concurrency limit, or return None."""
+        names = [name for name in (names or self.types) if name in self.types]
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Tasks whose worker died on their last attempt are not handed out again.
+            connection.execute(
+                "UPDATE tasks SET status = ?, finished_at = ?, error = 'Lease expired on the last attempt.' "
+                "WHERE status = ? AND available_at <= ? AND attempts >= max_attempts",
+                (TASK_FAILED, now, TASK_RUNNING, now),
+            )
+            running = dict(connection.execute(
+                "SELECT type, COUNT(*) FROM tasks WHERE status = ? AND available_at > ? GROUP BY type",
+                (TASK_RUNNING, now),
+            ).fetchall())
+            names = [name for name in names if running.get(name, 0) < self.types[name].concurrency]
+            row = None
+            if names:
+                row = connection.execute(
+                    f"SELECT id, type, payload, attempts FROM tasks "
+                    f"WHERE status IN (?, ?) AND available_at <= ? AND type IN ({', '.join('?' * len(names))}) "
+                    f"ORDER BY available_at, id LIMIT 1",
+                    (TASK_QUEUED, TASK_RUNNING, now, *names),
+                ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE tasks SET status = ?, attempts = attempts + 1, worker = ?, available_at = ? WHERE id = ?",
+                    (TASK_RUNNING, worker, now + Config.QUEUE_VISIBILITY_TIMEOUT, row[0]),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return Task(row[0], row[1], json.loads(row[2]), row[3] + 1, worker)
+
+    def _settle(self, task, sql, parameters):
+        cursor = self._connection().execute(
+            f"{sql} WHERE id = ? AND worker = ? AND attempts = ? AND status = ?",
+            (*parameters, task.id, task.worker, task.attempts, TASK_RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def extend(self, task):
+        """Renew a running task's lease; False if another worker has taken it over."""
+        return self._settle(task, "UPDATE tasks SET available_at = ?", (time.time() + Config.QUEUE_VISIBILITY_TIMEOUT,))
+
+    def complete(self, task, result=None):
+        return self._settle(
+            task, "UPDATE tasks SET status = ?, finished_at = ?, result = ?, error = NULL",
+            (TASK_SUCCEEDED, time.time(), None if result is None else str(result)[:1000]),
+        )
+
+    def fail(self, task, error):
+        """Record a failed attempt: queue a retry after a backoff, or give up after the last attempt."""
+        max_attempts = self.types[task.type].max_attempts if task.type in self.types else task.attempts
+        if task.attempts < max_attempts:
+            return self._settle(
+                task, "UPDATE tasks SET status = ?, available_at = ?, error = ?",
+                (TASK_QUEUED, time.time() + retry_delay(task.attempts), str(error)[:1000]),
+            )
+        return self._settle(
+            task, "UPDATE tasks SET status = ?, finished_at = ?, error = ?",
+            (TASK_FAILED, time.time(), str(error)[:1000]),
+        )
+
+    def get(self, task_id):
+        """Return a task's row as a dict, or None."""
+        cursor = self._connection().execute(
+            "SELECT id, type, payload, status, attempts, max_attempts, available_at, worker, "
+            "created_at, finished_at, result, error FROM tasks WHERE id = ?",
+            (task_id,),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        record = dict(zip([column[0] for column in cursor.description], row))
+        record["payload"] = json.loads(record["payload"])
+        return record
+
+    def depth(self, now=None):
+        """Return {task type: counts per status, plus the age in seconds of the oldest queued task}."""
+        now = now or time.time()
+        metrics = {}
+        for name, status, count, oldest in self._connection().execute(
+            "SELECT type, status, COUNT(*), MIN(created_at) FROM tasks GROUP BY type, status"
+        ):
+            entry = metrics.setdefault(name, {
+                TASK_QUEUED: 0, TASK_RUNNING: 0, TASK_SUCCEEDED: 0, TASK_FAILED: 0, "oldest_queued_seconds": 0.0,
+            })
+            entry[status] = count
+            if status == TASK_QUEUED:
+                entry["oldest_queued_seconds"] = round(now - oldest, 1)
+        return metrics
+
+    def prune(self, days=None):
+        """Delete finished tasks older than JOB_HISTORY_DAYS; returns how many."""
+        cutoff = time.time() - (days or Config.JOB_HISTORY_DAYS) * 86400
+        cursor = self._connection().execute(
+            "DELETE FROM tasks WHERE status IN (?, ?) AND finished_at < ?", (TASK_SUCCEEDED, TASK_FAILED, cutoff)
+        )
+        return cursor.rowcount
+
+
+task_queue = JobQueue()
+
+
+def run_task(app, queue, task):
+    """Run a claimed task in a thread, renewing its lease until it ends or times out.
+
+    Returns False if the task timed out: its thread cannot be stopped, so
+    the worker should exit and be replaced.
+    """
+    task_type = queue.types[task.type]
+    outcome = {}
+
+    def target():
+        try:
+            with app.app_context():
+                outcome["result"] = task_type.func(**task.payload)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, name=f"task-{task.type}", daemon=True)
+    started = time.monotonic()
+    thread.start()
+    while thread.is_alive() and time.monotonic() - started < task_type.timeout:
+        thread.join(min(Config.QUEUE_VISIBILITY_TIMEOUT / 3, task_type.timeout - (time.monotonic() - started)))
+        if thread.is_alive() and not queue.extend(task):
+            app.logger.warning(f"Task {task.id} ({task.type}) lost its lease; another worker may run it.")
+    elapsed = time.monotonic() - started
+
+    if thread.is_alive():
+        queue.fail(task, f"Still running after {task_type.timeout}s.")
+        app.logger.error(f"Task {task.id} ({task.type}) timed out after {task_type.timeout}s.")
+        return False
+    if "error" in outcome:
+        queue.fail(task, outcome["error"])
+        app.logger.error(f"Task {task.id} ({task.type}) attempt {task.attempts} failed: {outcome['error']}")
+    else:
+        queue.complete(task, outcome.get("result"))
+        app.logger.info(f"Task {task.id} ({task.type}) finished in {elapsed:.2f}s: {outcome.get('result')}")
+    return True
+
+
+def run_worker(app, queue=None, names=None, stop=None):
+    """Claim and run tasks until `stop` is set or a task times out."""
+    queue = queue or task_queue
+    stop = stop or threading.Event()
+    worker = worker_id()
+    app.logger.info(f"Queue worker {worker} started for {', '.join(names or queue.types)}.")
+    while not stop.is_set():
+        try:
+            task = queue.claim(worker, names)
+        except sqlite3.OperationalError as e:
+            app.logger.error(f"Queue worker {worker} could not claim a task: {e}")
+            task = None
+        if task is None:
+            stop.wait(Config.QUEUE_POLL_INTERVAL)
+        elif not run_task(app, queue, task):
+            return False
+    return True
+
+
+def worker_process(names):
+    """Entry point of a spawned worker process."""
+    from app import create_app
+
+    app = create_app()  # Its views import the task types.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    raise SystemExit(0 if run_worker(app, task_queue, names, stop) else 1)
@@ -0,0 +1,66 @@
+"""Periodic jobs run by the scheduler (see scheduler.py).
+
+Importing this module registers them; `start_background_tasks()` in app.py
+does so in every worker.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+
+from banks import TENANTS, get_bank
+from config import Config
+from exams import expire_idle_practice, sweep_expired_exams
+from history import snapshot_progress
+from job_queue import task_queue
+from leaderboard import PERIODS, board_name, get_leaderboard
+from models import db, JobRun
+from scheduler import scheduler
+from timings import flush_response_times
+
+
+@scheduler.job("expire-exams", interval=Config.EXAM_SWEEP_INTERVAL, timeout=120)
+def expire_exams():
+    """Expire timed exams past their deadline."""
+    return sweep_expired_exams()
+
+
+@scheduler.job("expire-idle-practice", interval=3600)
+def expire_practice():
+    """Close practice sessions abandoned for longer than a browser session lives."""
+    return expire_idle_practice()
+
+
+@scheduler.job("snapshot-progress", interval=Config.PROGRESS_SNAPSHOT_INTERVAL)
+def progress_snapshots():
+    """Refresh today's and yesterday's per-user progress rollup."""
+    return snapshot_progress()
+
+
+@scheduler.job("prune-job-runs", interval=86400)
+def prune_job_runs():
+    """Delete run history and finished queued tasks older than JOB_HISTORY_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=Config.JOB_HISTORY_DAYS)
+    result = db.session.execute(delete(JobRun).where(JobRun.started_at < cutoff))
+    db.session.commit()
+    return result.rowcount + task_queue.prune()
+
+
+# Each worker holds its own unflushed timings.
+@scheduler.job(
+    "flush-response-times", interval=Config.RESPONSE_TIME_FLUSH_INTERVAL, timeout=60, leader_only=False
+)
+def flush_timings():
+    """Merge this worker's time-on-question sketches into the shared ones."""
+    return flush_response_times()
+
+
+# Caches are per process, so every worker warms its own.
+@scheduler.job("warm-caches", interval=Config.LEADERBOARD_CACHE_TTL, timeout=60, leader_only=False)
+def warm_caches():
+    """Reload each tenant's global leaderboards and default bank before requests need them."""
+    now = datetime.utcnow()
+    for tenant in TENANTS:
+        for period in PERIODS:
+            get_leaderboard(board_name(None, tenant), period, now, refresh=True)
+        get_bank(tenant=tenant)
+    return len(TENANTS)
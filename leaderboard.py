@@ -0,0 +1,133 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import Config
+from models import db, LeaderboardEntry
+
+PERIODS = ("daily", "weekly", "all")
+GLOBAL_BOARD = "global"
+
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+class TopK:
+    """Best score per user, keeping only the k highest in rank order."""
+
+    def __init__(self, k):
+        self.k = k
+        self.loaded_at = time.monotonic()
+        self._ranked = []  # Sorted (-score, achieved_at, user_email) tuples
+        self._by_user = {}
+
+    def offer(self, user_email, score, achieved_at):
+        """Insert or improve a user's score; returns True if the top k changed."""
+        current = self._by_user.get(user_email)
+        item = (-score, achieved_at, user_email)
+        if current is not None:
+            if current <= item:
+                return False
+            self._ranked.remove(current)
+        elif len(self._ranked) >= self.k and item >= self._ranked[-1]:
+            return False
+
+        bisect.insort(self._ranked, item)
+        self._by_user[user_email] = item
+        if len(self._ranked) > self.k:
+            dropped = self._ranked.pop()
+            del self._by_user[dropped[2]]
+        return True
+
+    def entries(self):
+        """Return (user_email, score, achieved_at) tuples, best first."""
+        return [(user_email, -neg_score, achieved_at) for neg_score, achieved_at, user_email in self._ranked]
+
+
+def period_key(period, when):
+    """Return the rollup key of the period containing `when`."""
+    if period == "daily":
+        return when.strftime("%Y-%m-%d")
+    if period == "weekly":
+        year, week, _ = when.isocalendar()
+        return f"{year}-W{week:02d}"
+    return "all"
+
+
+def board_name(cohort=None, organization=None):
+    """Return the board for a cohort, or the global board, of an organization.
+
+    Other organizations' boards are prefixed with their name, so their rows
+    and cached top lists never mix with the default organization's.
+    """
+    board = f"cohort:{cohort}" if cohort else GLOBAL_BOARD
+    if organization and organization != Config.DEFAULT_TENANT:
+        board = f"{organization}/{board}"
+    return board
+
+
+def record_result(user_email, score, finished_at, cohort=None, organization=None):
+    """Fold a finished exam into every board and period it belongs to.
+
+    Each entry is one upsert that only replaces a lower score, so concurrent
+    results for the same user cannot both insert or overwrite a better score.
+    """
+    insert = postgresql_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+    boards = [board_name(None, organization)] + ([board_name(cohort, organization)] if cohort else [])
+    improved = []
+    for board in boards:
+        for period in PERIODS:
+            key = period_key(period, finished_at)
+            statement = insert(LeaderboardEntry).values(
+                board=board, period=key, user_email=user_email, score=score, achieved_at=finished_at,
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=["board", "period", "user_email"],
+                set_={"score": statement.excluded.score, "achieved_at": statement.excluded.achieved_at},
+                where=LeaderboardEntry.score < statement.excluded.score,
+            )
+            # A row comes back only if this result was inserted or raised the score.
+            if db.session.execute(statement.returning(LeaderboardEntry.id)).first() is not None:
+                improved.append((board, key))
+    db.session.commit()
+
+    # Only boards this worker already holds need patching; others load fresh.
+    with _boards_lock:
+        for board_key in improved:
+            top = _boards.get(board_key)
+            if top is not None:
+                top.offer(user_email, score, finished_at)
+
+
+def get_leaderboard(board, period, now, refresh=False):
+    """Return the top entries of a board, served from memory when fresh.
+
+    `refresh` reloads the board from the rollup table even if it is cached.
+    """
+    board_key = (board, period_key(period, now))
+    with _boards_lock:
+        top = _boards.get(board_key)
+        if not refresh and top is not None and time.monotonic() - top.loaded_at < Config.LEADERBOARD_CACHE_TTL:
+            return top.entries()
+
+    # Rows come back in index order, so this reads k rows rather than sorting every score.
+    rows = (
+        LeaderboardEntry.query.filter_by(board=board_key[0], period=board_key[1])
+        .order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.achieved_at)
+        .limit(Config.LEADERBOARD_SIZE)
+        .all()
+    )
+    top = TopK(Config.LEADERBOARD_SIZE)
+    for row in rows:
+        top.offer(row.user_email, row.score, row.achieved_at)
+
+    with _boards_lock:
+        # Drop boards whose period has rolled over or that nobody has viewed recently.
+        cutoff = time.monotonic() - Config.LEADERBOARD_CACHE_TTL
+        for stale_key in [key for key, cached in _boards.items() if cached.loaded_at < cutoff]:
+            del _boards[stale_key]
+        _boards[board_key] = top
+    return top.entries()
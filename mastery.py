@@ -0,0 +1,89 @@
+import random
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from blueprints import AREAS, allocate, sample
+from config import Config
+from models import db, Mastery
+
+
+def update_mastery(user_email, areas, correct, organization=None):
+    """Fold one graded answer into the user's mastery of each of its areas.
+
+    Each area keeps exponentially decayed answered and correct counts, so an
+    update is one row write per area and recent answers weigh the most.
+    """
+    decay = Config.MASTERY_DECAY
+    organization = organization or Config.DEFAULT_TENANT
+    now = datetime.utcnow()
+    owner = (Mastery.organization == organization, Mastery.user_email == user_email)
+    for area in areas:
+        values = {
+            "answered": Mastery.answered * decay + 1,
+            "correct": Mastery.correct * decay + (1 if correct else 0),
+            "updated_at": now,
+        }
+        result = db.session.execute(
+            update(Mastery).where(*owner, Mastery.area == area).values(values)
+        )
+        if result.rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(
+                    Mastery(
+                        organization=organization, user_email=user_email, area=area,
+                        answered=1, correct=1 if correct else 0, updated_at=now,
+                    )
+                )
+        except IntegrityError:
+            # Created by a concurrent request; apply the update to it instead.
+            db.session.execute(
+                update(Mastery).where(*owner, Mastery.area == area).values(values)
+            )
+    db.session.commit()
+
+
+def mastery_score(answered, correct):
+    """Estimate the chance of a correct answer, starting from 50% with no answers."""
+    return (correct + 1) / (answered + 2)
+
+
+def get_mastery(user_email, organization=None):
+    """Return {area: (score, decayed answer count)} for every study area."""
+    rows = {
+        row.area: row
+        for row in Mastery.query.filter_by(organization=organization or Config.DEFAULT_TENANT, user_email=user_email)
+    }
+    return {
+        area: (
+            mastery_score(rows[area].answered, rows[area].correct) if area in rows else mastery_score(0, 0),
+            rows[area].answered if area in rows else 0.0,
+        )
+        for area in AREAS
+    }
+
+
+def weak_areas(bank, mastery, area_count=None):
+    """Return the user's weakest areas that the bank has questions for, weakest first."""
+    area_count = area_count or Config.WEAK_AREA_COUNT
+    candidates = [area for area in AREAS if bank.area_pools.get(area)]
+    # Ties, such as areas never practised, go to the least practised one.
+    candidates.sort(key=lambda area: (mastery[area][0], mastery[area][1]))
+    return candidates[:area_count]
+
+
+def draw_weak_area_questions(bank, mastery, question_count=None, rng=random):
+    """Build a practice set from the weakest areas' pools, in proportion to how weak each is."""
+    question_count = question_count or Config.WEAK_AREA_QUESTIONS
+    areas = weak_areas(bank, mastery)
+    weights = {area: 1 - mastery[area][0] for area in areas}
+    pool_sizes = {area: len(bank.area_pools[area]) for area in areas}
+    quotas = allocate(question_count, weights, pool_sizes)
+    indices = []
+    for area, quota in quotas.items():
+        indices.extend(sample(bank.area_pools[area], quota, rng))
+    rng.shuffle(indices)
+    return indices
@@ -6,7 +6,153 @@ db = SQLAlchemy()
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    organization = db.Column(db.String(40), nullable=False, default='default', server_default='default')
+    email = db.Column(db.String(120), nullable=False)
     password = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # The same email may register separately with each organization.
+        db.UniqueConstraint('organization', 'email', name='uq_users_organization_email'),
+    )
+
+
+# A timed exam or a practice session; practice sessions have no deadline.
+class Exam(db.Model):
+    __tablename__ = 'exams'
+    id = db.Column(db.Integer, primary_key=True)
+    organization = db.Column(db.String(40), nullable=False, default='default', server_default='default')
+    user_email = db.Column(db.String(120), nullable=False, index=True)
+    mode = db.Column(db.String(20), nullable=False, default='exam')
+    bank = db.Column(db.String(40), nullable=False)
+    bank_version = db.Column(db.String(64), nullable=False)
+    cohort = db.Column(db.String(80))
+    quiz_indices = db.Column(db.JSON, nullable=False)
+    option_seed = db.Column(db.String(16))
+    question_count = db.Column(db.Integer, nullable=False)
+    answers = db.Column(db.JSON, nullable=False, default=dict)
+    answered_questions = db.Column(db.Integer, nullable=False, default=0)
+    correct_answers = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='active')
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    deadline = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # The expiry sweeper only ever looks for active exams past their deadline.
+        db.Index('ix_exams_status_deadline', 'status', 'deadline'),
+        # Covers the history listing so pages are read from the index alone.
+        db.Index(
+            'ix_exams_history', 'organization', 'user_email', 'finished_at', 'id',
+            'mode', 'status', 'question_count', 'answered_questions', 'correct_answers',
+        ),
+    )
+
+
+class Attempt(db.Model):
+    __tablename__ = 'attempts'
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False, index=True)
+    user_email = db.Column(db.String(120), nullable=False)
+    question_index = db.Column(db.Integer, nullable=False)  # Position in the session's bank version
+    question_id = db.Column(db.String(40))  # Stable ID (see banks.question_id); empty on older rows
+    answer = db.Column(db.String(5), nullable=False)
+    correct = db.Column(db.Boolean, nullable=False)
+    answered_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One answer per question and session, however many requests submit it at once.
+        db.UniqueConstraint('exam_id', 'question_index', name='uq_attempts_question'),
+    )
+
+
+# Rollup of each user's best score per leaderboard and period.
+class LeaderboardEntry(db.Model):
+    __tablename__ = 'leaderboard_entries'
+    id = db.Column(db.Integer, primary_key=True)
+    board = db.Column(db.String(100), nullable=False)
+    period = db.Column(db.String(20), nullable=False)
+    user_email = db.Column(db.String(120), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    achieved_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('board', 'period', 'user_email', name='uq_leaderboard_user'),
+        db.Index('ix_leaderboard_rank', 'board', 'period', db.text('score DESC'), 'achieved_at'),
+    )
+
+
+# Lease that makes one process the scheduler leader across workers and hosts.
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+    name = db.Column(db.String(40), primary_key=True)
+    owner = db.Column(db.String(120), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class JobRun(db.Model):
+    __tablename__ = 'job_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(40), nullable=False)
+    worker = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.String(200))
+    error = db.Column(db.String(500))
+
+    __table_args__ = (
+        db.Index('ix_job_runs_job_started', 'job', 'started_at'),
+    )
+
+
+# Daily rollup of each user's answers, rebuilt by the scheduler.
+class ProgressSnapshot(db.Model):
+    __tablename__ = 'progress_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    organization = db.Column(db.String(40), nullable=False, default='default', server_default='default')
+    user_email = db.Column(db.String(120), nullable=False)
+    day = db.Column(db.String(10), nullable=False)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    answered_questions = db.Column(db.Integer, nullable=False, default=0)
+    correct_answers = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('organization', 'user_email', 'day', name='uq_progress_user_day'),
+        db.Index('ix_progress_day', 'day'),
+    )
+
+
+# Mergeable time-on-question sketch (see timings.py), one per stable question ID.
+# Replaces response_time_sketches, which were keyed by position and mixed up questions across bank edits.
+class ResponseTimeSketch(db.Model):
+    __tablename__ = 'question_time_sketches'
+    id = db.Column(db.Integer, primary_key=True)
+    bank = db.Column(db.String(40), nullable=False)
+    question_id = db.Column(db.String(40), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    zero_count = db.Column(db.Integer, nullable=False, default=0)
+    bins = db.Column(db.JSON, nullable=False, default=dict)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('bank', 'question_id', name='uq_question_time_question'),
+    )
+
+
+# A user's decayed answer counts per study area (see mastery.py).
+class Mastery(db.Model):
+    __tablename__ = 'mastery'
+    id = db.Column(db.Integer, primary_key=True)
+    organization = db.Column(db.String(40), nullable=False, default='default', server_default='default')
+    user_email = db.Column(db.String(120), nullable=False)
+    area = db.Column(db.String(40), nullable=False)
+    answered = db.Column(db.Float, nullable=False, default=0)
+    correct = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('organization', 'user_email', 'area', name='uq_mastery_user_area'),
+    )
@@ -0,0 +1,54 @@
+import hashlib
+import secrets
+
+from config import Config
+
+
+def new_seed():
+    """Return a short random seed for a session's option order."""
+    return secrets.token_hex(4)
+
+
+def option_order(seed, question_id, letters):
+    """Return the canonical option letters in the order they are displayed.
+
+    The order is a pure function of the session seed and question ID, so it
+    is recomputed on every request instead of being stored.
+    """
+    letters = sorted(letters)
+    if not seed or not Config.SHUFFLE_OPTIONS:
+        return letters
+    digest = hashlib.blake2b(f"{seed}:{question_id}".encode(), digest_size=8).digest()
+    rank = int.from_bytes(digest, "big")
+    # Decode the hash as a permutation index (Lehmer code).
+    order = []
+    while letters:
+        rank, position = divmod(rank, len(letters))
+        order.append(letters.pop(position))
+    return order
+
+
+def display_letters(count):
+    return [chr(ord("A") + position) for position in range(count)]
+
+
+def displayed_options(question, seed, question_id):
+    """Return (display letter, option text) pairs in display order."""
+    order = option_order(seed, question_id, question["options"])
+    return [
+        (letter, question["options"][canonical])
+        for letter, canonical in zip(display_letters(len(order)), order)
+    ]
+
+
+def to_canonical(question, seed, question_id, letter):
+    """Map a displayed letter back to the question's own option letter."""
+    order = option_order(seed, question_id, question["options"])
+    position = ord(letter) - ord("A") if len(letter) == 1 else -1
+    return order[position] if 0 <= position < len(order) else None
+
+
+def to_display(question, seed, question_id, canonical):
+    """Map one of the question's option letters to the letter it was shown as."""
+    order = option_order(seed, question_id, question["options"])
+    return display_letters(len(order))[order.index(canonical)]
@@ -0,0 +1,134 @@
+"""Password hashing with a work factor calibrated to the machine.
+
+At startup `calibrate()` picks the bcrypt cost, or the number of Argon2id
+passes, that makes one hash take about PASSWORD_HASH_TARGET_MS here.
+Hashes stored with another scheme or work factor are replaced on the
+user's next successful login (see db_utils.validate_user).
+
+Argon2id is optional and needs argon2-cffi (`pip install argon2-cffi`).
+"""
+import re
+import statistics
+import threading
+import time
+
+import bcrypt
+
+from config import Config
+
+SCHEMES = ("bcrypt", "argon2id")
+# Calibration bounds; below these a hash is too weak whatever the budget.
+BCRYPT_ROUNDS = (10, 16)
+ARGON2_PASSES = (2, 10)
+BCRYPT_PATTERN = re.compile(rb"^\$2[aby]\$(\d\d)\$")
+
+_work_factor = None
+_calibration_lock = threading.Lock()
+
+
+def require_argon2():
+    try:
+        import argon2
+    except ImportError:
+        raise RuntimeError("Argon2id password hashing requires argon2-cffi: pip install argon2-cffi")
+    return argon2
+
+
+def _argon2_hasher(passes):
+    argon2 = require_argon2()
+    return argon2.PasswordHasher(
+        time_cost=passes,
+        memory_cost=Config.ARGON2_MEMORY_KIB,
+        parallelism=Config.ARGON2_PARALLELISM,
+        type=argon2.Type.ID,
+    )
+
+
+def _median_seconds(func, runs=3):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms=None, scheme=None):
+    """Time a hash on this machine and set the work factor that fits the target.
+
+    bcrypt doubles its cost with every round and Argon2 adds a fixed cost
+    per pass, so a hash at the lowest setting predicts the others. A
+    non-zero PASSWORD_WORK_FACTOR is used as is.
+    """
+    global _work_factor
+    scheme = scheme or Config.PASSWORD_SCHEME
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown password scheme: {scheme}")
+    target = (target_ms or Config.PASSWORD_HASH_TARGET_MS) / 1000
+    if Config.PASSWORD_WORK_FACTOR:
+        factor = Config.PASSWORD_WORK_FACTOR
+    elif scheme == "argon2id":
+        low, high = ARGON2_PASSES
+        hasher = _argon2_hasher(low)
+        per_pass = _median_seconds(lambda: hasher.hash("calibration")) / low
+        factor = max(low, min(high, int(target / per_pass)))
+    else:
+        low, high = BCRYPT_ROUNDS
+        elapsed = _median_seconds(lambda: bcrypt.hashpw(b"calibration", bcrypt.gensalt(low)))
+        factor = low
+        while factor < high and elapsed * 2 <= target:
+            factor += 1
+            elapsed *= 2
+    _work_factor = factor
+    return factor
+
+
+def work_factor():
+    """Return the calibrated work factor, calibrating on first use."""
+    if _work_factor is None:
+        with _calibration_lock:
+            if _work_factor is None:
+                calibrate()
+    return _work_factor
+
+
+def hash_password(password):
+    """Hash a password with the configured scheme and work factor; returns bytes."""
+    if Config.PASSWORD_SCHEME == "argon2id":
+        return _argon2_hasher(work_factor()).hash(password).encode("utf-8")
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(work_factor()))
+
+
+def check_password(password, stored_hash):
+    """Check a password against a stored bcrypt or Argon2id hash."""
+    if stored_hash.startswith(b"$argon2"):
+        argon2 = require_argon2()
+        try:
+            # The hash records its own parameters, so any work factor verifies.
+            return argon2.PasswordHasher().verify(stored_hash.decode("utf-8"), password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    return bcrypt.checkpw(password.encode("utf-8"), stored_hash)
+
+
+def needs_rehash(stored_hash):
+    """Check whether a stored hash should be redone with the configured settings.
+
+    Weaker hashes are always upgraded. Stronger ones are only replaced once
+    they cost over twice the target, so workers or hosts whose calibrations
+    differ by one step do not keep rehashing each other's hashes.
+    """
+    factor = work_factor()
+    if Config.PASSWORD_SCHEME == "argon2id":
+        if not stored_hash.startswith(b"$argon2id$"):
+            return True
+        parameters = require_argon2().extract_parameters(stored_hash.decode("utf-8"))
+        return (
+            parameters.memory_cost != Config.ARGON2_MEMORY_KIB
+            or parameters.parallelism != Config.ARGON2_PARALLELISM
+            or not factor <= parameters.time_cost <= 2 * factor
+        )
+    match = BCRYPT_PATTERN.match(stored_hash)
+    if match is None:
+        return True
+    return not factor <= int(match.group(1)) <= factor + 1
@@ -0,0 +1,170 @@
+"""In-process publish/subscribe with coalescing, for live dashboards.
+
+Messages are published to a topic under a key, e.g. a cohort and a
+learner. Each topic keeps the latest message per key, which new
+subscribers receive as a snapshot. Each subscriber has a bounded buffer
+that also keeps only the latest message per key, so a burst of updates
+from one learner reaches a dashboard as a single one. When a buffer
+overflows, the subscriber is marked as lagging and should resend the
+snapshot instead.
+
+A relay carries messages between worker processes. `UnixRelay` stands in
+for a broker such as Redis pub/sub on a single host: every process binds
+a datagram socket in a shared directory and sends each message to all the
+others.
+"""
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class Subscription:
+    """A subscriber's pending messages, coalesced by key and bounded in number."""
+
+    def __init__(self, topic, max_pending):
+        self.topic = topic
+        self.max_pending = max_pending
+        self.lagged = False
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+
+    def offer(self, key, message):
+        with self._condition:
+            self._pending.pop(key, None)
+            self._pending[key] = message
+            if len(self._pending) > self.max_pending:
+                self._pending.clear()
+                self.lagged = True
+            self._condition.notify()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds for messages; returns (messages, lagged) and clears them."""
+        with self._condition:
+            if not self._pending and not self.lagged:
+                self._condition.wait(timeout)
+            messages, self._pending = list(self._pending.values()), OrderedDict()
+            lagged, self.lagged = self.lagged, False
+        return messages, lagged
+
+
+class Bus:
+    """Topics with their latest message per key and their subscribers."""
+
+    def __init__(self, topic_ttl=None):
+        self.topic_ttl = topic_ttl or Config.PROCTOR_TOPIC_TTL
+        self.relay = None
+        self._latest = {}
+        self._touched = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic, max_pending=None):
+        """Register a subscriber; returns it and the topic's snapshot."""
+        subscription = Subscription(topic, max_pending or Config.PROCTOR_BUFFER_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            return subscription, list(self._latest.get(topic, {}).values())
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.topic, None)
+
+    def snapshot(self, topic):
+        with self._lock:
+            return list(self._latest.get(topic, {}).values())
+
+    def publish(self, topic, key, message, relay=True):
+        """Store a topic's latest message for a key and offer it to its subscribers."""
+        now = time.monotonic()
+        with self._lock:
+            self._latest.setdefault(topic, {})[key] = message
+            self._touched[topic] = now
+            subscribers = list(self._subscribers.get(topic, ()))
+            # Forget rooms nobody has published to for a while.
+            for stale in [name for name, touched in self._touched.items() if now - touched > self.topic_ttl]:
+                del self._touched[stale]
+                self._latest.pop(stale, None)
+        for subscription in subscribers:
+            subscription.offer(key, message)
+        if relay and self.relay is not None:
+            self.relay.send(topic, key, message)
+
+
+class UnixRelay:
+    """Fans messages out to the other processes on this host over Unix datagram sockets."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.dropped = 0
+        self._peers = []
+        self._peers_listed_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left behind by a previous process with this pid.
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    def _list_peers(self):
+        now = time.monotonic()
+        if now - self._peers_listed_at > 1:
+            self._peers = [path for path in glob.glob(os.path.join(self.directory, "*.sock")) if path != self.path]
+            self._peers_listed_at = now
+        return self._peers
+
+    def send(self, topic, key, message):
+        data = json.dumps([topic, key, message]).encode("utf-8")
+        for peer in self._list_peers():
+            try:
+                self._sender.sendto(data, peer)
+            except BlockingIOError:
+                self.dropped += 1  # The peer is not keeping up; never block a request on it.
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(peer)  # Its process is gone.
+                except OSError:
+                    pass
+                self._peers_listed_at = 0.0
+
+    def listen(self, bus):
+        """Publish every message from the other processes on `bus`, from a daemon thread."""
+        def run():
+            while True:
+                data = self._socket.recv(65536)
+                try:
+                    topic, key, message = json.loads(data)
+                except ValueError:
+                    continue
+                bus.publish(topic, key, message, relay=False)
+
+        thread = threading.Thread(target=run, name="pubsub-relay", daemon=True)
+        thread.start()
+        return thread
+
+
+bus = Bus()
+
+
+def start_relay(app):
+    """Connect this process's bus to the other workers on the host, if supported."""
+    if not hasattr(socket, "AF_UNIX"):
+        app.logger.info("Unix sockets are unavailable; live dashboards only see this process.")
+        return None
+    try:
+        bus.relay = UnixRelay(app.config["PROCTOR_RELAY_DIR"])
+    except OSError as e:
+        app.logger.error(f"Could not start the pub/sub relay: {e}")
+        return None
+    bus.relay.listen(bus)
+    return bus.relay
@@ -140,7 +140,7 @@ quiz = [
             "D": "Evokes Awareness",
         },
         "answer": "B",
-        "explanation": "Client autonomy is central to client growth, and coaches should support clients in setting their own goals and actions (ICF Core Competency 8).",
+        "explanation": "Client autonomy is central to client growth, and coaches should support clients in setting their own goals and actions (ICF Core Competency 8). Reference: ICF Core Competency 8: Facilitates Client Growth.",
     },
     {
         "question": "Which of the following situations requires a coach to terminate the coaching relationship?",
@@ -197,17 +197,6 @@ quiz = [
         "answer": "B",
         "explanation": "A coach should welcome feedback to ensure the coaching process meets the client's needs and expectations (ICF Core Competency 3).",
     },
-    {
-        "question": "Which competency best describes a coach's role in maintaining client autonomy in the coaching process?",
-        "options": {
-            "A": "Establishes and Maintains Agreements",
-            "B": "Facilitates Client Growth",
-            "C": "Listens Actively",
-            "D": "Evokes Awareness",
-        },
-        "answer": "B",
-        "explanation": "Client autonomy is central to client growth, and coaches should support clients in setting their own goals and actions (ICF Core Competency 8). Reference: ICF Core Competency 8: Facilitates Client Growth.",
-    },
     {
         "question": "A coach realizes they have a personal bias against the client's profession. What is the best course of action?",
         "options": {
@@ -0,0 +1,189 @@
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, JobRun, SchedulerLease
+
+RUN_RUNNING = "running"
+RUN_SUCCEEDED = "succeeded"
+RUN_FAILED = "failed"
+RUN_TIMED_OUT = "timed_out"
+
+
+class Job:
+    """A function run every `interval` seconds, give or take `jitter`."""
+
+    def __init__(self, name, func, interval, timeout=None, jitter=None, leader_only=True):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout or Config.JOB_TIMEOUT
+        self.jitter = Config.SCHEDULER_JITTER if jitter is None else jitter
+        self.leader_only = leader_only
+
+    def next_delay(self):
+        """Return the seconds until the next run, spread by the jitter fraction."""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def worker_id():
+    """Identify this process; unique across hosts, forks and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+
+
+class Scheduler:
+    """Runs registered jobs from a daemon thread in every worker process.
+
+    Leader-only jobs run in the one process holding the database lease; it is
+    renewed on every tick, and another process takes over once it lapses.
+    Jobs with `leader_only=False`, such as cache warming, run in every
+    process. Each run is recorded in `job_runs`.
+    """
+
+    def __init__(self, lease_name="scheduler"):
+        self.lease_name = lease_name
+        self.worker = worker_id()
+        self.jobs = {}
+        self._running = {}
+
+    def job(self, name, interval, timeout=None, jitter=None, leader_only=True):
+        """Register the decorated function as a periodic job."""
+        def register(func):
+            self.jobs[name] = Job(name, func, interval, timeout, jitter, leader_only)
+            return func
+        return register
+
+    def is_leader(self, now=None):
+        """Take or renew the lease; return True if this process holds it."""
+        now = now or datetime.utcnow()
+        expires_at = now + timedelta(seconds=Config.SCHEDULER_LEASE)
+        result = db.session.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == self.lease_name,
+                or_(SchedulerLease.owner == self.worker, SchedulerLease.expires_at < now),
+            )
+            .values(owner=self.worker, expires_at=expires_at)
+        )
+        db.session.commit()
+        if result.rowcount:
+            return True
+        if db.session.get(SchedulerLease, self.lease_name) is not None:
+            return False
+        try:
+            db.session.add(SchedulerLease(name=self.lease_name, owner=self.worker, expires_at=expires_at))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()  # Another process created it first.
+            return False
+
+    def run_job(self, app, job):
+        """Run a job once in its own thread, waiting at most its timeout.
+
+        Python threads cannot be killed, so a run that times out is recorded
+        as such and left to finish; the job is not started again until it has.
+        """
+        with app.app_context():
+            run = JobRun(job=job.name, worker=self.worker, status=RUN_RUNNING)
+            db.session.add(run)
+            db.session.commit()
+            run_id = run.id
+        outcome = {}
+
+        def target():
+            try:
+                with app.app_context():
+                    outcome["result"] = job.func()
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, name=f"job-{job.name}", daemon=True)
+        started = time.monotonic()
+        thread.start()
+        while thread.is_alive() and time.monotonic() - started < job.timeout:
+            thread.join(min(Config.SCHEDULER_TICK, job.timeout - (time.monotonic() - started)))
+            if thread.is_alive() and job.leader_only:
+                # Keep the lease through long runs so no other process starts the job.
+                with app.app_context():
+                    self.is_leader()
+        elapsed = time.monotonic() - started
+
+        if thread.is_alive():
+            self._running[job.name] = thread
+            status, error = RUN_TIMED_OUT, f"Still running after {job.timeout}s."
+            app.logger.error(f"Job {job.name} timed out after {job.timeout}s.")
+        elif "error" in outcome:
+            status, error = RUN_FAILED, str(outcome["error"])
+            app.logger.error(f"Job {job.name} failed: {outcome['error']}")
+        else:
+            status, error = RUN_SUCCEEDED, None
+            app.logger.info(f"Job {job.name} finished in {elapsed:.2f}s: {outcome.get('result')}")
+
+        with app.app_context():
+            result = outcome.get("result")
+            db.session.execute(
+                update(JobRun)
+                .where(JobRun.id == run_id)
+                .values(
+                    status=status,
+                    finished_at=datetime.utcnow(),
+                    result=None if result is None else str(result)[:200],
+                    error=error[:500] if error else None,
+                )
+            )
+            db.session.commit()
+        return status
+
+    def start(self, app):
+        """Start the scheduler thread; returns an Event that stops it."""
+        # Workers forked from a preloaded master must not share its identity.
+        self.worker = worker_id()
+        stop = threading.Event()
+        now = time.monotonic()
+        # Spread the first runs so workers and jobs do not all start at once.
+        due = {name: now + random.uniform(0, job.interval) for name, job in self.jobs.items()}
+
+        def run():
+            leader = False
+            while not stop.wait(Config.SCHEDULER_TICK):
+                try:
+                    with app.app_context():
+                        was_leader, leader = leader, self.is_leader()
+                    if leader != was_leader:
+                        app.logger.info(f"Scheduler {self.worker} {'is' if leader else 'is no longer'} the leader.")
+                    for name, job in self.jobs.items():
+                        if time.monotonic() < due[name] or (job.leader_only and not leader):
+                            continue
+                        previous = self._running.get(name)
+                        if previous is not None and previous.is_alive():
+                            continue
+                        self._running.pop(name, None)
+                        self.run_job(app, job)
+                        due[name] = time.monotonic() + job.next_delay()
+                except Exception as e:
+                    app.logger.error(f"Scheduler error: {e}")
+
+        thread = threading.Thread(target=run, name="scheduler", daemon=True)
+        thread.start()
+        app.logger.info(f"Scheduler started with {len(self.jobs)} jobs.")
+        return stop
+
+
+scheduler = Scheduler()
+
+
+def recent_runs(limit=20, job=None):
+    """Return the latest job runs, newest first."""
+    query = JobRun.query
+    if job:
+        query = query.filter_by(job=job)
+    return query.order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit).all()
@@ -0,0 +1,197 @@
+"""Credential-stuffing shield: failed logins counted per account and per subnet.
+
+Failures go into a count-min sketch kept in a memory-mapped file, so every
+worker process on the host shares it, and its size is fixed however many
+accounts or addresses an attacker cycles through. Counts fade out over a
+sliding window: the sketch has a slot for the current window and one for
+the previous window, which is weighted by how much of it still overlaps.
+A third slot holds, per key, the time before which throttled attempts are
+refused.
+
+`check_login()` runs before the user lookup and the password hash, so a
+refused attempt costs a few hash-table reads and never waits in a request.
+"""
+import hashlib
+import ipaddress
+import math
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers this process.
+    fcntl = None
+
+MAGIC = b"LSHIELD2"
+HEADER = struct.Struct("<8s16sQ")  # Magic, hash key, current window
+WINDOW_OFFSET = 24
+MAX_COUNT = 0xFFFFFFFF
+
+
+class CountMinSketch:
+    """A two-window count-min sketch of uint32 counters in a shared file, with a slot of hold times."""
+
+    def __init__(self, path, width, depth, window):
+        self.width = width
+        self.depth = depth
+        self.window = window
+        self.slot_size = width * depth
+        size = HEADER.size + 3 * self.slot_size * 4
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        with self._locked():
+            resized = os.fstat(self._fd).st_size != size
+            if resized:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            if resized or self._map[:len(MAGIC)] != MAGIC:
+                # New file, or one made with other dimensions: start empty with a fresh key.
+                self._map[:] = bytes(size)
+                HEADER.pack_into(self._map, 0, MAGIC, secrets.token_bytes(16), 0)
+        self._key = HEADER.unpack_from(self._map)[1]
+        self._counters = memoryview(self._map)[HEADER.size:].cast("I")
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _cells(self, key):
+        # Keyed with a random per-file secret, so colliding keys cannot be precomputed.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth, key=self._key).digest()
+        return [
+            row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def _advance(self, now):
+        """Move to the window containing `now`, clearing the slots it reuses; call locked."""
+        current = int(now // self.window)
+        stored = HEADER.unpack_from(self._map)[2]
+        if current <= stored:
+            return stored  # Same window, or the clock went back.
+        for window in (current,) if current == stored + 1 else (current, current - 1):
+            start = HEADER.size + (window % 2) * self.slot_size * 4
+            self._map[start:start + self.slot_size * 4] = bytes(self.slot_size * 4)
+        struct.pack_into("<Q", self._map, WINDOW_OFFSET, current)
+        return current
+
+    def add(self, key, now=None):
+        """Count one event for a key, raising only its smallest counters (conservative update)."""
+        now = now or time.time()
+        cells = self._cells(key)
+        with self._locked():
+            base = (self._advance(now) % 2) * self.slot_size
+            low = min(self._counters[base + cell] for cell in cells)
+            if low < MAX_COUNT:
+                for cell in cells:
+                    if self._counters[base + cell] == low:
+                        self._counters[base + cell] = low + 1
+
+    def estimate(self, key, now=None):
+        """Return the key's count over the last window; collisions can only inflate it."""
+        now = now or time.time()
+        cells = self._cells(key)
+        with self._locked():
+            window = self._advance(now)
+            current = min(self._counters[(window % 2) * self.slot_size + cell] for cell in cells)
+            previous = min(self._counters[((window - 1) % 2) * self.slot_size + cell] for cell in cells)
+        overlap = 1 - (now % self.window) / self.window
+        return current + previous * overlap
+
+    def hold(self, key, seconds, now=None):
+        """Let one attempt through per `seconds` for a key; returns the seconds left to wait, or 0.
+
+        Hold times are whole epoch seconds, rounded up, and are never cleared:
+        they simply pass. Collisions can only make a key wait longer.
+        """
+        now = now or time.time()
+        cells = [2 * self.slot_size + cell for cell in self._cells(key)]
+        with self._locked():
+            until = min(self._counters[cell] for cell in cells)
+            if until > now:
+                return until - now
+            release = min(MAX_COUNT, math.ceil(now + seconds))
+            for cell in cells:
+                self._counters[cell] = max(self._counters[cell], release)
+        return 0.0
+
+
+_sketch = None
+_sketch_pid = None
+_sketch_lock = threading.Lock()
+
+
+def get_sketch():
+    """Return this process's mapping of the shared sketch.
+
+    Each process opens the file itself: a descriptor inherited through fork
+    would share its flock with the parent and every sibling.
+    """
+    global _sketch, _sketch_pid
+    with _sketch_lock:
+        if _sketch is None or _sketch_pid != os.getpid():
+            _sketch = CountMinSketch(
+                Config.LOGIN_SHIELD_PATH, Config.LOGIN_SHIELD_WIDTH,
+                Config.LOGIN_SHIELD_DEPTH, Config.LOGIN_SHIELD_WINDOW,
+            )
+            _sketch_pid = os.getpid()
+        return _sketch
+
+
+def subnet(address):
+    """Return the /24 (IPv4) or /64 (IPv6) network of an address."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address or "unknown"
+    return str(ipaddress.ip_network(f"{ip}/{24 if ip.version == 4 else 64}", strict=False))
+
+
+def login_keys(email, address, organization):
+    return f"account:{organization}/{(email or '').strip().lower()}", f"subnet:{subnet(address)}"
+
+
+def check_login(email, address, organization=None):
+    """Decide whether to let a login attempt through; returns (allowed, seconds to retry after).
+
+    Past half of either failure limit, the account or subnet gets one attempt
+    per delay, growing towards LOGIN_SHIELD_MAX_DELAY; attempts in between
+    are refused at once. At the limit every attempt is refused until the
+    failures fade out.
+    """
+    keys = login_keys(email, address, organization or Config.DEFAULT_TENANT)
+    sketch = get_sketch()
+    pressures = (
+        sketch.estimate(keys[0]) / Config.LOGIN_SHIELD_ACCOUNT_LIMIT,
+        sketch.estimate(keys[1]) / Config.LOGIN_SHIELD_SUBNET_LIMIT,
+    )
+    if max(pressures) >= 1:
+        return False, float(Config.LOGIN_SHIELD_WINDOW)
+    for key, pressure in zip(keys, pressures):
+        if pressure > 0.5:
+            wait = sketch.hold(key, (pressure - 0.5) * 2 * Config.LOGIN_SHIELD_MAX_DELAY)
+            if wait:
+                return False, wait
+    return True, 0.0
+
+
+def record_login_failure(email, address, organization=None):
+    """Count a failed login against its account and its subnet."""
+    sketch = get_sketch()
+    for key in login_keys(email, address, organization or Config.DEFAULT_TENANT):
+        sketch.add(key)
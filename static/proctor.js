@@ -0,0 +1,40 @@
+// Live cohort progress for the proctor dashboard (templates/proctor.html).
+(function () {
+    var table = document.getElementById("proctor-learners");
+    var status = document.getElementById("proctor-status");
+    var body = table.tBodies[0];
+    var rows = {};
+
+    function show(learner) {
+        var row = rows[learner.user];
+        if (!row) {
+            row = rows[learner.user] = body.insertRow();
+            for (var i = 0; i < 7; i++) {
+                row.insertCell();
+            }
+        }
+        var values = [
+            learner.user, learner.mode, learner.position + " / " + learner.total,
+            learner.answered, learner.correct, learner.score + "%", learner.at,
+        ];
+        for (var j = 0; j < values.length; j++) {
+            row.cells[j].textContent = values[j];
+        }
+    }
+
+    var source = new EventSource(table.dataset.events);
+    source.addEventListener("snapshot", function (event) {
+        body.textContent = "";
+        rows = {};
+        JSON.parse(event.data).forEach(show);
+    });
+    source.addEventListener("update", function (event) {
+        JSON.parse(event.data).forEach(show);
+    });
+    source.onopen = function () {
+        status.textContent = "Live";
+    };
+    source.onerror = function () {
+        status.textContent = "Reconnecting...";
+    };
+})();
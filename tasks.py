@@ -0,0 +1,128 @@
+"""Deferred tasks run by queue workers (see job_queue.py).
+
+Importing this module registers them. Tasks that produce a file write it to
+QUEUE_OUTPUT_DIR and return its name, which `/admin/tasks/<id>/download`
+serves.
+"""
+import os
+import secrets
+from datetime import datetime
+
+from sqlalchemy import case, select, update
+
+from banks import TENANTS, get_bank
+from calibration import calibrate, save_parameters
+from config import Config
+from exports import DATASETS, iter_csv, iter_rows, write_parquet
+from history import snapshot_progress
+from item_analysis import (
+    answer_keys,
+    distractor_analysis,
+    iter_distractor_rows,
+    load_responses,
+    write_distractor_csv,
+    write_distractor_html,
+)
+from job_queue import task_queue
+from models import db, Attempt, Exam
+from timings import migrate_position_sketches
+
+
+def output_path(prefix, extension):
+    """Return a new, unguessable file name in QUEUE_OUTPUT_DIR and its full path."""
+    os.makedirs(Config.QUEUE_OUTPUT_DIR, exist_ok=True)
+    name = f"{prefix}-{datetime.utcnow():%Y%m%d-%H%M%S}-{secrets.token_hex(4)}.{extension}"
+    return name, os.path.join(Config.QUEUE_OUTPUT_DIR, name)
+
+
+@task_queue.task("export", concurrency=2, timeout=3600)
+def export(dataset, file_format="csv"):
+    """Write an export dataset to a CSV or Parquet file."""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    name, path = output_path(dataset, file_format)
+    if file_format == "parquet":
+        write_parquet(path, DATASETS[dataset], iter_rows(dataset))
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            for chunk in iter_csv(DATASETS[dataset], iter_rows(dataset)):
+                file.write(chunk)
+    return name
+
+
+@task_queue.task("distractor-report", timeout=1800)
+def distractor_report(bank=None, tenant=None, file_format="csv"):
+    """Write the distractor report of a bank as CSV or HTML."""
+    question_bank = get_bank(bank, tenant=tenant)
+    responses = load_responses(question_bank)
+    rows = iter_distractor_rows(question_bank, distractor_analysis(responses, answer_keys(question_bank)))
+    name, path = output_path(f"distractors-{question_bank.key.replace('/', '-')}", file_format)
+    if file_format == "html":
+        write_distractor_html(path, question_bank, rows, responses)
+    else:
+        write_distractor_csv(path, rows)
+    return name
+
+
+# Fitting reads every answer into memory; one at a time is enough.
+@task_queue.task("calibrate", concurrency=1, timeout=3600)
+def recalibrate(bank=None, tenant=None, model="2pl", all_versions=False):
+    """Fit IRT item parameters to the stored answers and save them with the bank version."""
+    question_bank = get_bank(bank, tenant=tenant)
+    responses = load_responses(question_bank, version=None if all_versions else question_bank.version)
+    if not len(responses):
+        return f"No answers for {question_bank.key} ({question_bank.version})."
+    result = calibrate(responses, model)
+    save_parameters(question_bank, result)
+    return f"{model} for {question_bank.key} ({question_bank.version}) from {len(responses)} answers"
+
+
+@task_queue.task("snapshot-progress", timeout=600)
+def recompute_progress(days=2):
+    """Rebuild the daily progress rollup over more days than the scheduled refresh."""
+    return snapshot_progress(days)
+
+
+@task_queue.task("backfill-question-ids", timeout=3600)
+def backfill_question_ids():
+    """Label attempts recorded before stable question IDs, and move the timings kept by position.
+
+    Attempts are mapped through the bank version each session ran on.
+    """
+    versions = db.session.execute(
+        select(Exam.organization, Exam.bank, Exam.bank_version)
+        .join(Attempt, Attempt.exam_id == Exam.id)
+        .where(Attempt.question_id.is_(None))
+        .distinct()
+    ).all()
+    labelled, skipped = 0, []
+    for organization, key, version in versions:
+        try:
+            bank = get_bank(key, version, tenant=organization if organization in TENANTS else None)
+        except KeyError:
+            bank = None
+        if bank is None or bank.version != version:
+            skipped.append(f"{key} ({version})")  # Neither loaded nor snapshotted: positions are unknown.
+            continue
+        result = db.session.execute(
+            update(Attempt)
+            .where(
+                Attempt.question_id.is_(None),
+                Attempt.question_index < len(bank),
+                Attempt.exam_id.in_(
+                    select(Exam.id).where(
+                        Exam.organization == organization, Exam.bank == key, Exam.bank_version == version
+                    )
+                ),
+            )
+            .values(question_id=case(dict(enumerate(bank.ids)), value=Attempt.question_index))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        labelled += result.rowcount
+    merged, dropped, unmapped = migrate_position_sketches()
+    skipped += [bank for bank in unmapped if bank not in skipped]
+    return (
+        f"{labelled} attempts labelled; {merged} timing sketches moved to question IDs, {dropped} dropped"
+        + (f"; no snapshot of {', '.join(skipped)}" if skipped else "")
+    )
@@ -0,0 +1,53 @@
+from flask import g, has_request_context
+
+from config import Config
+
+
+class Tenant:
+    """An organization: the banks its users take and its bank memory quota."""
+
+    def __init__(self, name, bank_keys, memory_budget_mb):
+        self.name = name
+        self.bank_keys = tuple(bank_keys)
+        self.memory_budget_mb = memory_budget_mb
+
+    @property
+    def default_bank(self):
+        return Config.DEFAULT_BANK if Config.DEFAULT_BANK in self.bank_keys else self.bank_keys[0]
+
+
+def parse_tenants(spec, bank_keys, default_budget_mb):
+    """Parse "acme=ACC/en,PCC/en@128;..." into {name: Tenant}.
+
+    The quota after `@` is optional. An empty spec serves every bank to the
+    single DEFAULT_TENANT.
+    """
+    tenants = {}
+    for entry in spec.split(";"):
+        if not entry.strip():
+            continue
+        name, rest = entry.split("=", 1)
+        banks, _, budget = rest.partition("@")
+        keys = [key.strip() for key in banks.split(",") if key.strip()]
+        unknown = [key for key in keys if key not in bank_keys]
+        if not keys or unknown:
+            raise ValueError(f"Tenant {name.strip()} needs banks from QUESTION_BANKS, got: {banks.strip()}")
+        tenants[name.strip()] = Tenant(name.strip(), keys, int(budget) if budget.strip() else default_budget_mb)
+    if not tenants:
+        tenants[Config.DEFAULT_TENANT] = Tenant(Config.DEFAULT_TENANT, bank_keys, default_budget_mb)
+    if Config.DEFAULT_TENANT not in tenants:
+        raise ValueError(f"TENANTS must include the default tenant {Config.DEFAULT_TENANT}.")
+    return tenants
+
+
+def resolve_tenant(host, tenants):
+    """Return the tenant named by the host's first label, e.g. acme.exams.example.com."""
+    label = host.split(":", 1)[0].split(".", 1)[0].lower()
+    return label if label in tenants else Config.DEFAULT_TENANT
+
+
+def current_tenant():
+    """Return the request's tenant, or the default one outside a request (CLI, jobs)."""
+    if has_request_context() and "tenant" in g:
+        return g.tenant
+    return Config.DEFAULT_TENANT
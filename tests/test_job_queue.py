@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+import job_queue
+from config import Config
+from job_queue import TASK_FAILED, TASK_QUEUED, TASK_RUNNING, TASK_SUCCEEDED, JobQueue
+
+
+class Clock:
+    """Stands in for time.time() in job_queue, so leases and backoffs can be skipped over."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "QUEUE_VISIBILITY_TIMEOUT", 60)
+    monkeypatch.setattr(Config, "QUEUE_RETRY_DELAY", 10)
+    monkeypatch.setattr(Config, "QUEUE_RETRY_MAX_DELAY", 3600)
+    monkeypatch.setattr(Config, "QUEUE_CONCURRENCY", "")
+    queue = JobQueue(str(tmp_path / "queue.db"))
+
+    @queue.task("report", concurrency=100, max_attempts=3)
+    def report(name, days=2, all_versions=False, ratio=0.5, note=None):
+        return name
+
+    return queue
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue, clock):
+    task_id = queue.enqueue("report", {"name": "a"})
+    first = queue.claim("worker-a")
+    assert first.id == task_id
+    assert queue.claim("worker-b") is None  # Hidden while the lease runs.
+
+    clock.now += Config.QUEUE_VISIBILITY_TIMEOUT + 1
+    second = queue.claim("worker-b")
+    assert second.id == task_id
+    assert second.attempts == 2
+
+    # The first worker has lost its claim and can no longer settle the task.
+    assert not queue.extend(first)
+    assert not queue.complete(first, "late")
+    assert queue.complete(second, "done")
+    record = queue.get(task_id)
+    assert record["status"] == TASK_SUCCEEDED
+    assert record["worker"] == "worker-b"
+    assert record["result"] == "done"
+
+
+def test_expired_lease_on_last_attempt_fails_the_task(queue, clock):
+    task_id = queue.enqueue("report", {"name": "a"})
+    for _ in range(3):
+        assert queue.claim("worker") is not None
+        clock.now += Config.QUEUE_VISIBILITY_TIMEOUT + 1
+    assert queue.claim("worker") is None
+    assert queue.get(task_id)["status"] == TASK_FAILED
+
+
+def test_failed_task_is_retried_with_backoff_until_max_attempts(queue, clock):
+    task_id = queue.enqueue("report", {"name": "a"})
+    for attempt in (1, 2):
+        task = queue.claim("worker")
+        assert task.attempts == attempt
+        assert queue.fail(task, "boom")
+        record = queue.get(task_id)
+        assert record["status"] == TASK_QUEUED
+        # Half of the doubled delay is fixed, the other half is jitter.
+        delay = Config.QUEUE_RETRY_DELAY * 2 ** (attempt - 1)
+        assert clock.now + delay / 2 <= record["available_at"] <= clock.now + delay
+        assert queue.claim("worker") is None  # Not before the backoff ends.
+        clock.now += delay
+
+    task = queue.claim("worker")
+    assert task.attempts == 3
+    assert queue.fail(task, "boom again")
+    record = queue.get(task_id)
+    assert record["status"] == TASK_FAILED
+    assert record["attempts"] == 3
+    assert record["error"] == "boom again"
+    clock.now += Config.QUEUE_RETRY_MAX_DELAY
+    assert queue.claim("worker") is None
+
+
+def test_two_workers_never_claim_the_same_task(queue):
+    task_ids = {queue.enqueue("report", {"name": str(i)}) for i in range(60)}
+    claimed = {"worker-a": [], "worker-b": []}
+    start = threading.Barrier(2)
+
+    def work(worker):
+        # Each thread has its own SQLite connection, like separate worker processes.
+        start.wait()
+        while True:
+            task = queue.claim(worker)
+            if task is None:
+                return
+            claimed[worker].append(task.id)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in claimed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claims = claimed["worker-a"] + claimed["worker-b"]
+    assert len(all_claims) == len(set(all_claims))
+    assert set(all_claims) == task_ids
+    assert all(queue.get(task_id)["status"] == TASK_RUNNING for task_id in task_ids)
+
+
+def test_form_strings_are_coerced_to_the_parameter_types(queue):
+    task_id = queue.enqueue(
+        "report", {"name": "a", "days": "7", "all_versions": "false", "ratio": "0.25", "note": "7"}
+    )
+    assert queue.get(task_id)["payload"] == {
+        "name": "a", "days": 7, "all_versions": False, "ratio": 0.25, "note": "7",
+    }
+    assert queue.get(queue.enqueue("report", {"name": "a", "all_versions": True}))["payload"]["all_versions"] is True
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"name": "a", "all_versions": "maybe"},
+        {"name": "a", "days": "seven"},
+        {"name": "a", "days": True},
+        {"name": "a", "unknown": 1},
+        {},
+    ],
+)
+def test_invalid_payloads_are_rejected(queue, payload):
+    with pytest.raises(TypeError):
+        queue.enqueue("report", payload)
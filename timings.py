@@ -0,0 +1,216 @@
+import math
+import threading
+from datetime import datetime
+from statistics import median
+
+from sqlalchemy import column, delete, func, inspect, select, table, text, update
+from sqlalchemy.exc import IntegrityError
+
+from banks import TENANTS, get_bank
+from config import Config
+from models import db, Exam, ResponseTimeSketch
+
+TIMING_COLUMNS = ("bank", "question_id", "timed_answers", "time_p50", "time_p90", "relative_p50")
+
+# Sketches kept by bank position, before stable question IDs.
+POSITION_SKETCHES = table(
+    "response_time_sketches",
+    column("id"), column("bank"), column("question_index"), column("count"), column("zero_count"),
+    column("bins", db.JSON), column("updated_at", db.DateTime),
+)
+
+
+class DDSketch:
+    """Quantile sketch with a fixed relative error (DDSketch).
+
+    Values are counted in logarithmic buckets, so memory depends on the
+    range of values rather than how many were added, and two sketches merge
+    by adding their bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=None, bins=None, count=0, zero_count=0):
+        self.relative_accuracy = relative_accuracy or Config.RESPONSE_TIME_ACCURACY
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = dict(bins or {})
+        self.count = count
+        self.zero_count = zero_count
+
+    def add(self, value):
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            bucket = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[bucket] = self.bins.get(bucket, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        for bucket, count in other.bins.items():
+            self.bins[bucket] = self.bins.get(bucket, 0) + count
+        self.count += other.count
+        self.zero_count += other.zero_count
+
+    def quantile(self, q):
+        """Return the value at quantile q (0 to 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for bucket in sorted(self.bins):
+            seen += self.bins[bucket]
+            if rank < seen:
+                return 2 * self.gamma ** bucket / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self):
+        return {str(bucket): count for bucket, count in self.bins.items()}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            bins={int(bucket): count for bucket, count in row.bins.items()},
+            count=row.count,
+            zero_count=row.zero_count,
+        )
+
+
+# Timings gathered by this worker since its last flush.
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def record_response_time(bank, question_id, seconds):
+    """Add one time-on-question to this worker's sketch for the question."""
+    if seconds < 0 or seconds > Config.RESPONSE_TIME_MAX:
+        return  # A clock change, or a tab left open.
+    with _pending_lock:
+        sketch = _pending.get((bank, question_id))
+        if sketch is None:
+            sketch = _pending[(bank, question_id)] = DDSketch()
+        sketch.add(seconds)
+
+
+def flush_response_times(attempts=5):
+    """Merge this worker's sketches into the shared ones in the database.
+
+    Rows are updated only if their count is unchanged since they were read,
+    so workers flushing the same question at once retry instead of
+    overwriting each other.
+    """
+    global _pending
+    with _pending_lock:
+        pending, _pending = _pending, {}
+    for (bank, question_id), sketch in pending.items():
+        for _ in range(attempts):
+            if _merge_into_row(bank, question_id, sketch):
+                break
+        else:
+            # Keep it for the next flush rather than losing it.
+            with _pending_lock:
+                _pending.setdefault((bank, question_id), DDSketch()).merge(sketch)
+    return len(pending)
+
+
+def _merge_into_row(bank, question_id, sketch):
+    row = db.session.execute(
+        select(ResponseTimeSketch).filter_by(bank=bank, question_id=question_id)
+    ).scalar_one_or_none()
+    if row is None:
+        try:
+            db.session.add(
+                ResponseTimeSketch(
+                    bank=bank, question_id=question_id, count=sketch.count,
+                    zero_count=sketch.zero_count, bins=sketch.to_json(),
+                )
+            )
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    merged = DDSketch.from_row(row)
+    merged.merge(sketch)
+    result = db.session.execute(
+        update(ResponseTimeSketch)
+        .where(ResponseTimeSketch.id == row.id, ResponseTimeSketch.count == row.count)
+        .values(
+            count=merged.count, zero_count=merged.zero_count,
+            bins=merged.to_json(), updated_at=datetime.utcnow(),
+        )
+    )
+    db.session.commit()
+    db.session.expire_all()
+    return result.rowcount == 1
+
+
+def iter_timing_rows():
+    """Yield p50/p90 time-on-question per question, from the stored sketches.
+
+    `relative_p50` compares a question's median to the median of its bank's
+    question medians; questions well above 1 are slow to read or confusing.
+    """
+    by_bank = {}
+    for row in db.session.execute(
+        select(ResponseTimeSketch).order_by(ResponseTimeSketch.bank, ResponseTimeSketch.question_id)
+    ).scalars():
+        sketch = DDSketch.from_row(row)
+        by_bank.setdefault(row.bank, []).append(
+            (row.question_id, sketch.count, sketch.quantile(0.5), sketch.quantile(0.9))
+        )
+    for bank, items in by_bank.items():
+        typical = median(p50 for _, _, p50, _ in items) or None
+        for question_id, count, p50, p90 in items:
+            yield (
+                bank, question_id, count, round(p50, 2), round(p90, 2),
+                round(p50 / typical, 2) if typical else None,
+            )
+
+
+def migrate_position_sketches():
+    """Merge the sketches kept by bank position into the ones keyed by question ID.
+
+    Positions are read in the bank version the latest session on that bank
+    had started on when the sketch last changed, or the current version if
+    there is none. Merged rows are deleted, and the old table is dropped once
+    empty. Returns (merged, dropped, banks whose version could not be loaded).
+    """
+    if not inspect(db.engine).has_table(POSITION_SKETCHES.name):
+        return 0, 0, []
+    merged, dropped, skipped, banks = 0, 0, set(), {}
+    for row in db.session.execute(select(POSITION_SKETCHES).order_by(POSITION_SKETCHES.c.id)).all():
+        live = db.session.execute(
+            select(Exam.organization, Exam.bank_version)
+            .where(Exam.bank == row.bank, Exam.started_at <= row.updated_at)
+            .order_by(Exam.started_at.desc())
+            .limit(1)
+        ).first()
+        organization, version = live if live else (None, None)
+        if (row.bank, version) not in banks:
+            try:
+                bank = get_bank(row.bank, version, tenant=organization if organization in TENANTS else None)
+            except KeyError:
+                bank = None
+            banks[row.bank, version] = bank if bank is not None and version in (None, bank.version) else None
+        bank = banks[row.bank, version]
+        if bank is None:
+            skipped.add(f"{row.bank} ({version})")  # Neither loaded nor snapshotted: positions are unknown.
+            continue
+        if row.question_index < len(bank):
+            sketch = DDSketch.from_row(row)
+            for _ in range(5):
+                if _merge_into_row(row.bank, bank.ids[row.question_index], sketch):
+                    break
+            else:
+                continue  # Left for the next run.
+            merged += 1
+        else:
+            dropped += 1  # The position no longer exists in any version we can read.
+        db.session.execute(delete(POSITION_SKETCHES).where(POSITION_SKETCHES.c.id == row.id))
+        db.session.commit()
+    if not db.session.execute(select(func.count()).select_from(POSITION_SKETCHES)).scalar():
+        db.session.execute(text(f"DROP TABLE {POSITION_SKETCHES.name}"))
+        db.session.commit()
+    return merged, dropped, sorted(skipped)
@@ -0,0 +1,296 @@
+"""Where user accounts are stored, chosen once when the app is created.
+
+Every backend takes and returns password hashes as bytes, whatever it
+stores, and offers bulk lookups and inserts for imports and batch jobs.
+
+* memory: a dict in this process, for tests and throwaway demos;
+* file: the `users` dict in users.py, the development default;
+* sqlite and postgres: the `users` table through the ORM.
+
+`USER_STORE` picks a backend; left empty, development uses the file and
+other environments the backend matching `SQLALCHEMY_DATABASE_URI`.
+"""
+import ast
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, User
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers this process.
+    fcntl = None
+
+BACKENDS = ("memory", "file", "sqlite", "postgres")
+
+
+class UserRecord:
+    """A user account as every backend returns it."""
+
+    def __init__(self, email, organization, password_hash):
+        self.email = email
+        self.organization = organization
+        self.password_hash = normalize_hash(password_hash)
+
+    def __repr__(self):
+        return f"UserRecord({self.organization}/{self.email})"
+
+
+def normalize_hash(password_hash):
+    """Return a stored password hash as bytes, whether it was kept as str or bytes."""
+    return password_hash.encode("utf-8") if isinstance(password_hash, str) else bytes(password_hash)
+
+
+class UserRepository(ABC):
+    """Interface of the user stores; emails are unique within an organization."""
+
+    name = None
+
+    def get(self, email, organization):
+        return self.get_many([email], organization).get(email)
+
+    @abstractmethod
+    def get_many(self, emails, organization):
+        """Return {email: UserRecord} for the emails that exist in the organization."""
+
+    def create(self, email, password_hash, organization):
+        self.create_many([(email, password_hash)], organization)
+
+    @abstractmethod
+    def create_many(self, accounts, organization):
+        """Add (email, password hash) pairs at once; raises ValueError if any email exists."""
+
+    @abstractmethod
+    def update_hash(self, email, password_hash, organization):
+        """Replace a user's password hash; unknown users are ignored."""
+
+
+class MemoryUserRepository(UserRepository):
+    name = "memory"
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _key(self, email, organization):
+        # The users.py format: other organizations' users are "<organization>/<email>".
+        return email if organization == Config.DEFAULT_TENANT else f"{organization}/{email}"
+
+    def get_many(self, emails, organization):
+        with self._locked():
+            self._refresh()
+            return {
+                email: UserRecord(email, organization, self._hashes[self._key(email, organization)])
+                for email in emails
+                if self._key(email, organization) in self._hashes
+            }
+
+    def create_many(self, accounts, organization):
+        with self._locked(write=True):
+            self._refresh()
+            keys = [self._key(email, organization) for email, _ in accounts]
+            if len(set(keys)) != len(keys) or any(key in self._hashes for key in keys):
+                raise ValueError("User already exists.")
+            for key, (_, password_hash) in zip(keys, accounts):
+                self._hashes[key] = normalize_hash(password_hash)
+            self._saved()
+
+    def update_hash(self, email, password_hash, organization):
+        with self._locked(write=True):
+            self._refresh()
+            key = self._key(email, organization)
+            if key in self._hashes:
+                self._hashes[key] = normalize_hash(password_hash)
+                self._saved()
+
+    @contextmanager
+    def _locked(self, write=False):
+        """Hold the store for a read, or for a change from refresh to save."""
+        with self._lock:
+            yield
+
+    def _refresh(self):
+        """Called before each read or change, under the lock."""
+
+    def _saved(self):
+        """Called after each change, under the lock."""
+
+
+class FileUserRepository(MemoryUserRepository):
+    """Users kept in a Python file, reread when another process has changed it.
+
+    Changes hold an flock on "<file>.lock" from reading the file to writing
+    it, so concurrent workers do not lose each other's writes. The new
+    content goes to a temporary file that replaces the old one, so readers
+    and crashes never see a half-written file.
+    """
+
+    name = "file"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._version = None
+        with self._locked():
+            self._refresh()
+
+    @contextmanager
+    def _locked(self, write=False):
+        with self._lock:
+            if not write:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield  # Closing the file releases the flock.
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        # Each save replaces the file, so a new inode also tells changes apart.
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._version:
+            return
+        with open(self.path) as file:
+            source = file.read()
+        # The file only holds `users = {...}` with string keys and bytes values.
+        stored = ast.literal_eval(source.split("=", 1)[1].strip())
+        self._hashes = {key: normalize_hash(value) for key, value in stored.items()}
+        self._version = version
+
+    def _saved(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary = tempfile.mkstemp(prefix=".users-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                file.write("users = {\n")
+                for key, password_hash in self._hashes.items():
+                    file.write(f'    "{key}": {password_hash!r},\n')
+                file.write("}\n")
+                file.flush()
+                os.fsync(file.fileno())
+            try:
+                os.chmod(temporary, os.stat(self.path).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(temporary, 0o644)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        stat = os.stat(self.path)
+        self._version = (stat.st_ino, stat.st_mtime_ns)
+
+
+class SqlUserRepository(UserRepository):
+    """Users in the `users` table; call within an application context."""
+
+    batch_size = 500  # Emails per IN (...) lookup
+
+    def get_many(self, emails, organization):
+        emails = list(dict.fromkeys(emails))
+        found = {}
+        for start in range(0, len(emails), self.batch_size):
+            rows = db.session.execute(
+                select(User.email, User.password).where(
+                    User.organization == organization, User.email.in_(emails[start:start + self.batch_size])
+                )
+            )
+            found.update((email, UserRecord(email, organization, password)) for email, password in rows)
+        return found
+
+    def create_many(self, accounts, organization):
+        emails = [email for email, _ in accounts]
+        if len(set(emails)) != len(emails) or self.get_many(emails, organization):
+            raise ValueError("User already exists.")
+        try:
+            db.session.execute(
+                insert(User),
+                [
+                    {
+                        "organization": organization,
+                        "email": email,
+                        "password": normalize_hash(password_hash).decode("utf-8"),
+                    }
+                    for email, password_hash in accounts
+                ],
+            )
+            db.session.commit()
+        except IntegrityError:
+            # Registered by another request since the lookup.
+            db.session.rollback()
+            raise ValueError("User already exists.")
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def update_hash(self, email, password_hash, organization):
+        try:
+            db.session.execute(
+                update(User)
+                .where(User.organization == organization, User.email == email)
+                .values(password=normalize_hash(password_hash).decode("utf-8"))
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+class SQLiteUserRepository(SqlUserRepository):
+    name = "sqlite"
+    batch_size = 500  # SQLite builds before 3.32 allow 999 bound parameters per statement
+
+
+class PostgresUserRepository(SqlUserRepository):
+    name = "postgres"
+    batch_size = 5000
+
+
+def build_user_repository(config=Config):
+    """Create the backend named by USER_STORE, or the one implied by the environment."""
+    store = config.USER_STORE
+    if not store:
+        if config.ENV == "development":
+            store = "file"
+        elif config.SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+            store = "sqlite"
+        else:
+            store = "postgres"
+    if store == "memory":
+        return MemoryUserRepository()
+    if store == "file":
+        return FileUserRepository(config.USERS_FILE)
+    if store == "sqlite":
+        return SQLiteUserRepository()
+    if store == "postgres":
+        return PostgresUserRepository()
+    raise ValueError(f"Unknown USER_STORE {store!r}; choose from {', '.join(BACKENDS)}.")
+
+
+_repository = None
+
+
+def init_user_repository(app, config=Config):
+    """Select the user store for this app's process."""
+    global _repository
+    _repository = build_user_repository(config)
+    app.logger.info(f"Users are stored in the {_repository.name} backend.")
+    return _repository
+
+
+def get_user_repository():
+    """Return the user store selected at startup, selecting it on first use outside an app."""
+    global _repository
+    if _repository is None:
+        _repository = build_user_repository()
+    return _repository
@@ -0,0 +1,944 @@
+import csv
+import json
+import math
+import time
+from datetime import datetime
+
+import click
+from flask import (
+    Blueprint, current_app, render_template, request, redirect, url_for, session, flash,
+    jsonify, Response, abort, stream_with_context, g, send_from_directory,
+)
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from config import Config
+from db_utils import (
+    create_user_async,
+    create_users,
+    get_user_by_email_async,
+    get_users_by_email,
+    validate_user_async,
+)
+from leaderboard import PERIODS, board_name, get_leaderboard
+from history import HISTORY_PAGE_SIZE, get_history_page, get_session_attempts
+from exports import DATASETS, iter_rows, iter_csv, reads_more_rows_than, write_parquet
+from exams import (
+    STATUS_EXPIRED,
+    MODE_EXAM,
+    MODE_PRACTICE,
+    start_exam,
+    get_active_exam,
+    get_latest_exam,
+    is_expired,
+    seconds_remaining,
+    exam_score,
+    next_unanswered,
+    record_answer,
+    record_attempt,
+    get_recorded_answer,
+    start_practice,
+    finish_practice,
+    finalize_exam,
+    cohort_exam_progress,
+)
+from banks import TENANTS, get_bank, get_registry
+from tenants import resolve_tenant
+from shield import check_login, record_login_failure
+from pubsub import bus
+from job_queue import TASK_SUCCEEDED, task_queue
+import tasks  # noqa: F401  Registers the deferred task types.
+from blueprints import AREAS, BLUEPRINTS, draw_questions
+from options import displayed_options, to_canonical, to_display
+from bitmap import has_bit, new_bitmap, set_bit
+from timings import record_response_time
+from mastery import draw_weak_area_questions, get_mastery, update_mastery, weak_areas
+from calibration import MODELS, calibrate, item_parameters, probability_correct, save_parameters
+from item_analysis import (
+    answer_keys,
+    distractor_analysis,
+    iter_distractor_rows,
+    load_responses,
+    write_distractor_csv,
+    write_distractor_html,
+)
+
+bp = Blueprint("main", __name__, cli_group=None)
+limiter = Limiter(get_remote_address)
+
+
+@bp.before_app_request
+def load_tenant():
+    """Resolve the request's organization once, from its host name."""
+    g.tenant = resolve_tenant(request.host, TENANTS)
+
+
+@bp.before_app_request
+def make_session_permanent():
+    """Ensure sessions are permanent and set a suitable duration."""
+    session.permanent = True
+    current_app.logger.debug("Session set to permanent.")
+
+
+# Utility Functions
+def is_logged_in():
+    """Check if the user is logged in to the request's organization."""
+    logged_in = "user" in session and session.get("tenant", Config.DEFAULT_TENANT) == g.tenant
+    current_app.logger.debug(f"User logged in: {logged_in}")
+    return logged_in
+
+
+def is_admin():
+    """Check if the logged-in user is listed in ADMIN_EMAILS; admins belong to the default organization."""
+    return g.tenant == Config.DEFAULT_TENANT and session.get("user") in Config.ADMIN_EMAILS
+
+
+def is_instructor():
+    """Check if the logged-in user may proctor cohorts: admins and INSTRUCTOR_EMAILS."""
+    user = session.get("user")
+    key = user if g.tenant == Config.DEFAULT_TENANT else f"{g.tenant}/{user}"
+    return is_admin() or key in Config.INSTRUCTOR_EMAILS
+
+
+def requested_bank_key():
+    """Return the bank chosen with `?bank=<level>/<locale>`, or the organization's default."""
+    key = request.args.get("bank")
+    return key if key in get_registry() else TENANTS[g.tenant].default_bank
+
+
+def requested_blueprint():
+    """Return the practice blueprint chosen with `?blueprint=<name>`, or the default."""
+    name = request.args.get("blueprint")
+    return name if name in BLUEPRINTS else Config.PRACTICE_BLUEPRINT
+
+
+def session_bank():
+    """Return the bank version the practice session started on."""
+    return get_bank(session.get("bank"), session.get("bank_version"))
+
+
+def has_unpinned_practice():
+    """Check for a practice session from a cookie that predates pinning sessions to a bank version."""
+    return "quiz_indices" in session and not ("bank" in session and "bank_version" in session)
+
+
+def mark_question_shown(exam_id, qid):
+    """Remember when a question was rendered, to time the answer."""
+    session["question_shown"] = [exam_id, qid, time.time()]
+
+
+def time_on_question(exam_id, qid):
+    """Return the seconds since the question was rendered, or None if it was not."""
+    shown = session.pop("question_shown", None)
+    if not shown or shown[:2] != [exam_id, qid]:
+        return None
+    return time.time() - shown[2]
+
+
+def render_result(current_question, seed, question_id, user_answer, qid, total, correct_count, **endpoints):
+    """Render the feedback page for a graded answer, in the letters the user saw."""
+    return render_template(
+        "result.html",
+        correct=(user_answer == current_question["answer"]),
+        quiz=current_question,
+        user_answer=to_display(current_question, seed, question_id, user_answer),
+        user_answer_text=current_question["options"].get(user_answer, "No answer selected"),
+        correct_answer=to_display(current_question, seed, question_id, current_question["answer"]),
+        correct_answer_text=current_question["options"][current_question["answer"]],
+        next_qid=qid + 1,
+        is_last=(qid + 1 >= total),
+        correct_count=correct_count,
+        total=total,
+        **endpoints,
+    )
+
+
+def render_recorded_result(bank, question_index, seed, qid, total):
+    """Render the feedback for the answer first recorded for a practice question, without re-grading."""
+    recorded_answer = get_recorded_answer(session.get("practice_id"), question_index)
+    if recorded_answer is None:
+        return redirect(url_for("main.question", qid=qid + 1))
+    return render_result(
+        bank[question_index], seed, bank.ids[question_index], recorded_answer,
+        qid, total, session.get("correct_answers", 0),
+    )
+
+
+def begin_practice(bank, quiz_indices, cohort=None):
+    """Store a new practice session on a bank in the user's session."""
+    practice = start_practice(session["user"], bank, quiz_indices, g.tenant, cohort)
+    if cohort:
+        session["cohort"] = cohort
+    session["bank"] = bank.key
+    session["bank_version"] = bank.version
+    session["quiz_indices"] = quiz_indices
+    session["answered_positions"] = new_bitmap(len(quiz_indices))
+    session["practice_id"] = practice.id
+    session["option_seed"] = practice.option_seed
+    session["correct_answers"] = 0
+    session["answered_questions"] = 0
+    current_app.logger.debug("Initialized quiz state for session.")
+
+
+def end_practice():
+    """Close the practice session and clear it; returns its (answered, correct) totals."""
+    correct_answers = session.get("correct_answers", 0)
+    answered_questions = session.get("answered_questions", 0)
+    if "practice_id" in session:
+        finish_practice(session["practice_id"], session["user"], answered_questions, correct_answers, g.tenant)
+    # The session is now in the user's history; Restart Quiz starts a fresh one.
+    for key in (
+        "quiz_indices", "practice_id", "bank", "bank_version", "option_seed", "cohort",
+        "answered_positions", "correct_answers", "answered_questions",
+    ):
+        session.pop(key, None)
+    return answered_questions, correct_answers
+
+
+def cohort_topic(cohort):
+    return f"{g.tenant}/{cohort}"
+
+
+def progress_message(user, mode, position, total, answered, correct, at):
+    """A learner's place in a session, as shown on the proctor dashboard."""
+    return {
+        "user": user,
+        "mode": mode,
+        "position": position,
+        "total": total,
+        "answered": answered,
+        "correct": correct,
+        "score": round(correct / answered * 100) if answered else 0,
+        "at": at.isoformat(timespec="seconds"),
+    }
+
+
+def publish_progress(cohort, mode, position, total, answered, correct):
+    """Send the user's progress to the dashboards proctoring their cohort."""
+    if cohort:
+        bus.publish(
+            cohort_topic(cohort),
+            session["user"],
+            progress_message(session["user"], mode, position, total, answered, correct, datetime.utcnow()),
+        )
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def redirect_to_login():
+    """Redirect to the login page if the user is not logged in."""
+    if not is_logged_in():
+        current_app.logger.warning("Unauthorized access attempt. Redirecting to login.")
+        return redirect(url_for("main.login"))
+
+
+@bp.route("/")
+def home():
+    """Redirect to the first question after initializing quiz state.
+
+    Practice sessions follow `PRACTICE_BLUEPRINT`; `?blueprint=<name>` picks
+    another configured blueprint, and `?cohort=<name>` shows the session on
+    the cohort's proctor dashboard.
+    """
+    if not is_logged_in():
+        return redirect_to_login()
+    current_app.logger.info("Accessed home route.")
+    if has_unpinned_practice():
+        end_practice()
+    if "quiz_indices" not in session:
+        bank = get_bank(requested_bank_key())
+        begin_practice(bank, draw_questions(bank, requested_blueprint()), request.args.get("cohort") or None)
+    return redirect(url_for("main.question", qid=0))
+
+
+@bp.route("/practice/weak")
+def practice_weak_areas():
+    """Start a practice session on the user's weakest study areas."""
+    if not is_logged_in():
+        return redirect_to_login()
+    if "quiz_indices" in session:
+        end_practice()
+    bank = get_bank(requested_bank_key())
+    begin_practice(bank, draw_weak_area_questions(bank, get_mastery(session["user"], g.tenant)))
+    current_app.logger.info(f"Weak-area practice started for {session['user']}.")
+    return redirect(url_for("main.question", qid=0))
+
+
+@bp.route("/api/mastery")
+def api_mastery():
+    """Return the user's estimated mastery of each study area as JSON."""
+    if not is_logged_in():
+        return jsonify(error="Not logged in."), 401
+    return jsonify(
+        areas=[
+            {"area": area, "name": AREAS[area], "mastery": round(score, 3), "answers": round(answered, 2)}
+            for area, (score, answered) in get_mastery(session["user"], g.tenant).items()
+        ]
+    )
+
+
+@bp.route("/login", methods=["GET", "POST"])
+@limiter.limit("10 per minute")
+async def login():
+    """Handle user login; the bcrypt check runs on the hashing executor, capped at HASH_WORKERS.
+
+    Accounts and subnets with many recent failures are throttled, then
+    refused, before the user is looked up or any hash is computed. A refused
+    attempt gets a 429 with Retry-After at once rather than waiting in here.
+    """
+    if request.method == "POST":
+        email = request.form.get("email")
+        password = request.form.get("password")
+        current_app.logger.info(f"Login attempt for email: {email}")
+        if Config.LOGIN_SHIELD_ENABLED:
+            allowed, retry_after = check_login(email, request.remote_addr, g.tenant)
+            if not allowed:
+                retry_after = math.ceil(retry_after)
+                current_app.logger.warning(f"Login refused by the shield for {email} from {request.remote_addr}.")
+                flash(f"Too many failed logins. Please try again in {retry_after} seconds.", "danger")
+                return render_template("login.html"), 429, {"Retry-After": str(retry_after)}
+        try:
+            if await validate_user_async(email, password, g.tenant):
+                session["user"] = email
+                session["tenant"] = g.tenant
+                current_app.logger.info(f"User logged in successfully: {email}")
+                return redirect(url_for("main.home"))
+            current_app.logger.warning(f"Invalid login attempt for email: {email}")
+            if Config.LOGIN_SHIELD_ENABLED:
+                record_login_failure(email, request.remote_addr, g.tenant)
+            flash("Invalid email or password. Please try again.", "danger")
+        except Exception as e:
+            current_app.logger.error(f"Login error for email {email}: {e}")
+            flash("An error occurred during login. Please try again.", "danger")
+    return render_template("login.html")
+
+
+@bp.route("/register", methods=["GET", "POST"])
+async def register():
+    """Handle user registration; hashing runs on the bcrypt executor."""
+    if request.method == "POST":
+        email = request.form.get("email")
+        password = request.form.get("password")
+        confirm_password = request.form.get("confirm_password")
+        current_app.logger.info(f"Registration attempt for email: {email}")
+        try:
+            if not email or not password or not confirm_password:
+                current_app.logger.warning("Registration failed: Missing fields.")
+                flash("All fields are required. Please try again.", "danger")
+                return redirect(url_for("main.register"))
+            if password != confirm_password:
+                current_app.logger.warning("Registration failed: Passwords do not match.")
+                flash("Passwords do not match. Please try again.", "danger")
+                return redirect(url_for("main.register"))
+            if await get_user_by_email_async(email, g.tenant):
+                current_app.logger.warning(
+                    f"Registration failed: Email already registered ({email})."
+                )
+                flash("Email already registered. Please log in.", "danger")
+                return redirect(url_for("main.login"))
+
+            await create_user_async(email, password, g.tenant)
+            current_app.logger.info(f"User registered successfully: {email}")
+            flash("Registration successful! You can now log in.", "success")
+            return redirect(url_for("main.login"))
+        except Exception as e:
+            current_app.logger.error(f"Registration error for email {email}: {e}")
+            flash("An error occurred during registration. Please try again.", "danger")
+    return render_template("register.html")
+
+
+@bp.route("/question/<int:qid>")
+def question(qid):
+    """Display the quiz question."""
+    if not is_logged_in():
+        return redirect_to_login()
+
+    if has_unpinned_practice():
+        # Its question indices cannot be resolved without the bank version, so start afresh.
+        end_practice()
+        return redirect(url_for("main.home"))
+
+    # Retrieve the quiz indices from the session
+    quiz_indices = session.get("quiz_indices", [])
+    if not (0 <= qid < len(quiz_indices)):
+        # Redirect to the finish page if the question ID is invalid
+        return redirect(url_for("main.finish"))
+
+    question_index = quiz_indices[qid]
+    bank = session_bank()
+    current_question = bank[question_index]
+
+    # Log debugging information
+    current_app.logger.debug(f"Rendering question {qid}: {current_question}")
+    mark_question_shown(session.get("practice_id"), qid)
+
+    # Render the quiz question
+    return render_template(
+        "quiz.html",
+        quiz=current_question,
+        options=displayed_options(current_question, session.get("option_seed"), bank.ids[question_index]),
+        qid=qid,  # Ensure qid is passed to the template
+        total=len(quiz_indices),
+        correct=session.get("correct_answers", 0),
+        question_number=qid + 1,
+        question_id=bank.ids[question_index],
+    )
+
+@bp.route("/submit/<int:qid>", methods=["POST"])
+def submit(qid):
+    """Handle the answer submission."""
+    if not is_logged_in():
+        return redirect_to_login()
+
+    if has_unpinned_practice():
+        # Its question indices cannot be resolved without the bank version, so start afresh.
+        end_practice()
+        return redirect(url_for("main.home"))
+
+    # Retrieve the quiz indices from the session
+    quiz_indices = session.get("quiz_indices", [])
+    if not (0 <= qid < len(quiz_indices)):
+        # Redirect to the finish page if the question ID is invalid
+        return redirect(url_for("main.finish"))
+
+    question_index = quiz_indices[qid]
+    bank = session_bank()
+    current_question = bank[question_index]
+
+    seed = session.get("option_seed")
+    answered = session.get("answered_positions") or new_bitmap(len(quiz_indices))
+    if has_bit(answered, qid):
+        # A double click or the back button: show the first result again without re-grading.
+        return render_recorded_result(bank, question_index, seed, qid, len(quiz_indices))
+
+    # Retrieve the user's answer, shown to them under a shuffled letter
+    user_answer = to_canonical(current_question, seed, bank.ids[question_index], request.form.get("answer") or "")
+    if not user_answer:
+        flash("No answer selected. Please try again.", "warning")
+        return redirect(url_for("main.question", qid=qid))
+
+    is_correct = user_answer == current_question["answer"]
+    # The stored attempt decides which of several concurrent submissions counts, so it comes first.
+    if "practice_id" in session and not record_attempt(
+        session["practice_id"], session["user"], question_index, bank.ids[question_index], user_answer, is_correct,
+    ):
+        return render_recorded_result(bank, question_index, seed, qid, len(quiz_indices))
+
+    elapsed = time_on_question(session.get("practice_id"), qid)
+    if elapsed is not None:
+        record_response_time(bank.key, bank.ids[question_index], elapsed)
+    update_mastery(session["user"], bank.areas[question_index], is_correct, g.tenant)
+
+    # Update session data
+    session["answered_positions"] = set_bit(answered, qid)
+    session["answered_questions"] += 1
+    if is_correct:
+        session["correct_answers"] += 1
+    publish_progress(
+        session.get("cohort"), MODE_PRACTICE, qid + 1, len(quiz_indices),
+        session["answered_questions"], session["correct_answers"],
+    )
+
+    return render_result(
+        current_question, seed, bank.ids[question_index], user_answer,
+        qid, len(quiz_indices), session["correct_answers"],
+    )
+
+
+@bp.route("/logout")
+def logout():
+    """Handle user logout."""
+    user = session.pop("user", None)
+    session.pop("tenant", None)
+    current_app.logger.info(f"User logged out: {user}")
+    flash("You have been logged out successfully.", "success")
+    return redirect(url_for("main.login"))
+
+
+@bp.route("/finish")
+def finish():
+    """Display the quiz completion summary."""
+    if not is_logged_in():
+        return redirect_to_login()
+    # Weak areas are judged on the bank this session practised, which end_practice() forgets.
+    bank = session_bank() if "bank" in session else get_bank(requested_bank_key())
+    answered_questions, correct_answers = end_practice()
+    score_percentage = (
+        round((correct_answers / answered_questions) * 100, 0)
+        if answered_questions
+        else 0
+    )
+    current_app.logger.info(
+        f"Quiz finished. Score: {score_percentage}% ({correct_answers}/{answered_questions})"
+    )
+    return render_template(
+        "finish.html",
+        answered=answered_questions,
+        correct=correct_answers,
+        percentage=score_percentage,
+        weak_areas=[AREAS[area] for area in weak_areas(bank, get_mastery(session["user"], g.tenant))],
+    )
+
+
+@bp.route("/exam")
+def exam():
+    """Resume the user's running timed exam, or start a new one.
+
+    Instructors can share `/exam?cohort=<name>` so the exam also counts
+    towards that cohort's leaderboard; `?bank=<level>/<locale>` picks the
+    question bank.
+    """
+    if not is_logged_in():
+        return redirect_to_login()
+    current_exam = get_active_exam(session["user"], g.tenant)
+    if current_exam is None:
+        current_exam = start_exam(
+            session["user"], get_bank(requested_bank_key()), request.args.get("cohort") or None, g.tenant
+        )
+        current_app.logger.info(f"Timed exam {current_exam.id} started for {session['user']}.")
+    return redirect(url_for("main.exam_question", qid=next_unanswered(current_exam)))
+
+
+@bp.route("/exam/question/<int:qid>")
+def exam_question(qid):
+    """Display a question of the running timed exam."""
+    if not is_logged_in():
+        return redirect_to_login()
+
+    current_exam = get_active_exam(session["user"], g.tenant)
+    if current_exam is None or not (0 <= qid < current_exam.question_count):
+        return redirect(url_for("main.exam_finish"))
+
+    question_index = current_exam.quiz_indices[qid]
+    bank = get_bank(current_exam.bank, current_exam.bank_version)
+    current_question = bank[question_index]
+    mark_question_shown(current_exam.id, qid)
+    return render_template(
+        "quiz.html",
+        quiz=current_question,
+        options=displayed_options(current_question, current_exam.option_seed, bank.ids[question_index]),
+        qid=qid,
+        total=current_exam.question_count,
+        question_number=qid + 1,
+        question_id=bank.ids[question_index],
+        seconds_remaining=seconds_remaining(current_exam),
+        submit_endpoint="main.exam_submit",
+        finish_endpoint="main.exam_finish",
+    )
+
+
+@bp.route("/exam/submit/<int:qid>", methods=["POST"])
+def exam_submit(qid):
+    """Record an answer for the running timed exam."""
+    if not is_logged_in():
+        return redirect_to_login()
+
+    current_exam = get_active_exam(session["user"], g.tenant)
+    if current_exam is None or not (0 <= qid < current_exam.question_count):
+        flash("Your exam time is over.", "warning")
+        return redirect(url_for("main.exam_finish"))
+
+    question_index = current_exam.quiz_indices[qid]
+    bank = get_bank(current_exam.bank, current_exam.bank_version)
+    current_question = bank[question_index]
+
+    seed = current_exam.option_seed
+    user_answer = to_canonical(current_question, seed, bank.ids[question_index], request.form.get("answer") or "")
+    if not user_answer:
+        flash("No answer selected. Please try again.", "warning")
+        return redirect(url_for("main.exam_question", qid=qid))
+
+    is_correct = user_answer == current_question["answer"]
+    if not record_answer(current_exam, qid, bank.ids[question_index], user_answer, is_correct):
+        # Already answered, e.g. from another device: move on instead of re-grading.
+        return redirect(url_for("main.exam_question", qid=next_unanswered(current_exam)))
+    elapsed = time_on_question(current_exam.id, qid)
+    if elapsed is not None:
+        record_response_time(current_exam.bank, bank.ids[question_index], elapsed)
+    update_mastery(session["user"], bank.areas[question_index], is_correct, g.tenant)
+    publish_progress(
+        current_exam.cohort, MODE_EXAM, qid + 1, current_exam.question_count,
+        current_exam.answered_questions, current_exam.correct_answers,
+    )
+
+    return render_result(
+        current_question, seed, bank.ids[question_index], user_answer,
+        qid, current_exam.question_count, current_exam.correct_answers,
+        question_endpoint="main.exam_question",
+        finish_endpoint="main.exam_finish",
+    )
+
+
+@bp.route("/exam/finish")
+def exam_finish():
+    """End the running timed exam and display its summary."""
+    if not is_logged_in():
+        return redirect_to_login()
+
+    current_exam = get_latest_exam(session["user"], g.tenant)
+    if current_exam is None:
+        return redirect(url_for("main.exam"))
+    if is_expired(current_exam):
+        finalize_exam(current_exam, STATUS_EXPIRED)
+    else:
+        finalize_exam(current_exam)
+
+    total = current_exam.question_count
+    score_percentage = exam_score(current_exam.correct_answers, total)
+    current_app.logger.info(
+        f"Timed exam {current_exam.id} {current_exam.status}. Score: {score_percentage}% "
+        f"({current_exam.correct_answers}/{total})"
+    )
+    return render_template(
+        "finish.html",
+        answered=current_exam.answered_questions,
+        correct=current_exam.correct_answers,
+        percentage=score_percentage,
+    )
+
+
+@bp.route("/leaderboard")
+def leaderboard():
+    """Display the top exam scores for a period, globally or for a cohort."""
+    if not is_logged_in():
+        return redirect_to_login()
+    period = request.args.get("period", "weekly")
+    if period not in PERIODS:
+        period = "weekly"
+    cohort = request.args.get("cohort") or None
+    entries = get_leaderboard(board_name(cohort, g.tenant), period, datetime.utcnow())
+    return render_template(
+        "leaderboard.html",
+        entries=entries,
+        period=period,
+        periods=PERIODS,
+        cohort=cohort,
+    )
+
+
+@bp.route("/proctor/<cohort>")
+def proctor(cohort):
+    """Display a cohort's learners live: question position and running score."""
+    if not is_logged_in():
+        return redirect_to_login()
+    if not is_instructor():
+        abort(403)
+    return render_template("proctor.html", cohort=cohort)
+
+
+@bp.route("/proctor/<cohort>/events")
+def proctor_events(cohort):
+    """Stream a cohort's progress as Server-Sent Events.
+
+    The first event is a snapshot of every learner; each later one carries
+    the learners who moved since the previous event, at most one event per
+    PROCTOR_FLUSH_INTERVAL however many learners answer. Streams end after
+    PROCTOR_STREAM_SECONDS and the browser reconnects.
+    """
+    if not is_logged_in():
+        return jsonify(error="Not logged in."), 401
+    if not is_instructor():
+        abort(403)
+    topic = cohort_topic(cohort)
+    subscription, live = bus.subscribe(topic)
+    learners = {
+        row.user_email: progress_message(
+            row.user_email, MODE_EXAM, row.answered_questions, row.question_count,
+            row.answered_questions, row.correct_answers, row.started_at,
+        )
+        for row in cohort_exam_progress(cohort, g.tenant)
+    }
+    learners.update((message["user"], message) for message in live)
+    current_app.logger.info(f"Proctor stream for {topic} opened by {session['user']}.")
+
+    def stream():
+        try:
+            yield "retry: 2000\n" + sse("snapshot", list(learners.values()))
+            closes_at = time.monotonic() + Config.PROCTOR_STREAM_SECONDS
+            while time.monotonic() < closes_at:
+                messages, lagged = subscription.drain(min(Config.PROCTOR_HEARTBEAT, closes_at - time.monotonic()))
+                if lagged:
+                    yield sse("snapshot", bus.snapshot(topic))
+                elif messages:
+                    yield sse("update", messages)
+                else:
+                    yield ": keep-alive\n\n"
+                # Updates arriving meanwhile are coalesced into the next event.
+                time.sleep(Config.PROCTOR_FLUSH_INTERVAL)
+        finally:
+            bus.unsubscribe(subscription)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/history")
+def history():
+    """Display the user's finished practice sessions and exams, newest first."""
+    if not is_logged_in():
+        return redirect_to_login()
+    rows, next_cursor = get_history_page(session["user"], request.args.get("before"), organization=g.tenant)
+    return render_template("history.html", sessions=rows, next_cursor=next_cursor)
+
+
+@bp.route("/api/history")
+def api_history():
+    """Return a page of the user's finished sessions as JSON."""
+    if not is_logged_in():
+        return jsonify(error="Not logged in."), 401
+    limit = request.args.get("limit", HISTORY_PAGE_SIZE, type=int)
+    rows, next_cursor = get_history_page(session["user"], request.args.get("before"), limit, g.tenant)
+    return jsonify(
+        sessions=[
+            {
+                "id": row.id,
+                "mode": row.mode,
+                "status": row.status,
+                "finished_at": row.finished_at.isoformat(),
+                "question_count": row.question_count,
+                "answered_questions": row.answered_questions,
+                "correct_answers": row.correct_answers,
+            }
+            for row in rows
+        ],
+        next=next_cursor,
+    )
+
+
+@bp.route("/api/history/<int:exam_id>")
+def api_history_attempts(exam_id):
+    """Return the graded answers of one of the user's sessions as JSON."""
+    if not is_logged_in():
+        return jsonify(error="Not logged in."), 401
+    attempts = get_session_attempts(session["user"], exam_id, g.tenant)
+    return jsonify(
+        attempts=[
+            {
+                "question_id": attempt.question_id,
+                "answer": attempt.answer,
+                "correct": attempt.correct,
+                "answered_at": attempt.answered_at.isoformat(),
+            }
+            for attempt in attempts
+        ]
+    )
+
+
+@bp.route("/admin/export/<dataset>.csv")
+def admin_export(dataset):
+    """Stream an export dataset as CSV without buffering it in the worker.
+
+    Datasets reading more than EXPORT_STREAM_MAX_ROWS rows would hold a
+    serving thread for minutes, so they are queued as an export task
+    instead, and the response points to its status and download URLs.
+    """
+    if not is_logged_in():
+        return redirect_to_login()
+    if not is_admin():
+        abort(403)
+    if dataset not in DATASETS:
+        abort(404)
+    if reads_more_rows_than(dataset, Config.EXPORT_STREAM_MAX_ROWS):
+        task_id = task_queue.enqueue("export", {"dataset": dataset})
+        current_app.logger.info(
+            f"Export of {dataset} (over {Config.EXPORT_STREAM_MAX_ROWS} rows) queued as task {task_id} by {session['user']}."
+        )
+        return jsonify(
+            id=task_id,
+            status_url=url_for("main.admin_task", task_id=task_id),
+            download_url=url_for("main.admin_task_download", task_id=task_id),
+        ), 202
+    current_app.logger.info(f"Export of {dataset} started by {session['user']}.")
+    return Response(
+        stream_with_context(iter_csv(DATASETS[dataset], iter_rows(dataset))),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={dataset}.csv"},
+    )
+
+
+def admin_api_error():
+    """Return an error response unless an admin is logged in."""
+    if not is_logged_in():
+        return jsonify(error="Not logged in."), 401
+    if not is_admin():
+        return jsonify(error="Admins only."), 403
+    return None
+
+
+@bp.route("/admin/tasks/<name>", methods=["POST"])
+def admin_enqueue_task(name):
+    """Queue a deferred task with the JSON body or form fields as its arguments.
+
+    Form fields are strings; they are converted to the type of each
+    parameter's default, so `all_versions=false` arrives as False.
+    """
+    error = admin_api_error()
+    if error:
+        return error
+    if name not in task_queue.types:
+        return jsonify(error=f"Unknown task type: {name}", types=sorted(task_queue.types)), 404
+    payload = request.get_json(silent=True) or request.form.to_dict()
+    try:
+        task_id = task_queue.enqueue(name, payload)
+    except TypeError as e:
+        return jsonify(error=str(e)), 400
+    current_app.logger.info(f"Task {task_id} ({name}) queued by {session['user']}.")
+    return jsonify(id=task_id, status_url=url_for("main.admin_task", task_id=task_id)), 202
+
+
+@bp.route("/admin/tasks/<int:task_id>")
+def admin_task(task_id):
+    """Return a queued task's status, attempts, result and last error."""
+    error = admin_api_error()
+    if error:
+        return error
+    task = task_queue.get(task_id)
+    if task is None:
+        return jsonify(error="No such task."), 404
+    return jsonify(task)
+
+
+@bp.route("/admin/tasks/<int:task_id>/download")
+def admin_task_download(task_id):
+    """Download the file written by a finished export or report task."""
+    error = admin_api_error()
+    if error:
+        return error
+    task = task_queue.get(task_id)
+    if task is None or task["status"] != TASK_SUCCEEDED or not task["result"]:
+        abort(404)
+    return send_from_directory(Config.QUEUE_OUTPUT_DIR, task["result"], as_attachment=True)
+
+
+@bp.route("/admin/questions/<question_id>")
+def admin_question(question_id):
+    """Return a question of the current bank version by its stable ID, with its position and IRT parameters."""
+    error = admin_api_error()
+    if error:
+        return error
+    bank = get_bank(requested_bank_key())
+    try:
+        question = bank.by_id(question_id)
+    except KeyError:
+        return jsonify(error=f"Bank {bank.key} ({bank.version}) has no question {question_id}."), 404
+    position = bank.positions[question_id]
+    saved = item_parameters(bank)
+    parameters = saved["items"][position] if saved else None
+    if parameters:
+        # The chance that a candidate of average ability (theta 0) answers correctly.
+        parameters = {
+            **parameters, "model": saved["model"], "p_average": round(probability_correct(parameters, 0.0), 4),
+        }
+    return jsonify(
+        {
+            **question, "id": question_id, "bank": bank.key, "version": bank.version, "position": position,
+            "irt": parameters,
+        }
+    )
+
+
+@bp.route("/admin/queue")
+def admin_queue():
+    """Return the queue depth per task type and status."""
+    error = admin_api_error()
+    if error:
+        return error
+    return jsonify(task_queue.depth())
+
+
+@bp.cli.command("export")
+@click.argument("dataset", type=click.Choice(sorted(DATASETS)))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["csv", "parquet"]), default="csv")
+def export_command(dataset, output, file_format):
+    """Export attempts or per-question statistics to a CSV or Parquet file."""
+    columns = DATASETS[dataset]
+    if file_format == "parquet":
+        try:
+            written = write_parquet(output, columns, iter_rows(dataset))
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Wrote {written} {dataset} rows to {output}.")
+        return
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        for chunk in iter_csv(columns, iter_rows(dataset)):
+            file.write(chunk)
+    click.echo(f"Wrote {dataset} to {output}.")
+
+
+@bp.cli.command("import-users")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--tenant", type=click.Choice(sorted(TENANTS)), default=Config.DEFAULT_TENANT, show_default=True)
+def import_users_command(source, tenant):
+    """Register the users of an "email,password" CSV file, skipping existing ones."""
+    accounts = {}
+    for row in csv.reader(source):
+        if len(row) >= 2 and "@" in row[0]:
+            accounts.setdefault(row[0].strip(), row[1])
+    existing = get_users_by_email(list(accounts), tenant)
+    new_accounts = [(email, password) for email, password in accounts.items() if email not in existing]
+    if new_accounts:
+        try:
+            create_users(new_accounts, tenant)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"Registered {len(new_accounts)} users in {tenant}; {len(existing)} already existed.")
+
+
+def get_tenant_bank(bank_key, tenant):
+    """Load a bank for a CLI command, failing cleanly if the tenant does not offer it."""
+    try:
+        return get_bank(bank_key, tenant=tenant)
+    except KeyError:
+        raise click.ClickException(f"Tenant {tenant} has no question bank {bank_key}.")
+
+
+@bp.cli.command("distractors")
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--bank", "bank_key", default=None, help="Bank to analyse; the default bank if omitted.")
+@click.option("--tenant", type=click.Choice(sorted(TENANTS)), default=Config.DEFAULT_TENANT, show_default=True)
+@click.option("--format", "file_format", type=click.Choice(["csv", "html"]), default="csv")
+def distractors_command(output, bank_key, tenant, file_format):
+    """Report how often each option is chosen and how well it discriminates."""
+    bank = get_tenant_bank(bank_key, tenant)
+    try:
+        responses = load_responses(bank)
+        analysis = distractor_analysis(responses, answer_keys(bank))
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    rows = iter_distractor_rows(bank, analysis)
+    if file_format == "csv":
+        written = write_distractor_csv(output, rows)
+        click.echo(f"Wrote {written} option rows for {len(responses)} answers to {output}.")
+        return
+
+    question_count = write_distractor_html(output, bank, rows, responses)
+    click.echo(f"Wrote the report on {question_count} questions to {output}.")
+
+
+@bp.cli.command("calibrate")
+@click.option("--bank", "bank_key", default=None, help="Bank to calibrate; the default bank if omitted.")
+@click.option("--tenant", type=click.Choice(sorted(TENANTS)), default=Config.DEFAULT_TENANT, show_default=True)
+@click.option("--model", type=click.Choice(MODELS), default="2pl", show_default=True)
+@click.option("--all-versions", is_flag=True, help="Also use answers given on earlier versions of the bank.")
+def calibrate_command(bank_key, tenant, model, all_versions):
+    """Fit IRT item parameters to every stored answer and save them with the bank version."""
+    bank = get_tenant_bank(bank_key, tenant)
+    try:
+        responses = load_responses(bank, version=None if all_versions else bank.version)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    if not len(responses):
+        raise click.ClickException(f"No answers to calibrate bank {bank.key} ({bank.version}) on.")
+    started = time.perf_counter()
+    result = calibrate(responses, model)
+    path = save_parameters(bank, result)
+    click.echo(
+        f"Calibrated {model} parameters for {bank.key} ({bank.version}) from {len(responses)} answers "
+        f"in {result['iterations']} iterations, {time.perf_counter() - started:.1f}s. Saved to {path}."
+    )
+